@@ -0,0 +1,120 @@
+import os
+import sys
+import time
+import random
+import string
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.compact_tree import CompactTree
+
+# 每个目录包含的文件数和子目录数
+FILES_PER_DIR = 40
+SUBDIRS_PER_DIR = 4
+
+# 文件名主干的候选数量和常见扩展名；主干长度按对数正态分布（中位数约10个字符）
+STEM_POOL_SIZE = 65536
+EXTENSIONS = ['', '.js', '.json', '.png', '.jpg', '.dll', '.txt', '.log', '.tmp', '.dat', '.py', '.html',
+              '.css', '.xml', '.cache']
+NAME_CHARS = string.ascii_lowercase + string.digits + '_-'
+
+def make_name_generator(seed=1):
+    """返回name(序号)函数：主干从预先生成的随机池中选取，加上序号保证每个名称都不重复"""
+    rng = random.Random(seed)
+    stems = [''.join(rng.choices(NAME_CHARS, k=max(1, min(60, int(rng.lognormvariate(2.3, 0.6))))))
+             for _ in range(STEM_POOL_SIZE)]
+    extensions = [rng.choice(EXTENSIONS) for _ in range(STEM_POOL_SIZE)]
+
+    def name(counter):
+        slot = (counter * 40503) % STEM_POOL_SIZE
+        return f"{stems[slot]}_{counter:x}{extensions[slot]}"
+    return name
+
+def build_synthetic_tree(total_entries):
+    """按广度优先构建合成目录树，直到节点数达到total_entries，所有名称都不重复"""
+    name = make_name_generator()
+    tree = CompactTree('C:\\synthetic' if os.name == 'nt' else '/synthetic')
+    queue = [0]
+    position = 0
+    while len(tree) < total_entries:
+        directory = queue[position]
+        position += 1
+        for i in range(FILES_PER_DIR):
+            if len(tree) >= total_entries:
+                break
+            tree.add_node(directory, name(len(tree)), size=4096 + i, allocated=8192, mtime=1.7e9)
+        for i in range(SUBDIRS_PER_DIR):
+            if len(tree) >= total_entries:
+                break
+            queue.append(tree.add_node(directory, f"dir_{len(tree)}", is_dir=True))
+    tree.rollup(dirs_only=False)
+    # 构建期间name_cache为每个不同的名称保留一项，compact()之后才释放，峰值内存出现在这里
+    tree.compact()
+    return tree
+
+def build_dict_tree(total_entries):
+    """以原先的字典嵌套结构构建同样的树，用于对比"""
+    make = make_name_generator()
+    root = {'path': '/synthetic', 'size': 0, 'is_dir': True, 'children': {}}
+    queue = [root]
+    position = 0
+    count = 1
+    while count < total_entries:
+        directory = queue[position]
+        position += 1
+        for i in range(FILES_PER_DIR):
+            if count >= total_entries:
+                break
+            name = make(count)
+            directory['children'][name] = {
+                'path': os.path.join(directory['path'], name),
+                'size': 4096 + i,
+                'is_dir': False
+            }
+            count += 1
+        for i in range(SUBDIRS_PER_DIR):
+            if count >= total_entries:
+                break
+            name = f"dir_{count}"
+            child = {'path': os.path.join(directory['path'], name), 'size': 0, 'is_dir': True, 'children': {}}
+            directory['children'][name] = child
+            queue.append(child)
+            count += 1
+    return root
+
+def measure(builder, total_entries):
+    """返回 (结果, 构建完成后的常驻内存字节数, 构建期间的峰值内存字节数, 耗时)"""
+    tracemalloc.start()
+    start = time.time()
+    result = builder(total_entries)
+    elapsed = time.time() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak, elapsed
+
+def main():
+    total_entries = int(sys.argv[1]) if len(sys.argv) > 1 else 5000000
+    # 字典结构内存占用很大，只用较小的样本估算每节点开销
+    dict_entries = min(total_entries, 200000)
+
+    tree, tree_bytes, tree_peak, tree_time = measure(build_synthetic_tree, total_entries)
+    print(f"紧凑目录树: {len(tree)} 个节点（名称均不重复）")
+    print(f"  内存: {tree_bytes / 1024 / 1024:.1f} MB, 每节点 {tree_bytes / len(tree):.1f} 字节")
+    print(f"  构建期间峰值: {tree_peak / 1024 / 1024:.1f} MB, 每节点 {tree_peak / len(tree):.1f} 字节")
+    print(f"  列数组+名称缓冲区: 每节点 {tree.memory_usage() / len(tree):.1f} 字节")
+    print(f"  构建耗时: {tree_time:.1f} 秒")
+
+    start = time.time()
+    top = tree.sorted_children(0, limit=10)
+    large = tree.filter(min_size=1024 * 1024, dirs_only=True)
+    print(f"  根目录排序+全树过滤: {(time.time() - start) * 1000:.1f} 毫秒 ({len(top)} / {len(large)} 个结果)")
+    del tree
+
+    _, dict_bytes, _, dict_time = measure(build_dict_tree, dict_entries)
+    print(f"字典嵌套目录树: {dict_entries} 个节点（样本）")
+    print(f"  内存: 每节点 {dict_bytes / dict_entries:.1f} 字节，"
+          f"按 {total_entries} 个节点估算 {dict_bytes / dict_entries * total_entries / 1024 / 1024:.1f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ import customtkinter as ctk
 from PIL import Image, ImageTk
 import threading
 import time
+import multiprocessing
 
 # 导入MVC组件
 from mvc.views.main_window import MainWindow
@@ -24,4 +25,6 @@ def main():
     app.mainloop()
 
 if __name__ == "__main__":
+    # 打包后的程序使用进程池时需要
+    multiprocessing.freeze_support()
     main() 
\ No newline at end of file
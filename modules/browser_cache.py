@@ -1,9 +1,24 @@
 import os
-import shutil
 import logging
-import subprocess
+import heapq
 from pathlib import Path
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from modules.file_walker import FileWalker
+from modules.clean_manifest import CleanManifest, BUDGET_ORDER_ATIME
+from modules.clean_policy import CleanPolicy
+from modules.io_throttle import DEFAULT_MAX_UTILIZATION
+from modules.browser_profiles import ProfileDiscoverer
+from modules.cache_index import CacheIndexReader
+from modules.origin_usage import OriginUsageScanner, ORIGIN_KINDS, FIREFOX_STORAGE_KINDS, KIND_CACHE
+from modules.sqlite_maintenance import SQLiteMaintainer
+from modules.browser_processes import BrowserProcessManager
+
+# 同时扫描的缓存目录数 - 每个目录的遍历本身也是并行的
+PROFILE_SCAN_WORKERS = 4
+# 站点占用排行默认返回的站点数
+ORIGIN_TOP = 20
+# 数据库主文件及其日志文件的后缀，按记录维护的数据库连同日志一起保留
+DATABASE_SIDECARS = ('', '-journal', '-wal')
 
 class BrowserCacheCleaner:
     def __init__(self):
@@ -15,27 +30,11 @@ class BrowserCacheCleaner:
         # 获取用户主目录
         self.user_home = str(Path.home())
         
-        # 定义各浏览器缓存路径
-        self.browser_paths = {
-            'chrome': {
-                'cache': os.path.join(self.user_home, 'AppData', 'Local', 'Google', 'Chrome', 'User Data', 'Default', 'Cache'),
-                'cookies': os.path.join(self.user_home, 'AppData', 'Local', 'Google', 'Chrome', 'User Data', 'Default', 'Cookies'),
-                'history': os.path.join(self.user_home, 'AppData', 'Local', 'Google', 'Chrome', 'User Data', 'Default', 'History')
-            },
-            'edge': {
-                'cache': os.path.join(self.user_home, 'AppData', 'Local', 'Microsoft', 'Edge', 'User Data', 'Default', 'Cache'),
-                'cookies': os.path.join(self.user_home, 'AppData', 'Local', 'Microsoft', 'Edge', 'User Data', 'Default', 'Cookies'),
-                'history': os.path.join(self.user_home, 'AppData', 'Local', 'Microsoft', 'Edge', 'User Data', 'Default', 'History')
-            },
-            'firefox': {
-                'cache': os.path.join(self.user_home, 'AppData', 'Local', 'Mozilla', 'Firefox', 'Profiles'),
-                'cookies': os.path.join(self.user_home, 'AppData', 'Roaming', 'Mozilla', 'Firefox', 'Profiles')
-            },
-            'opera': {
-                'cache': os.path.join(self.user_home, 'AppData', 'Local', 'Opera Software', 'Opera Stable', 'Cache'),
-                'cookies': os.path.join(self.user_home, 'AppData', 'Roaming', 'Opera Software', 'Opera Stable', 'Cookies')
-            }
-        }
+        # 从各浏览器的Local State/profiles.ini发现所有配置文件，结果缓存在索引中
+        self.profile_discoverer = ProfileDiscoverer(user_home=self.user_home)
+        
+        # 各浏览器所有配置文件的缓存路径：{浏览器: {'配置文件目录/类型': 路径}}
+        self.browser_paths = self.profile_discoverer.get_browser_paths()
         
         # 安全路径列表 - 这些路径不会被清理
         self.safe_paths = []
@@ -46,6 +45,9 @@ class BrowserCacheCleaner:
         # 最大文件年龄（天）- 超过这个时间的缓存文件才会被清理
         self.max_file_age_days = 7
         
+        # 保留预算 - 设置后按最近使用时间从旧到新淘汰缓存文件直到达到目标，常用的缓存得以保留
+        self.retention_budget = None
+        
         # 重要的浏览器文件 - 这些文件不会被清理
         self.important_browser_files = [
             'Bookmarks', 'Bookmarks.bak', 'Favicons', 'Login Data',
@@ -53,6 +55,34 @@ class BrowserCacheCleaner:
             'logins.json', 'cert9.db', 'permissions.sqlite'
         ]
         
+        # 共享的并行目录遍历器
+        self.walker = FileWalker()
+        
+        # 缓存索引读取器 - 统计缓存大小时优先读取索引文件，无法识别时再遍历
+        self.cache_index = CacheIndexReader()
+        
+        # 按站点统计缓存和站点存储的扫描器
+        self.origin_scanner = OriginUsageScanner(self.walker)
+        
+        # 数据库维护 - 设置保留天数后，历史记录和Cookies数据库不再整个删除，
+        # 而是删除超过保留天数的记录并压缩数据库
+        self.database_maintainer = SQLiteMaintainer()
+        self.database_retention_days = None
+        # 浏览器关闭时用副本替换数据库回收的空间，计入下一次数据库维护的结果
+        self.installed_reclaimed = {}
+        
+        # 按可执行文件路径识别浏览器进程，清理前请求浏览器正常退出
+        self.process_manager = BrowserProcessManager()
+        
+    def refresh_profiles(self):
+        """重新读取所有浏览器的配置文件列表，返回 {浏览器: 配置文件数}"""
+        self.browser_paths = self.profile_discoverer.get_browser_paths(refresh=True)
+        return {browser: len(self.profile_discoverer.get_profiles(browser)) for browser in self.browser_paths}
+        
+    def get_browser_profiles(self, browser):
+        """获取浏览器的配置文件列表"""
+        return self.profile_discoverer.get_profiles(browser)
+        
     def set_safe_paths(self, paths):
         """设置安全路径列表"""
         self.safe_paths = paths
@@ -66,45 +96,39 @@ class BrowserCacheCleaner:
         if days > 0:
             self.max_file_age_days = days
             
-    def is_path_safe(self, path):
-        """检查路径是否安全（不应被清理）"""
-        # 检查路径是否在安全路径列表中
-        for safe_path in self.safe_paths:
-            if path.startswith(safe_path):
-                return True
-                
-        return False
-        
-    def is_file_excluded(self, file_path):
-        """检查文件是否应被排除（不应被清理）"""
-        # 检查文件扩展名
-        _, ext = os.path.splitext(file_path.lower())
-        if ext in self.excluded_extensions:
-            return True
-            
-        # 检查是否是重要的浏览器文件
-        file_name = os.path.basename(file_path)
-        if file_name in self.important_browser_files:
-            return True
+    def set_retention_budget(self, free_bytes=None, max_bytes=None, order=BUDGET_ORDER_ATIME):
+        """设置保留预算，free_bytes为要释放的字节数，max_bytes为清理后浏览器缓存占用的上限
+
+        两者都为None时关闭预算模式。order为淘汰顺序（BUDGET_ORDER_ATIME或BUDGET_ORDER_MTIME）。
+        """
+        if free_bytes is None and max_bytes is None:
+            self.retention_budget = None
+        else:
+            self.retention_budget = {
+                'free_bytes': free_bytes,
+                'max_bytes': max_bytes,
+                'order': order
+            }
             
-        return False
+    def set_database_maintenance(self, days=None):
+        """设置数据库维护的保留天数，为None时恢复为整个删除历史记录和Cookies文件"""
+        self.database_retention_days = days
         
-    def is_file_too_new(self, file_path):
-        """检查文件是否太新（不应被清理）"""
-        try:
-            # 获取文件修改时间
-            mtime = os.path.getmtime(file_path)
-            file_datetime = datetime.fromtimestamp(mtime)
-            
-            # 计算文件年龄
-            age_days = (datetime.now() - file_datetime).days
-            
-            # 如果文件年龄小于最大年龄，则不应清理
-            return age_days < self.max_file_age_days
-        except (OSError, ValueError) as e:
-            self.logger.warning(f"无法获取文件 {file_path} 的修改时间: {e}")
-            # 如果无法确定，则认为文件太新（不清理）
-            return True
+    def set_background_mode(self, enabled, max_utilization=DEFAULT_MAX_UTILIZATION):
+        """开启或关闭后台模式，扫描和清理浏览器缓存时降低优先级并限制磁盘利用率"""
+        self.walker.set_background(enabled, max_utilization)
+        
+    def get_cache_path_size(self, path):
+        """获取单个缓存路径的大小
+
+        Chromium和Firefox的缓存目录从索引文件中读取条目数和总字节数，只需读取一个文件；
+        格式无法识别、索引损坏或已过期时回退到遍历目录。
+        """
+        if os.path.isdir(path):
+            index = self.cache_index.read(path)
+            if index is not None:
+                return index['size']
+        return self.walker.get_size(path)
         
     def get_browser_cache_size(self, browser):
         """获取指定浏览器缓存大小"""
@@ -112,26 +136,10 @@ class BrowserCacheCleaner:
             if browser not in self.browser_paths:
                 return 0
                 
-            browser_info = self.browser_paths[browser]
-            total_size = 0
-            
-            for cache_type, path in browser_info.items():
-                if os.path.exists(path):
-                    if os.path.isdir(path):
-                        # 如果是目录，计算目录大小
-                        for dirpath, dirnames, filenames in os.walk(path):
-                            for f in filenames:
-                                try:
-                                    fp = os.path.join(dirpath, f)
-                                    if os.path.exists(fp):
-                                        total_size += os.path.getsize(fp)
-                                except (PermissionError, FileNotFoundError) as e:
-                                    self.logger.warning(f"无法访问文件 {fp}: {e}")
-                    else:
-                        # 如果是文件，直接获取文件大小
-                        total_size += os.path.getsize(path)
-                        
-            return total_size
+            # 各配置文件的路径同时统计，能读取索引的缓存目录不再遍历
+            paths = [path for path in self.browser_paths[browser].values() if os.path.exists(path)]
+            with ThreadPoolExecutor(max_workers=PROFILE_SCAN_WORKERS) as executor:
+                return sum(executor.map(self.get_cache_path_size, paths))
         except Exception as e:
             self.logger.error(f"获取浏览器缓存大小时出错: {e}")
             return 0
@@ -153,245 +161,355 @@ class BrowserCacheCleaner:
         results['total'] = total_size
         return results
         
-    def clean_browser_cache(self, browser):
-        """清理指定浏览器的缓存"""
-        try:
-            if browser not in self.browser_paths:
-                return {
-                    'success': False,
-                    'error': f"不支持的浏览器: {browser}"
-                }
-                
-            # 获取清理前的大小
-            size_before = self.get_browser_cache_size(browser)
+    def _scan_profile_origins(self, browser, profile):
+        """统计一个配置文件中每个站点各类数据的字节数，返回 ({站点: {类型: 字节数}}, 无法归属的字节数)"""
+        usage = {}
+        unattributed = 0
+        for item in self.origin_scanner.iter_profile(browser, profile):
+            if item.origin is None:
+                unattributed += item.size
+                continue
+            kinds = usage.setdefault(item.origin, {})
+            kinds[item.kind] = kinds.get(item.kind, 0) + item.size
+        return usage, unattributed
+        
+    def get_origin_usage(self, browsers=None, top=ORIGIN_TOP):
+        """按站点统计缓存、IndexedDB、CacheStorage和Local Storage占用的空间
+
+        每个配置文件的缓存键和存储元数据只流式读取一遍，内存占用与站点数成正比，与缓存条目数无关。
+        返回 {'origins': 按字节数从大到小的前top个站点, 'total', 'unattributed', 'origin_count'}，
+        每个站点为 {'origin', 'size', 'kinds': {类型: 字节数}, 'browsers': {浏览器: 字节数}}。
+        """
+        if browsers is None:
+            browsers = list(self.browser_paths.keys())
             
-            # 关闭浏览器进程
-            self._kill_browser_process(browser)
+        tasks = [(browser, profile) for browser in browsers if browser in self.browser_paths
+                 for profile in self.profile_discoverer.get_profiles(browser)]
+        origins = {}
+        unattributed = 0
+        with ThreadPoolExecutor(max_workers=PROFILE_SCAN_WORKERS) as executor:
+            futures = [executor.submit(self._scan_profile_origins, browser, profile) for browser, profile in tasks]
+            for future, (browser, profile) in zip(futures, tasks):
+                try:
+                    usage, skipped = future.result()
+                except Exception as e:
+                    self.logger.error(f"统计 {browser} 配置文件 {profile['name']} 的站点占用时出错: {e}")
+                    continue
+                unattributed += skipped
+                for origin, kinds in usage.items():
+                    entry = origins.setdefault(origin, {
+                        'origin': origin,
+                        'size': 0,
+                        'kinds': {},
+                        'browsers': {}
+                    })
+                    size = sum(kinds.values())
+                    entry['size'] += size
+                    entry['browsers'][browser] = entry['browsers'].get(browser, 0) + size
+                    for kind, kind_size in kinds.items():
+                        entry['kinds'][kind] = entry['kinds'].get(kind, 0) + kind_size
+                        
+        return {
+            'origins': heapq.nlargest(top, origins.values(), key=lambda entry: entry['size']),
+            'total': sum(entry['size'] for entry in origins.values()),
+            'unattributed': unattributed,
+            'origin_count': len(origins)
+        }
+        
+    def clean_origins(self, origins, browsers=None, kill_process=True, kinds=None, safe_mode=False, policy=None):
+        """只清理指定站点的缓存和站点存储，返回 {浏览器: 结果}
+
+        Simple Cache和Firefox的缓存逐条删除该站点的条目文件，IndexedDB、CacheStorage和Firefox的
+        站点存储删除对应目录；blockfile缓存和Chromium的Local Storage由所有站点共用一个数据库，
+        无法单独删除，计入skipped_size。kinds为要清理的数据类型，默认全部；选中了Firefox站点存储的
+        所有类型时删除整个站点目录，连同.metadata-v2和配额用量缓存，Firefox下次启动时不会残留空站点。
+        safe_mode为True时按policy（与扫描共用的策略）跳过安全路径和受保护的文件，年龄规则不适用。
+        """
+        origins = set(origins)
+        kinds = set(ORIGIN_KINDS if kinds is None else kinds)
+        whole_firefox_origin = set(FIREFOX_STORAGE_KINDS.values()) <= kinds
+        if browsers is None:
+            browsers = list(self.browser_paths.keys())
+        if safe_mode:
+            policy = self.get_policy(policy).derive(max_file_age_days=0)
+        else:
+            policy = None
+            
+        browsers = [browser for browser in browsers if browser in self.browser_paths]
+        # 先一次性关闭所有目标浏览器，避免浏览器退出时改写正在删除的条目
+        if kill_process and browsers:
+            self.close_browsers(browsers)
             
-            # 清理缓存
-            browser_info = self.browser_paths[browser]
-            for cache_type, path in browser_info.items():
-                if os.path.exists(path):
-                    try:
-                        if os.path.isdir(path):
-                            # 如果是Firefox配置文件夹，需要特殊处理
-                            if browser == 'firefox' and cache_type == 'cache':
-                                self._clean_firefox_cache(path)
+        results = {}
+        for browser in browsers:
+            try:
+                manifest = CleanManifest(self.walker, safe_mode)
+                manifest.targets.add(browser)
+                skipped = 0
+                # 整体删除的Firefox站点目录
+                origin_dirs = set()
+                for profile in self.profile_discoverer.get_profiles(browser):
+                    for item in self.origin_scanner.iter_profile(browser, profile):
+                        if item.origin not in origins or item.kind not in kinds:
+                            continue
+                        if not item.paths:
+                            skipped += item.size
+                            continue
+                        if browser == 'firefox' and whole_firefox_origin and item.kind != KIND_CACHE:
+                            # 站点存储项为 <站点目录>/<idb|ls|cache>
+                            origin_dirs.add(os.path.dirname(item.paths[0]))
+                            continue
+                        for path in item.paths:
+                            if os.path.isdir(path):
+                                manifest.add_tree(path, browser, policy, include_root=True)
                             else:
-                                # 清空目录内容但保留目录本身
-                                for item in os.listdir(path):
-                                    item_path = os.path.join(path, item)
-                                    try:
-                                        if os.path.isfile(item_path):
-                                            os.unlink(item_path)
-                                        elif os.path.isdir(item_path):
-                                            shutil.rmtree(item_path, ignore_errors=True)
-                                    except (PermissionError, FileNotFoundError) as e:
-                                        self.logger.warning(f"无法删除 {item_path}: {e}")
-                        else:
-                            # 如果是文件，直接删除
-                            os.unlink(path)
-                    except Exception as e:
-                        self.logger.error(f"清理 {browser} 的 {cache_type} 时出错: {e}")
-                        
-            # 获取清理后的大小
-            size_after = self.get_browser_cache_size(browser)
-            cleaned_size = size_before - size_after
+                                manifest.add_file(path, browser, policy, check_age=False)
+                for path in sorted(origin_dirs):
+                    manifest.add_tree(path, browser, policy, include_root=True)
+                                
+                stats = manifest.execute([browser])[browser]
+                results[browser] = {
+                    'success': True,
+                    'cleaned_size': stats['freed'],
+                    'skipped_size': skipped
+                }
+                if safe_mode:
+                    results[browser]['skipped'] = stats['skipped'] + stats['changed'] + stats['failed']
+            except Exception as e:
+                self.logger.error(f"清理 {browser} 的站点数据时出错: {e}")
+                results[browser] = {
+                    'success': False,
+                    'error': str(e)
+                }
+        return results
+        
+    def get_databases(self, browser):
+        """获取浏览器所有配置文件中存在的SQLite数据库，返回 (路径, 数据库类型) 列表"""
+        databases = []
+        for profile in self.profile_discoverer.get_profiles(browser):
+            for schema, candidates in profile.get('databases', {}).items():
+                for path in candidates:
+                    if os.path.isfile(path):
+                        databases.append((path, schema))
+        return databases
+        
+    def maintain_databases(self, browsers=None, days=None):
+        """删除历史记录和Cookies数据库中超过保留天数的记录并压缩，返回 {浏览器: 结果}
+
+        所有浏览器所有配置文件的数据库在同一个线程池中并行维护。被运行中的浏览器锁定的数据库
+        在副本上维护，删除的行计入pending_rows，浏览器关闭后才生效。
+        """
+        if browsers is None:
+            browsers = list(self.browser_paths.keys())
+        if days is None:
+            days = self.database_retention_days if self.database_retention_days is not None else self.max_file_age_days
             
-            return {
+        databases = []
+        for browser in browsers:
+            if browser in self.browser_paths:
+                databases.extend((path, schema, browser) for path, schema in self.get_databases(browser))
+                
+        results = {
+            browser: {
                 'success': True,
-                'cleaned_size': cleaned_size
-            }
-        except Exception as e:
-            self.logger.error(f"清理浏览器缓存时出错: {e}")
-            return {
-                'success': False,
-                'error': str(e)
+                'reclaimed': self.installed_reclaimed.pop(browser, 0),
+                'deleted_rows': 0,
+                'pending_rows': 0,
+                'databases': 0,
+                'errors': []
             }
+            for browser in browsers if browser in self.browser_paths
+        }
+        outcomes = self.database_maintainer.maintain_all([(path, schema) for path, schema, _ in databases], days)
+        for (path, _, browser), outcome in zip(databases, outcomes):
+            result = results[browser]
+            if outcome['success']:
+                result['reclaimed'] += outcome['reclaimed']
+                result['deleted_rows'] += outcome['deleted_rows']
+                result['pending_rows'] += outcome.get('pending_rows', 0)
+                result['databases'] += 1
+            else:
+                result['errors'].append((path, outcome['error']))
+        for result in results.values():
+            # 有数据库无法维护（如一直被锁定）且没有任何数据库维护成功时视为失败
+            if result['errors'] and not result['databases']:
+                result['success'] = False
+                result['error'] = result['errors'][0][1]
+        return results
+        
+    def _get_maintained_files(self, browser):
+        """数据库维护开启时，按记录维护而不整个删除的文件，包括数据库旁的日志文件"""
+        if self.database_retention_days is None:
+            return set()
+        return {path + suffix for path, _ in self.get_databases(browser) for suffix in DATABASE_SIDECARS}
+        
+    def get_policy(self, base_policy=None):
+        """编译清理策略，重要的浏览器文件始终受保护
+
+        base_policy为其他模块共享的策略时，在其基础上加入受保护的浏览器文件。
+        """
+        if base_policy is None:
+            return CleanPolicy(self.safe_paths, self.excluded_extensions, self.max_file_age_days,
+                               protected_names=self.important_browser_files)
+        return base_policy.derive(
+            protected_names=list(base_policy.protected_names) + self.important_browser_files)
+        
+    def build_manifest(self, browsers=None, safe_mode=False, manifest=None, policy=None):
+        """扫描指定浏览器所有配置文件的缓存，生成删除清单
+
+        各配置文件的缓存目录同时扫描。设置了保留预算时，所有浏览器的缓存作为一个整体按预算淘汰。
+        """
+        if browsers is None:
+            browsers = list(self.browser_paths.keys())
+        if manifest is None:
+            manifest = CleanManifest(self.walker, safe_mode)
             
-    def clean_browser_cache_safely(self, browser):
-        """安全地清理指定浏览器的缓存（跳过重要文件）"""
-        try:
+        policy = self.get_policy(policy) if safe_mode else None
+            
+        trees = []
+        for browser in browsers:
             if browser not in self.browser_paths:
+                continue
+            manifest.targets.add(browser)
+            maintained = self._get_maintained_files(browser)
+            
+            for cache_type, path in self.browser_paths[browser].items():
+                if os.path.isdir(path):
+                    trees.append((path, browser))
+                elif path in maintained:
+                    # 开启数据库维护时只删除过期记录，清理时再处理
+                    continue
+                elif os.path.exists(path):
+                    # 单独的Cookies/History文件不按年龄跳过
+                    manifest.add_file(path, browser, policy, check_age=False)
+                    
+        with ThreadPoolExecutor(max_workers=PROFILE_SCAN_WORKERS) as executor:
+            futures = [executor.submit(manifest.add_tree, path, browser, policy) for path, browser in trees]
+            for future, (path, browser) in zip(futures, trees):
+                try:
+                    future.result()
+                except Exception as e:
+                    self.logger.error(f"扫描 {browser} 的缓存 {path} 时出错: {e}")
+                    
+        if self.retention_budget:
+            manifest.apply_budget([browser for browser in browsers if browser in self.browser_paths],
+                                  **self.retention_budget)
+        return manifest
+        
+    def clean_from_manifest(self, manifest, browser, kill_process=True, progress_callback=None):
+        """按删除清单清理指定浏览器的缓存，不再重新遍历目录
+
+        progress_callback接收0到1之间的进度。
+        """
+        try:
+            if browser not in manifest.targets:
                 return {
                     'success': False,
-                    'error': f"不支持的浏览器: {browser}"
+                    'error': f"删除清单中没有该浏览器: {browser}"
                 }
                 
-            # 获取清理前的大小
-            size_before = self.get_browser_cache_size(browser)
-            
             # 关闭浏览器进程
-            self._kill_browser_process(browser)
-            
-            # 清理缓存
-            browser_info = self.browser_paths[browser]
-            skipped_files = 0
-            
-            for cache_type, path in browser_info.items():
-                if os.path.exists(path):
-                    try:
-                        if os.path.isdir(path):
-                            # 如果是Firefox配置文件夹，需要特殊处理
-                            if browser == 'firefox' and cache_type == 'cache':
-                                cleaned, skipped = self._clean_firefox_cache_safely(path)
-                                skipped_files += skipped
-                            else:
-                                # 安全清理目录
-                                cleaned, skipped = self._clean_directory_safely(path)
-                                skipped_files += skipped
-                        else:
-                            # 如果是文件，检查是否应该跳过
-                            if self.is_file_excluded(path) or self.is_path_safe(path):
-                                self.logger.info(f"跳过重要文件: {path}")
-                                skipped_files += 1
-                            else:
-                                os.unlink(path)
-                    except Exception as e:
-                        self.logger.error(f"安全清理 {browser} 的 {cache_type} 时出错: {e}")
-                        skipped_files += 1
-                        
-            # 获取清理后的大小
-            size_after = self.get_browser_cache_size(browser)
-            cleaned_size = size_before - size_after
+            if kill_process:
+                self._kill_browser_process(browser)
             
-            return {
+            report = None
+            if progress_callback:
+                report = lambda processed, total: progress_callback(processed / total if total else 1.0)
+            stats = manifest.execute([browser], progress_callback=report)[browser]
+            result = {
                 'success': True,
-                'cleaned_size': cleaned_size,
-                'skipped': skipped_files
+                'cleaned_size': stats['freed']
             }
+            if manifest.safe_mode:
+                result['skipped'] = stats['skipped'] + stats['changed'] + stats['failed']
+                
+            # 数据库维护：删除过期记录并压缩，回收的空间计入清理结果
+            if self.database_retention_days is not None:
+                maintenance = self.maintain_databases([browser])[browser]
+                result['cleaned_size'] += maintenance['reclaimed']
+                result['database_rows'] = maintenance['deleted_rows']
+                if maintenance['errors']:
+                    result['database_errors'] = maintenance['errors']
+            return result
         except Exception as e:
-            self.logger.error(f"安全清理浏览器缓存时出错: {e}")
+            self.logger.error(f"清理浏览器缓存时出错: {e}")
             return {
                 'success': False,
                 'error': str(e)
             }
             
-    def _clean_directory_safely(self, directory):
-        """安全地清理指定目录中的文件（跳过重要文件）"""
-        cleaned_count = 0
-        skipped_count = 0
+    def clean_browser_cache(self, browser, kill_process=True):
+        """清理指定浏览器的缓存"""
+        if browser not in self.browser_paths:
+            return {
+                'success': False,
+                'error': f"不支持的浏览器: {browser}"
+            }
+            
+        # 先关闭浏览器，避免扫描后浏览器退出时改写缓存文件
+        if kill_process:
+            self._kill_browser_process(browser)
+        manifest = self.build_manifest([browser])
+        return self.clean_from_manifest(manifest, browser, kill_process=False)
         
-        try:
-            for item in os.listdir(directory):
-                item_path = os.path.join(directory, item)
-                try:
-                    # 检查是否应跳过此文件/目录
-                    if self.is_path_safe(item_path):
-                        self.logger.info(f"跳过安全路径: {item_path}")
-                        skipped_count += 1
-                        continue
-                        
-                    if os.path.isfile(item_path):
-                        # 检查文件是否应被排除
-                        if self.is_file_excluded(item_path):
-                            self.logger.info(f"跳过排除的文件: {item_path}")
-                            skipped_count += 1
-                            continue
-                            
-                        # 检查文件是否太新
-                        if self.is_file_too_new(item_path):
-                            self.logger.info(f"跳过较新的文件: {item_path}")
-                            skipped_count += 1
-                            continue
-                            
-                        # 删除文件
-                        os.unlink(item_path)
-                        cleaned_count += 1
-                    elif os.path.isdir(item_path):
-                        # 递归清理子目录
-                        sub_cleaned, sub_skipped = self._clean_directory_safely(item_path)
-                        cleaned_count += sub_cleaned
-                        skipped_count += sub_skipped
-                        
-                        # 如果目录为空，则删除
-                        if not os.listdir(item_path):
-                            os.rmdir(item_path)
-                except (PermissionError, FileNotFoundError) as e:
-                    self.logger.warning(f"无法访问 {item_path}: {e}")
-                    skipped_count += 1
-        except Exception as e:
-            self.logger.error(f"安全清理目录 {directory} 时出错: {e}")
+    def clean_browser_cache_safely(self, browser, kill_process=True):
+        """安全地清理指定浏览器的缓存（跳过重要文件）"""
+        if browser not in self.browser_paths:
+            return {
+                'success': False,
+                'error': f"不支持的浏览器: {browser}"
+            }
             
-        return cleaned_count, skipped_count
+        # 先关闭浏览器，避免扫描后浏览器退出时改写缓存文件
+        if kill_process:
+            self._kill_browser_process(browser)
+        manifest = self.build_manifest([browser], safe_mode=True)
+        return self.clean_from_manifest(manifest, browser, kill_process=False)
             
-    def _kill_browser_process(self, browser):
-        """关闭浏览器进程"""
-        process_names = {
-            'chrome': 'chrome.exe',
-            'edge': 'msedge.exe',
-            'firefox': 'firefox.exe',
-            'opera': 'opera.exe'
-        }
-        
-        if browser in process_names:
-            try:
-                subprocess.run(['taskkill', '/F', '/IM', process_names[browser]], 
-                              stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            except Exception as e:
-                self.logger.warning(f"关闭 {browser} 进程时出错: {e}")
-                
-    def _clean_firefox_cache(self, profiles_dir):
-        """清理Firefox缓存"""
+    def install_database_copies(self, browser):
+        """浏览器关闭后，用之前在副本上维护好的数据库替换原文件，返回回收的字节数
+
+        仍有该浏览器的进程在运行（如无法结束）时不替换，副本留到下次。
+        """
+        databases = [path for path, _ in self.get_databases(browser) if self.database_maintainer.has_copy(path)]
+        if not databases:
+            return 0
         try:
-            # 遍历所有配置文件
-            for profile in os.listdir(profiles_dir):
-                profile_path = os.path.join(profiles_dir, profile)
-                if os.path.isdir(profile_path):
-                    # 清理缓存文件夹
-                    cache_path = os.path.join(profile_path, 'cache2')
-                    if os.path.exists(cache_path):
-                        shutil.rmtree(cache_path, ignore_errors=True)
-                        
-                    # 清理其他缓存文件
-                    for cache_file in ['cookies.sqlite', 'webappsstore.sqlite', 'chromeappsstore.sqlite']:
-                        file_path = os.path.join(profile_path, cache_file)
-                        if os.path.exists(file_path):
-                            try:
-                                os.unlink(file_path)
-                            except Exception as e:
-                                self.logger.warning(f"无法删除 {file_path}: {e}")
+            if self.process_manager.find_processes([browser])[browser]:
+                self.logger.info(f"{browser} 仍在运行，暂不替换维护好的数据库副本")
+                return 0
         except Exception as e:
-            self.logger.error(f"清理Firefox缓存时出错: {e}")
-            
-    def _clean_firefox_cache_safely(self, profiles_dir):
-        """安全地清理Firefox缓存"""
-        cleaned_count = 0
-        skipped_count = 0
-        
+            self.logger.warning(f"无法确认 {browser} 是否已退出: {e}")
+            return 0
+        reclaimed = sum(self.database_maintainer.install_copy(path) for path in databases)
+        self.installed_reclaimed[browser] = self.installed_reclaimed.get(browser, 0) + reclaimed
+        return reclaimed
+
+    def close_browsers(self, browsers, on_closed=None):
+        """关闭目标浏览器并等待进程退出
+
+        只遍历一次进程列表；on_closed(浏览器)在每个浏览器的进程全部退出后立即调用。
+        浏览器退出后先替换其在运行期间维护好的数据库副本。
+        """
+        def closed(browser):
+            self.install_database_copies(browser)
+            if on_closed is not None:
+                on_closed(browser)
+
         try:
-            # 遍历所有配置文件
-            for profile in os.listdir(profiles_dir):
-                profile_path = os.path.join(profiles_dir, profile)
-                if os.path.isdir(profile_path):
-                    # 清理缓存文件夹
-                    cache_path = os.path.join(profile_path, 'cache2')
-                    if os.path.exists(cache_path):
-                        sub_cleaned, sub_skipped = self._clean_directory_safely(cache_path)
-                        cleaned_count += sub_cleaned
-                        skipped_count += sub_skipped
-                        
-                    # 清理其他缓存文件，但跳过重要文件
-                    for cache_file in ['cookies.sqlite', 'webappsstore.sqlite', 'chromeappsstore.sqlite']:
-                        file_path = os.path.join(profile_path, cache_file)
-                        if os.path.exists(file_path):
-                            # 检查是否应跳过此文件
-                            if self.is_file_excluded(file_path) or self.is_path_safe(file_path):
-                                self.logger.info(f"跳过重要文件: {file_path}")
-                                skipped_count += 1
-                                continue
-                                
-                            try:
-                                os.unlink(file_path)
-                                cleaned_count += 1
-                            except Exception as e:
-                                self.logger.warning(f"无法删除 {file_path}: {e}")
-                                skipped_count += 1
+            return self.process_manager.close_browsers(browsers, closed)
         except Exception as e:
-            self.logger.error(f"安全清理Firefox缓存时出错: {e}")
-            
-        return cleaned_count, skipped_count
+            self.logger.warning(f"关闭浏览器进程时出错: {e}")
+            # 出错时仍然通知调用方，清理照常进行
+            if on_closed is not None:
+                for browser in browsers:
+                    on_closed(browser)
+            return {}
             
+    def _kill_browser_process(self, browser):
+        """关闭浏览器进程"""
+        self.close_browsers([browser])
+                
     def format_size(self, size_bytes):
         """将字节大小格式化为人类可读的格式"""
         for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
@@ -408,7 +526,10 @@ class BrowserCacheCleaner:
             'chrome': 'Google Chrome',
             'edge': 'Microsoft Edge',
             'firefox': 'Mozilla Firefox',
-            'opera': 'Opera'
+            'opera': 'Opera',
+            'brave': 'Brave',
+            'vivaldi': 'Vivaldi',
+            'chromium': 'Chromium'
         }
         
         for browser, size in results.items():
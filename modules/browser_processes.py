@@ -0,0 +1,175 @@
+import os
+import ctypes
+import logging
+import psutil
+
+# 浏览器的可执行文件名（不含扩展名）和用于区分同名可执行文件的安装路径片段：
+# Chromium与Chrome的可执行文件都叫chrome，按路径中的Chromium区分，其余的chrome归为Chrome
+BROWSER_EXECUTABLES = {
+    'chrome': ('chrome', None),
+    'chromium': ('chrome', 'chromium'),
+    'edge': ('msedge', None),
+    'firefox': ('firefox', None),
+    'opera': ('opera', None),
+    'brave': ('brave', None),
+    'vivaldi': ('vivaldi', None)
+}
+
+# 请求关闭后等待浏览器自行退出的秒数，超时后强制结束
+CLOSE_TIMEOUT = 10.0
+# 强制结束后等待进程退出的秒数
+KILL_TIMEOUT = 3.0
+
+WM_CLOSE = 0x0010
+
+def _get_stem(path):
+    """可执行文件名去掉目录和.exe扩展名，转为小写"""
+    name = os.path.basename(path.replace('\\', '/')).lower()
+    return name[:-4] if name.endswith('.exe') else name
+
+class BrowserProcessManager:
+    def __init__(self, close_timeout=CLOSE_TIMEOUT, kill_timeout=KILL_TIMEOUT):
+        # 设置日志
+        logging.basicConfig(level=logging.INFO,
+                           format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        self.logger = logging.getLogger('BrowserProcessManager')
+
+        self.close_timeout = close_timeout
+        self.kill_timeout = kill_timeout
+
+    def match_browser(self, name, exe=None):
+        """根据进程名和可执行文件路径判断所属浏览器，不是浏览器时返回None"""
+        stem = _get_stem(exe or name or '')
+        path = (exe or '').replace('\\', '/').lower()
+        fallback = None
+        for browser, (executable, fragment) in BROWSER_EXECUTABLES.items():
+            if executable != stem:
+                continue
+            if fragment is None:
+                fallback = fallback or browser
+            elif fragment in path:
+                return browser
+        return fallback
+
+    def find_processes(self, browsers=None):
+        """遍历一次进程列表，找出所有目标浏览器的进程，返回 {浏览器: [psutil.Process]}"""
+        if browsers is None:
+            browsers = list(BROWSER_EXECUTABLES)
+        targets = set(browsers)
+        found = {browser: [] for browser in browsers}
+        for process in psutil.process_iter(['pid', 'name', 'exe']):
+            try:
+                browser = self.match_browser(process.info['name'], process.info['exe'])
+            except (psutil.Error, TypeError):
+                continue
+            if browser in targets:
+                found[browser].append(process)
+        return found
+
+    def _post_close_messages(self, pids):
+        """向属于pids的可见顶层窗口发送WM_CLOSE，返回收到请求的进程ID"""
+        user32 = ctypes.WinDLL('user32', use_last_error=True)
+        requested = set()
+        enum_proc = ctypes.WINFUNCTYPE(ctypes.c_bool, ctypes.c_void_p, ctypes.c_void_p)
+
+        def callback(hwnd, _):
+            pid = ctypes.c_ulong()
+            user32.GetWindowThreadProcessId(ctypes.c_void_p(hwnd), ctypes.byref(pid))
+            if pid.value in pids and user32.IsWindowVisible(ctypes.c_void_p(hwnd)):
+                user32.PostMessageW(ctypes.c_void_p(hwnd), WM_CLOSE, 0, 0)
+                requested.add(pid.value)
+            return True
+
+        user32.EnumWindows(enum_proc(callback), 0)
+        return requested
+
+    def _request_close(self, processes):
+        """请求进程正常退出，返回收到请求的进程ID
+
+        Windows上向浏览器窗口发送WM_CLOSE（相当于点击关闭按钮），其他平台发送SIGTERM。
+        """
+        if os.name == 'nt':
+            try:
+                return self._post_close_messages({process.pid for process in processes})
+            except (OSError, AttributeError) as e:
+                self.logger.warning(f"无法向浏览器窗口发送关闭请求: {e}")
+                return set()
+        requested = set()
+        for process in processes:
+            try:
+                process.terminate()
+                requested.add(process.pid)
+            except psutil.Error:
+                pass
+        return requested
+
+    def close_browsers(self, browsers, on_closed=None):
+        """关闭目标浏览器：先请求正常退出，等待超时后强制结束仍在运行的进程
+
+        on_closed(浏览器)在该浏览器的所有进程都退出后立即调用（未运行的浏览器立即调用），
+        调用方可以据此逐个开始清理，不必等待所有浏览器都关闭；无法结束的浏览器在最后同样调用。
+        返回 {浏览器: {'processes': 进程数, 'forced': 被强制结束的进程数, 'closed': 是否全部退出}}。
+        """
+        found = self.find_processes(browsers)
+        results = {}
+        remaining = {}
+        owners = {}
+        forced = {}
+
+        def finish(browser):
+            if browser in results:
+                return
+            results[browser] = {
+                'processes': len(found.get(browser, [])),
+                'forced': forced.get(browser, 0),
+                'closed': not remaining.get(browser)
+            }
+            if on_closed is not None:
+                try:
+                    on_closed(browser)
+                except Exception as e:
+                    self.logger.error(f"处理 {browser} 关闭通知时出错: {e}")
+
+        def on_gone(process):
+            browser = owners[process.pid]
+            remaining[browser].discard(process.pid)
+            if not remaining[browser]:
+                finish(browser)
+
+        processes = []
+        for browser in browsers:
+            if not found.get(browser):
+                finish(browser)
+                continue
+            remaining[browser] = {process.pid for process in found[browser]}
+            for process in found[browser]:
+                owners[process.pid] = browser
+                processes.append(process)
+
+        if processes:
+            requested = self._request_close(processes)
+            # 没有窗口可关闭的浏览器（如在后台运行）不会响应关闭请求，直接强制结束
+            waiting = [process for process in processes
+                       if any(pid in requested for pid in remaining[owners[process.pid]])]
+            alive = [process for process in processes if process not in waiting]
+            if waiting:
+                _, still_alive = psutil.wait_procs(waiting, timeout=self.close_timeout, callback=on_gone)
+                alive.extend(still_alive)
+
+            if alive:
+                for process in alive:
+                    browser = owners[process.pid]
+                    try:
+                        process.kill()
+                        forced[browser] = forced.get(browser, 0) + 1
+                    except psutil.NoSuchProcess:
+                        pass
+                    except psutil.Error as e:
+                        self.logger.warning(f"无法结束 {browser} 的进程 {process.pid}: {e}")
+                _, still_alive = psutil.wait_procs(alive, timeout=self.kill_timeout, callback=on_gone)
+                for process in still_alive:
+                    self.logger.warning(f"{owners[process.pid]} 的进程 {process.pid} 未能结束")
+
+        for browser in browsers:
+            finish(browser)
+        return results
@@ -0,0 +1,309 @@
+import os
+import json
+import logging
+import threading
+import configparser
+from pathlib import Path
+
+# 配置文件索引格式版本，格式变化时递增
+PROFILE_INDEX_VERSION = 5
+
+# Chromium内核浏览器：用户数据目录（Local State所在位置）和缓存根目录，
+# 以 (应用数据目录类型, 相对路径) 表示；缓存根目录为None时与用户数据目录相同
+CHROMIUM_BROWSERS = {
+    'chrome': {
+        'user_data': ('local', os.path.join('Google', 'Chrome', 'User Data'))
+    },
+    'edge': {
+        'user_data': ('local', os.path.join('Microsoft', 'Edge', 'User Data'))
+    },
+    'brave': {
+        'user_data': ('local', os.path.join('BraveSoftware', 'Brave-Browser', 'User Data'))
+    },
+    'vivaldi': {
+        'user_data': ('local', os.path.join('Vivaldi', 'User Data'))
+    },
+    'chromium': {
+        'user_data': ('local', os.path.join('Chromium', 'User Data'))
+    },
+    # Opera的用户数据目录本身就是唯一的配置文件，缓存位于本地应用数据目录下的同名目录
+    'opera': {
+        'user_data': ('roaming', os.path.join('Opera Software', 'Opera Stable')),
+        'cache_root': ('local', os.path.join('Opera Software', 'Opera Stable')),
+        'single_profile': True
+    }
+}
+
+# Firefox的profiles.ini位置（漫游应用数据目录下）
+FIREFOX_ROOT = os.path.join('Mozilla', 'Firefox')
+
+# 每个Chromium配置文件中的缓存目录（相对缓存根目录下的配置文件目录）
+CHROMIUM_CACHE_DIRS = {
+    'cache': 'Cache',
+    'code_cache': 'Code Cache',
+    'gpu_cache': 'GPUCache',
+    'service_worker_cache': os.path.join('Service Worker', 'CacheStorage'),
+    'service_worker_scripts': os.path.join('Service Worker', 'ScriptCache')
+}
+# 每个Chromium配置文件中按单个文件清理的数据（相对用户数据目录下的配置文件目录）
+# Chromium 96起Cookies位于Network目录下，旧位置仍保留给未迁移的配置文件；
+# 回滚日志与数据库一起删除，否则残留的日志会被应用到浏览器新建的数据库上
+CHROMIUM_FILES = {
+    'cookies': 'Cookies',
+    'cookies_journal': 'Cookies-journal',
+    'network_cookies': os.path.join('Network', 'Cookies'),
+    'network_cookies_journal': os.path.join('Network', 'Cookies-journal'),
+    'history': 'History',
+    'history_journal': 'History-journal'
+}
+
+# 每个Chromium配置文件中可按年龄维护的SQLite数据库：{数据库类型: 可能的位置}，
+# 新版Chromium把Cookies移到了Network目录下
+CHROMIUM_DATABASES = {
+    'chromium_history': ['History'],
+    'chromium_cookies': [os.path.join('Network', 'Cookies'), 'Cookies']
+}
+
+# 每个Chromium配置文件中按站点存放的数据（相对用户数据目录下的配置文件目录），只用于按站点统计和清理
+CHROMIUM_STORAGE_DIRS = {
+    'indexeddb': 'IndexedDB',
+    'cache_storage': os.path.join('Service Worker', 'CacheStorage'),
+    'local_storage': os.path.join('Local Storage', 'leveldb')
+}
+
+# 每个Firefox配置文件中的缓存目录（相对本地配置文件目录）
+FIREFOX_CACHE_DIRS = {
+    'cache': 'cache2',
+    'code_cache': 'startupCache',
+    'gpu_cache': 'shader-cache'
+}
+# 每个Firefox配置文件中按单个文件清理的数据（相对漫游配置文件目录）
+# webappsstore.sqlite和chromeappsstore.sqlite保存站点的localStorage，属于用户数据，不在其中
+FIREFOX_FILES = {
+    'cookies': 'cookies.sqlite',
+    'cookies_wal': 'cookies.sqlite-wal'
+}
+
+# 每个Firefox配置文件中可按年龄维护的SQLite数据库（相对漫游配置文件目录）
+FIREFOX_DATABASES = {
+    'firefox_history': ['places.sqlite'],
+    'firefox_cookies': ['cookies.sqlite']
+}
+
+# 每个Firefox配置文件中按站点存放的数据（相对漫游配置文件目录）
+FIREFOX_STORAGE_DIRS = {
+    'storage': os.path.join('storage', 'default')
+}
+
+# 支持的浏览器
+SUPPORTED_BROWSERS = tuple(CHROMIUM_BROWSERS) + ('firefox',)
+
+class ProfileDiscoverer:
+    def __init__(self, index_path=None, user_home=None):
+        # 设置日志
+        logging.basicConfig(level=logging.INFO,
+                           format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        self.logger = logging.getLogger('ProfileDiscoverer')
+
+        # 应用数据目录 - 环境变量缺失时按用户主目录推算
+        if user_home is None:
+            user_home = str(Path.home())
+        self.app_data = {
+            'local': os.environ.get('LOCALAPPDATA') or os.path.join(user_home, 'AppData', 'Local'),
+            'roaming': os.environ.get('APPDATA') or os.path.join(user_home, 'AppData', 'Roaming')
+        }
+
+        # 已解析的配置文件索引 - 以Local State/profiles.ini的mtime校验，未变化时不再重新读取
+        if index_path is None:
+            index_path = os.path.join(self.app_data['local'], 'system_toolbox', 'browser_profiles.json')
+        self.index_path = index_path
+        self.lock = threading.Lock()
+        self.index = self._load_index()
+
+    def _load_index(self):
+        """读取配置文件索引，不存在或格式不符时返回空索引"""
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('version') == PROFILE_INDEX_VERSION:
+                return index.get('browsers', {})
+        except (OSError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError):
+                self.logger.warning(f"读取浏览器配置文件索引时出错: {e}")
+        return {}
+
+    def _save_index(self):
+        """写回配置文件索引，先写临时文件再替换，避免留下不完整的索引"""
+        temp_path = f"{self.index_path}.part"
+        try:
+            os.makedirs(os.path.dirname(self.index_path) or '.', exist_ok=True)
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': PROFILE_INDEX_VERSION, 'browsers': self.index}, f, ensure_ascii=False)
+            os.replace(temp_path, self.index_path)
+        except OSError as e:
+            self.logger.warning(f"保存浏览器配置文件索引时出错: {e}")
+
+    def _resolve(self, location):
+        """把 (应用数据目录类型, 相对路径) 转换为绝对路径"""
+        base, relative = location
+        return os.path.join(self.app_data[base], relative)
+
+    def _get_source(self, browser):
+        """获取记录浏览器配置文件列表的文件：Chromium为Local State，Firefox为profiles.ini"""
+        if browser == 'firefox':
+            return os.path.join(self.app_data['roaming'], FIREFOX_ROOT, 'profiles.ini')
+        return os.path.join(self._resolve(CHROMIUM_BROWSERS[browser]['user_data']), 'Local State')
+
+    def _get_signature(self, path):
+        """文件的 (mtime_ns, 大小)，文件不存在时为None"""
+        try:
+            st = os.stat(path)
+            return [st.st_mtime_ns, st.st_size]
+        except OSError:
+            return None
+
+    def _read_chromium_profiles(self, browser):
+        """从Local State中读取Chromium配置文件目录名，无法读取时按目录名识别"""
+        spec = CHROMIUM_BROWSERS[browser]
+        user_data = self._resolve(spec['user_data'])
+        if spec.get('single_profile'):
+            return [('', 'Default')] if os.path.isdir(user_data) else []
+
+        try:
+            with open(os.path.join(user_data, 'Local State'), 'r', encoding='utf-8') as f:
+                info_cache = json.load(f).get('profile', {}).get('info_cache', {})
+            if info_cache:
+                return [(directory, info.get('name') or directory) for directory, info in info_cache.items()]
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError, AttributeError) as e:
+            self.logger.warning(f"无法解析 {browser} 的Local State: {e}")
+
+        # Local State缺失配置文件信息时，按Chromium的目录命名规则识别
+        profiles = []
+        try:
+            with os.scandir(user_data) as it:
+                for entry in it:
+                    if entry.is_dir() and (entry.name == 'Default' or entry.name.startswith('Profile ')):
+                        profiles.append((entry.name, entry.name))
+        except OSError as e:
+            self.logger.warning(f"无法列出 {user_data}: {e}")
+        return profiles
+
+    def _chromium_profile(self, browser, directory, name):
+        """生成Chromium配置文件的缓存目录和数据文件路径"""
+        spec = CHROMIUM_BROWSERS[browser]
+        user_data = self._resolve(spec['user_data'])
+        cache_root = self._resolve(spec.get('cache_root') or spec['user_data'])
+        cache_dir = os.path.join(cache_root, directory) if directory else cache_root
+        data_dir = os.path.join(user_data, directory) if directory else user_data
+        return {
+            'name': name,
+            'directory': directory,
+            'dirs': {kind: os.path.join(cache_dir, relative) for kind, relative in CHROMIUM_CACHE_DIRS.items()},
+            'files': {kind: os.path.join(data_dir, relative) for kind, relative in CHROMIUM_FILES.items()},
+            'storage': {kind: os.path.join(data_dir, relative) for kind, relative in CHROMIUM_STORAGE_DIRS.items()},
+            'databases': {schema: [os.path.join(data_dir, relative) for relative in candidates]
+                          for schema, candidates in CHROMIUM_DATABASES.items()}
+        }
+
+    def _read_firefox_profiles(self):
+        """从profiles.ini读取Firefox配置文件，返回 (名称, 漫游目录, 本地目录) 列表"""
+        ini_path = self._get_source('firefox')
+        parser = configparser.ConfigParser(interpolation=None)
+        try:
+            with open(ini_path, 'r', encoding='utf-8') as f:
+                parser.read_file(f)
+        except FileNotFoundError:
+            return []
+        except (OSError, configparser.Error, UnicodeDecodeError) as e:
+            self.logger.warning(f"无法解析Firefox的profiles.ini: {e}")
+            return []
+
+        profiles = []
+        for section in parser.sections():
+            if not section.startswith('Profile') or not parser.has_option(section, 'Path'):
+                continue
+            path = parser.get(section, 'Path')
+            name = parser.get(section, 'Name', fallback=path)
+            if parser.get(section, 'IsRelative', fallback='1') == '1':
+                # 相对路径的配置文件在漫游和本地应用数据目录下各有一份
+                relative = os.path.normpath(path)
+                roaming = os.path.join(self.app_data['roaming'], FIREFOX_ROOT, relative)
+                local = os.path.join(self.app_data['local'], FIREFOX_ROOT, relative)
+            else:
+                roaming = local = os.path.normpath(path)
+            profiles.append((name, roaming, local))
+        return profiles
+
+    def _firefox_profile(self, name, roaming, local):
+        """生成Firefox配置文件的缓存目录和数据文件路径"""
+        return {
+            'name': name,
+            'directory': os.path.basename(roaming),
+            'dirs': {kind: os.path.join(local, relative) for kind, relative in FIREFOX_CACHE_DIRS.items()},
+            'files': {kind: os.path.join(roaming, relative) for kind, relative in FIREFOX_FILES.items()},
+            'storage': {kind: os.path.join(roaming, relative) for kind, relative in FIREFOX_STORAGE_DIRS.items()},
+            'databases': {schema: [os.path.join(roaming, relative) for relative in candidates]
+                          for schema, candidates in FIREFOX_DATABASES.items()}
+        }
+
+    def _discover(self, browser):
+        """读取浏览器的配置文件列表并解析每个配置文件的路径"""
+        if browser == 'firefox':
+            return [self._firefox_profile(*profile) for profile in self._read_firefox_profiles()]
+        return [self._chromium_profile(browser, directory, name)
+                for directory, name in self._read_chromium_profiles(browser)]
+
+    def _lookup(self, browser, refresh=False):
+        """返回 (配置文件列表, 索引是否被更新)"""
+        signature = self._get_signature(self._get_source(browser))
+        with self.lock:
+            cached = self.index.get(browser)
+            if not refresh and cached is not None and cached.get('signature') == signature:
+                return cached['profiles'], False
+
+        profiles = self._discover(browser)
+        with self.lock:
+            self.index[browser] = {
+                'signature': signature,
+                'profiles': profiles
+            }
+        return profiles, True
+
+    def get_profiles(self, browser, refresh=False):
+        """获取浏览器的所有配置文件
+
+        每个配置文件为 {'name', 'directory', 'dirs': {缓存类型: 目录}, 'files': {数据类型: 文件},
+        'storage': {站点数据类型: 目录}, 'databases': {数据库类型: [可能的位置]}}，路径不保证存在。Local State或profiles.ini的mtime和大小未变化时直接使用索引中的结果。
+        """
+        if browser not in SUPPORTED_BROWSERS:
+            return []
+        profiles, changed = self._lookup(browser, refresh)
+        if changed:
+            with self.lock:
+                self._save_index()
+        return profiles
+
+    def get_browser_paths(self, browsers=None, refresh=False):
+        """获取每个浏览器所有配置文件的缓存路径，返回 {浏览器: {'配置文件目录/类型': 路径}}"""
+        if browsers is None:
+            browsers = SUPPORTED_BROWSERS
+        paths = {}
+        changed = False
+        for browser in browsers:
+            if browser not in SUPPORTED_BROWSERS:
+                continue
+            profiles, updated = self._lookup(browser, refresh)
+            changed = changed or updated
+            browser_paths = {}
+            for profile in profiles:
+                prefix = profile['directory'] or profile['name']
+                for kind, path in list(profile['dirs'].items()) + list(profile['files'].items()):
+                    browser_paths[f"{prefix}/{kind}"] = path
+            paths[browser] = browser_paths
+        # 所有浏览器解析完后只写一次索引
+        if changed:
+            with self.lock:
+                self._save_index()
+        return paths
@@ -0,0 +1,196 @@
+import os
+import struct
+import zlib
+import logging
+
+# Chromium Simple Cache的索引文件：index-dir/the-real-index，格式为带CRC的Pickle
+SIMPLE_INDEX_DIR = 'index-dir'
+SIMPLE_INDEX_FILE = 'the-real-index'
+SIMPLE_INDEX_MAGIC = 0x656e74657220796f
+# 能够解析元数据的索引版本范围
+SIMPLE_INDEX_MIN_VERSION = 6
+SIMPLE_INDEX_MAX_VERSION = 9
+# Pickle头 (负载长度, CRC) 和元数据 (魔数, 版本, 条目数, 总字节数)
+SIMPLE_PICKLE_HEADER = struct.Struct('<II')
+SIMPLE_INDEX_METADATA = struct.Struct('<QIQQ')
+# 缓存目录的修改时间比索引文件晚这么多秒以上时认为索引已过期（与Chromium的判断一致）
+SIMPLE_INDEX_STALE_SECONDS = 1
+
+# Chromium blockfile缓存的索引文件头
+BLOCKFILE_INDEX_FILE = 'index'
+BLOCKFILE_MAGIC = 0xC103CAC3
+BLOCKFILE_VERSION_3 = 0x30000
+# magic, version, num_entries, old_v2_num_bytes, last_file, this_id, stats, table_len, crash, experiment,
+# create_time, num_bytes
+BLOCKFILE_HEADER = struct.Struct('<IIiiiiIiiiQq')
+
+# Firefox cache2的索引文件：大端序，文件头之后是定长记录，最后4字节为校验和
+FIREFOX_INDEX_FILE = 'index'
+FIREFOX_INDEX_HEADER = struct.Struct('>IIII')
+# 索引版本 -> 记录长度：SHA1(20) + frecency(4) + 源属性哈希(8) + onStart/onStop时间(2+2)
+# + 内容类型(1, 版本10起) + 标志(4)
+FIREFOX_RECORD_SIZES = {
+    0x9: 40,
+    0xA: 41
+}
+FIREFOX_CHECKSUM_SIZE = 4
+# 记录标志的低24位为文件大小（KB）
+FIREFOX_FILE_SIZE_MASK = 0x00FFFFFF
+FIREFOX_REMOVED_MASK = 0x20000000
+# 一次读取的记录数
+FIREFOX_READ_RECORDS = 4096
+
+class CacheIndexReader:
+    def __init__(self):
+        # 设置日志
+        logging.basicConfig(level=logging.INFO,
+                           format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        self.logger = logging.getLogger('CacheIndexReader')
+
+    def read_simple_index(self, cache_dir):
+        """读取Chromium Simple Cache的索引元数据，返回 (条目数, 总字节数)
+
+        只读取文件头、元数据并校验负载的CRC，不解析逐条记录。
+        索引比缓存目录旧（浏览器未正常退出，索引尚未写回）时返回None。
+        """
+        index_path = os.path.join(cache_dir, SIMPLE_INDEX_DIR, SIMPLE_INDEX_FILE)
+        with open(index_path, 'rb') as f:
+            data = f.read()
+        if len(data) < SIMPLE_PICKLE_HEADER.size + SIMPLE_INDEX_METADATA.size:
+            return None
+
+        payload_size, crc = SIMPLE_PICKLE_HEADER.unpack_from(data)
+        payload = data[SIMPLE_PICKLE_HEADER.size:]
+        if payload_size != len(payload) or zlib.crc32(payload) != crc:
+            return None
+        magic, version, entries, size = SIMPLE_INDEX_METADATA.unpack_from(payload)
+        if magic != SIMPLE_INDEX_MAGIC or not SIMPLE_INDEX_MIN_VERSION <= version <= SIMPLE_INDEX_MAX_VERSION:
+            return None
+
+        if os.stat(cache_dir).st_mtime > os.stat(index_path).st_mtime + SIMPLE_INDEX_STALE_SECONDS:
+            return None
+        return entries, size
+
+    def read_blockfile_index(self, cache_dir):
+        """读取Chromium blockfile缓存的索引文件头，返回 (条目数, 总字节数)
+
+        上次未正常关闭（crash标志）的缓存统计不可信，返回None。
+        """
+        with open(os.path.join(cache_dir, BLOCKFILE_INDEX_FILE), 'rb') as f:
+            data = f.read(BLOCKFILE_HEADER.size)
+        if len(data) < BLOCKFILE_HEADER.size:
+            return None
+
+        (magic, version, entries, old_size, _, _, _, _, crash, _, _,
+         size) = BLOCKFILE_HEADER.unpack(data)
+        if magic != BLOCKFILE_MAGIC or crash or entries < 0:
+            return None
+        # 2.x版本只有32位的字节数
+        if version < BLOCKFILE_VERSION_3:
+            size = old_size
+        if size < 0:
+            return None
+        return entries, size
+
+    def read_firefox_index(self, cache_dir):
+        """顺序读取Firefox cache2的索引，返回 (条目数, 总字节数)
+
+        记录中的大小以KB为单位，总字节数按KB向上取整。Firefox运行时索引带有dirty标志，
+        其中的记录可能不完整，此时返回None。
+        """
+        index_path = os.path.join(cache_dir, FIREFOX_INDEX_FILE)
+        file_size = os.path.getsize(index_path)
+        with open(index_path, 'rb') as f:
+            header = f.read(FIREFOX_INDEX_HEADER.size)
+            if len(header) < FIREFOX_INDEX_HEADER.size:
+                return None
+            version, _, dirty, _ = FIREFOX_INDEX_HEADER.unpack(header)
+            record_size = FIREFOX_RECORD_SIZES.get(version)
+            if record_size is None or dirty:
+                return None
+            records_size = file_size - FIREFOX_INDEX_HEADER.size - FIREFOX_CHECKSUM_SIZE
+            if records_size < 0 or records_size % record_size:
+                return None
+
+            # 标志位于每条记录的最后4字节
+            flags_format = struct.Struct('>' + f'{record_size - 4}xI' * FIREFOX_READ_RECORDS)
+            entries = 0
+            size_kb = 0
+            remaining = records_size // record_size
+            while remaining:
+                count = min(remaining, FIREFOX_READ_RECORDS)
+                chunk = f.read(count * record_size)
+                if len(chunk) != count * record_size:
+                    return None
+                if count != FIREFOX_READ_RECORDS:
+                    flags_format = struct.Struct('>' + f'{record_size - 4}xI' * count)
+                for flags in flags_format.unpack(chunk):
+                    if flags & FIREFOX_REMOVED_MASK:
+                        continue
+                    entries += 1
+                    size_kb += flags & FIREFOX_FILE_SIZE_MASK
+                remaining -= count
+        return entries, size_kb * 1024
+
+    def _read_directory(self, cache_dir):
+        """识别单个目录的缓存格式并读取统计，返回 {'format', 'entries', 'size'}，无法识别时返回None"""
+        readers = []
+        if os.path.exists(os.path.join(cache_dir, SIMPLE_INDEX_DIR, SIMPLE_INDEX_FILE)):
+            readers.append(('simple', self.read_simple_index))
+        if os.path.exists(os.path.join(cache_dir, 'entries')):
+            readers.append(('firefox', self.read_firefox_index))
+        elif os.path.exists(os.path.join(cache_dir, BLOCKFILE_INDEX_FILE)):
+            readers.append(('blockfile', self.read_blockfile_index))
+
+        for name, reader in readers:
+            try:
+                result = reader(cache_dir)
+            except (OSError, struct.error) as e:
+                self.logger.warning(f"读取缓存索引 {cache_dir} 时出错: {e}")
+                continue
+            if result is not None:
+                return {
+                    'format': name,
+                    'entries': result[0],
+                    'size': result[1]
+                }
+        return None
+
+    def read(self, cache_dir):
+        """从索引文件获取缓存目录的条目数和总字节数，无法从索引得到时返回None
+
+        目录本身不是缓存时，如果其中只有子目录（如Cache/Cache_Data、Code Cache/js和wasm），
+        逐个读取子目录并合并；任何一个非空子目录无法识别时整体返回None，由调用方回退到遍历。
+        """
+        result = self._read_directory(cache_dir)
+        if result is not None:
+            return result
+
+        try:
+            with os.scandir(cache_dir) as it:
+                children = list(it)
+        except OSError:
+            return None
+        if not children or any(not child.is_dir(follow_symlinks=False) for child in children):
+            return None
+
+        total = {
+            'format': None,
+            'entries': 0,
+            'size': 0
+        }
+        for child in children:
+            result = self._read_directory(child.path)
+            if result is None:
+                try:
+                    with os.scandir(child.path) as it:
+                        # 空的子目录（缓存尚未使用）不影响结果
+                        if next(it, None) is None:
+                            continue
+                except OSError:
+                    pass
+                return None
+            total['format'] = total['format'] or result['format']
+            total['entries'] += result['entries']
+            total['size'] += result['size']
+        return total if total['format'] else None
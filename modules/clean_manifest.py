@@ -0,0 +1,284 @@
+import os
+import heapq
+import logging
+import threading
+from collections import namedtuple
+from modules.file_walker import FileWalker
+from modules.delete_engine import (DeleteEngine, DELETE_OK, DELETE_CHANGED, DELETE_MISSING,
+                                   DELETE_NOT_EMPTY, MAX_REPORTED_ERRORS)
+
+# 清理清单中的规则判定结果
+VERDICT_DELETE = 'delete'
+VERDICT_SAFE_PATH = 'safe_path'
+VERDICT_EXCLUDED = 'excluded'
+VERDICT_TOO_NEW = 'too_new'
+VERDICT_SIZE_RULE = 'size_rule'
+# 保留预算模式下最近使用过、在预算内保留的文件
+VERDICT_WITHIN_BUDGET = 'within_budget'
+
+# 保留预算模式的淘汰顺序：按最近使用时间（访问和修改时间中较晚者）或修改时间从旧到新
+BUDGET_ORDER_ATIME = 'atime'
+BUDGET_ORDER_MTIME = 'mtime'
+
+# 执行清单时每处理这么多条目报告一次进度
+PROGRESS_INTERVAL = 1000
+
+# 清单条目 - 使用namedtuple以便在数十万条目时保持较小的内存占用
+# size为文件大小，allocated为删除后实际能释放的磁盘空间（考虑压缩、稀疏和硬链接）
+ManifestEntry = namedtuple('ManifestEntry',
+                           ['path', 'size', 'allocated', 'mtime', 'is_dir', 'verdict', 'target', 'atime'])
+
+class CleanManifest:
+    def __init__(self, walker=None, safe_mode=False, engine=None):
+        # 设置日志
+        logging.basicConfig(level=logging.INFO,
+                           format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        self.logger = logging.getLogger('CleanManifest')
+
+        self.walker = walker or FileWalker()
+        self.safe_mode = safe_mode
+        # 相对目录句柄删除条目的删除引擎
+        self.engine = engine or DeleteEngine(self.walker)
+
+        # 扫描得到的候选条目
+        self.entries = []
+        # 已加入清单的清理目标（临时文件位置或浏览器）
+        self.targets = set()
+        # 有多个硬链接的文件在清单中判定为删除的次数，按(st_dev, st_ino)记录
+        self.link_counts = {}
+        # 多个目录树同时加入清单时保护条目列表和硬链接计数
+        self.lock = threading.Lock()
+
+    def _get_freeable(self, st, allocated, verdict):
+        """计算删除该文件能释放的空间
+
+        有多个硬链接的文件只有最后一个链接被删除时才释放空间，因此只统计判定为删除的
+        链接，在清单中删除该inode的全部链接时，把占用空间计到最后出现的那个条目上；
+        保留的链接不计入。链接数未知(0)的文件不计入可释放空间。
+        """
+        if st.st_nlink == 0:
+            return 0
+        if st.st_nlink == 1:
+            return allocated
+        if verdict != VERDICT_DELETE:
+            return 0
+        key = (st.st_dev, st.st_ino)
+        seen = self.link_counts.get(key, 0) + 1
+        self.link_counts[key] = seen
+        return allocated if seen == st.st_nlink else 0
+
+    def add_file(self, path, target, policy=None, check_age=True):
+        """将单个文件加入清单，policy为空时直接判定为删除"""
+        self.targets.add(target)
+        try:
+            st = os.stat(path, follow_symlinks=False)
+        except (PermissionError, FileNotFoundError, OSError) as e:
+            self.logger.warning(f"无法访问文件 {path}: {e}")
+            return
+
+        verdict = policy.evaluate(path, st, check_age) if policy else VERDICT_DELETE
+        allocated = self.walker.get_allocated_size(path, st)
+        with self.lock:
+            freeable = self._get_freeable(st, allocated, verdict)
+            self.entries.append(ManifestEntry(path, st.st_size, freeable, st.st_mtime, False, verdict, target,
+                                              st.st_atime))
+
+    def add_tree(self, root, target, policy=None, include_root=False):
+        """遍历目录树，将其中的文件和子目录加入清单
+
+        根目录本身默认保留，include_root为True时一并删除。
+        policy为CleanPolicy，位于安全路径内的子目录不会被遍历，整体记为安全路径。
+        可以在多个线程中同时对不同的目录树调用。
+        """
+        self.targets.add(target)
+        skipped_dirs = []
+
+        def skip_safe(result):
+            if policy:
+                kept = []
+                for subdir in result['subdirs']:
+                    if policy.is_path_safe(subdir):
+                        skipped_dirs.append(subdir)
+                    else:
+                        kept.append(subdir)
+                result['subdirs'] = kept
+            return result
+
+        def scanner(directory, collect_files, emit=None):
+            # 超大目录分批产出的部分结果同样过滤安全路径
+            batch_emit = (lambda partial: emit(skip_safe(partial))) if emit is not None else None
+            return skip_safe(self.walker.scan_directory(directory, collect_files, batch_emit))
+
+        for result in self.walker.walk(root, collect_files=True, scanner=scanner):
+            directory = result['path']
+            file_entries = result['file_entries']
+            if policy:
+                verdicts = policy.evaluate_batch(directory, file_entries)
+            else:
+                verdicts = [VERDICT_DELETE] * len(file_entries)
+
+            with self.lock:
+                if directory != root and not result.get('partial'):
+                    self.entries.append(ManifestEntry(directory, 0, 0, 0, True, VERDICT_DELETE, target, 0))
+                for (name, st, allocated), verdict in zip(file_entries, verdicts):
+                    path = os.path.join(directory, name)
+                    freeable = self._get_freeable(st, allocated, verdict)
+                    self.entries.append(ManifestEntry(path, st.st_size, freeable, st.st_mtime, False, verdict,
+                                                      target, st.st_atime))
+
+        with self.lock:
+            for subdir in skipped_dirs:
+                self.entries.append(ManifestEntry(subdir, 0, 0, 0, True, VERDICT_SAFE_PATH, target, 0))
+            if include_root:
+                self.entries.append(ManifestEntry(root, 0, 0, 0, True, VERDICT_DELETE, target, 0))
+
+    def apply_budget(self, targets=None, free_bytes=None, max_bytes=None, order=BUDGET_ORDER_ATIME):
+        """按保留预算重新判定targets中的文件，返回计划释放的字节数
+
+        targets中的文件作为一个整体按使用时间从旧到新淘汰：free_bytes为至少释放的字节数，
+        max_bytes为淘汰后剩余文件占用的上限，两者都给出时取需要淘汰更多的一个。
+        候选文件是规则判定为删除或仅因太新而保留的文件，预算模式下年龄规则不再适用；
+        安全路径、排除类型和大小规则保留的文件不参与淘汰，但计入占用。
+        未被淘汰的候选文件判定为VERDICT_WITHIN_BUDGET。
+        """
+        if targets is None:
+            targets = self.targets
+        targets = set(targets)
+
+        usage = 0
+        # (使用时间, 条目下标)，先收集后一次性建堆，只弹出需要淘汰的部分
+        heap = []
+        for index, entry in enumerate(self.entries):
+            if entry.is_dir or entry.target not in targets:
+                continue
+            usage += entry.allocated
+            if entry.verdict in (VERDICT_DELETE, VERDICT_TOO_NEW):
+                last_used = entry.mtime if order == BUDGET_ORDER_MTIME else max(entry.atime, entry.mtime)
+                heap.append((last_used, index))
+        heapq.heapify(heap)
+
+        needed = 0
+        if free_bytes:
+            needed = free_bytes
+        if max_bytes is not None:
+            needed = max(needed, usage - max_bytes)
+
+        planned = 0
+        evict = set()
+        while heap and planned < needed:
+            _, index = heapq.heappop(heap)
+            evict.add(index)
+            planned += self.entries[index].allocated
+
+        for index, entry in enumerate(self.entries):
+            if entry.is_dir or entry.target not in targets:
+                continue
+            if index in evict:
+                if entry.verdict != VERDICT_DELETE:
+                    self.entries[index] = entry._replace(verdict=VERDICT_DELETE)
+            elif entry.verdict in (VERDICT_DELETE, VERDICT_TOO_NEW):
+                self.entries[index] = entry._replace(verdict=VERDICT_WITHIN_BUDGET)
+
+        if planned < needed:
+            self.logger.info(f"可淘汰的文件不足以达到保留预算: 还差 {needed - planned} 字节")
+        return planned
+
+    def get_target_sizes(self, allocated=True):
+        """按清理目标汇总将被删除的字节数
+
+        allocated为True时返回实际能释放的磁盘空间，否则返回文件大小之和。
+        """
+        sizes = {target: 0 for target in self.targets}
+        for entry in self.entries:
+            if entry.verdict == VERDICT_DELETE:
+                sizes[entry.target] += entry.allocated if allocated else entry.size
+        return sizes
+
+    def get_skipped_count(self, targets=None):
+        """统计被规则跳过的条目数"""
+        return sum(1 for entry in self.entries
+                   if entry.verdict != VERDICT_DELETE and (targets is None or entry.target in targets))
+
+    def execute(self, targets=None, on_entry=None, progress_callback=None):
+        """执行清单中判定为删除的条目，边删除边累计释放的字节数
+
+        条目按所在目录分组，从最深的目录开始逐个处理：每个目录只打开一次，先相对目录句柄
+        删除其中的文件，再删除已在之前处理过的空子目录，因此一次遍历即可自底向上清空目录树。
+        删除前在同一目录句柄上确认文件的大小和修改时间与扫描时一致，已变化的文件跳过。
+        freed为实际释放的磁盘空间，freed_apparent为被删除文件的大小之和，errors记录前若干个
+        删除失败的 (路径, 错误)。on_entry(条目, 状态, 异常或None)逐条报告删除结果，
+        progress_callback(已处理条目数, 总条目数)定期报告进度。
+        """
+        if targets is None:
+            targets = self.targets
+
+        stats = {
+            target: {
+                'freed': 0,
+                'freed_apparent': 0,
+                'deleted': 0,
+                'skipped': 0,
+                'changed': 0,
+                'failed': 0,
+                'errors': []
+            }
+            for target in targets
+        }
+
+        # 所在目录 -> 该目录下要删除的 (条目, 名称)
+        groups = {}
+        total = 0
+        for entry in self.entries:
+            if entry.target not in stats:
+                continue
+            if entry.verdict != VERDICT_DELETE:
+                stats[entry.target]['skipped'] += 1
+                continue
+            # 清单路径都由 目录 + 分隔符 + 名称 拼接而成，直接拆分比dirname/basename快得多
+            directory, _, name = entry.path.rpartition(os.sep)
+            if not directory or directory.endswith(':'):
+                # 位于根目录或驱动器根目录下的条目
+                directory += os.sep
+            groups.setdefault(directory, []).append((entry, name))
+            total += 1
+
+        processed = 0
+        # 路径越深越先处理，保证子目录在父目录处理之前已经清空
+        for directory in sorted(groups, key=lambda path: path.count(os.sep), reverse=True):
+            entries = groups.pop(directory)
+            items = [(name, entry.is_dir, None if entry.is_dir else (entry.size, entry.mtime))
+                     for entry, name in entries]
+            results = self.engine.delete_batch(directory, items)
+            for (entry, _), (item, status, error) in zip(entries, results):
+                target_stats = stats[entry.target]
+                processed += 1
+                if progress_callback is not None and processed % PROGRESS_INTERVAL == 0:
+                    progress_callback(processed, total)
+                if on_entry is not None:
+                    on_entry(entry, status, error)
+
+                if entry.is_dir:
+                    # 目录非空（包含被跳过的文件）或已不存在时保留
+                    if status not in (DELETE_OK, DELETE_NOT_EMPTY, DELETE_MISSING):
+                        self.logger.warning(f"无法删除目录 {entry.path}: {error}")
+                        if len(target_stats['errors']) < MAX_REPORTED_ERRORS:
+                            target_stats['errors'].append((entry.path, str(error)))
+                elif status == DELETE_OK:
+                    target_stats['freed'] += entry.allocated
+                    target_stats['freed_apparent'] += entry.size
+                    target_stats['deleted'] += 1
+                elif status == DELETE_CHANGED:
+                    self.logger.info(f"跳过扫描后已变化的文件: {entry.path}")
+                    target_stats['changed'] += 1
+                elif status == DELETE_MISSING:
+                    # 扫描后已被其他程序删除
+                    target_stats['changed'] += 1
+                else:
+                    self.logger.warning(f"无法删除 {entry.path}: {error}")
+                    target_stats['failed'] += 1
+                    if len(target_stats['errors']) < MAX_REPORTED_ERRORS:
+                        target_stats['errors'].append((entry.path, str(error)))
+
+        if progress_callback is not None:
+            progress_callback(processed, total)
+        return stats
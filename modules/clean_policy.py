@@ -0,0 +1,155 @@
+import os
+import re
+import time
+import fnmatch
+from modules.clean_manifest import (VERDICT_DELETE, VERDICT_SAFE_PATH, VERDICT_EXCLUDED,
+                                    VERDICT_TOO_NEW, VERDICT_SIZE_RULE)
+
+# 前缀树中标记安全路径终点的键
+_TERMINAL = ''
+
+class CleanPolicy:
+    def __init__(self, safe_paths=None, excluded_extensions=None, max_file_age_days=0,
+                 protected_names=None, excluded_globs=None, min_size=None, max_size=None, now=None):
+        # 保留原始参数，便于派生新的策略
+        self.safe_paths = list(safe_paths or [])
+        self.excluded_extensions = list(excluded_extensions or [])
+        self.max_file_age_days = max_file_age_days
+        self.protected_names = list(protected_names or [])
+        self.excluded_globs = list(excluded_globs or [])
+        self.min_size = min_size
+        self.max_size = max_size
+
+        # 规范化路径组件构成的前缀树
+        self.safe_trie = {}
+        for path in self.safe_paths:
+            if path:
+                self._add_safe_path(path)
+
+        # 扩展名和受保护文件名使用集合，单次查找为O(1)
+        self.extension_set = frozenset(ext.lower() for ext in self.excluded_extensions)
+        self.protected_name_set = frozenset(os.path.normcase(name) for name in self.protected_names)
+
+        # 所有通配符合并为一个正则表达式
+        self.glob_regex = None
+        if self.excluded_globs:
+            pattern = '|'.join(fnmatch.translate(os.path.normcase(glob)) for glob in self.excluded_globs)
+            self.glob_regex = re.compile(pattern)
+
+        # 修改时间晚于该时间戳的文件太新
+        if now is None:
+            now = time.time()
+        self.now = now
+        self.age_cutoff = now - max_file_age_days * 86400 if max_file_age_days > 0 else None
+
+    def derive(self, **changes):
+        """以当前参数为基础创建新的策略"""
+        params = {
+            'safe_paths': self.safe_paths,
+            'excluded_extensions': self.excluded_extensions,
+            'max_file_age_days': self.max_file_age_days,
+            'protected_names': self.protected_names,
+            'excluded_globs': self.excluded_globs,
+            'min_size': self.min_size,
+            'max_size': self.max_size,
+            'now': self.now
+        }
+        params.update(changes)
+        return CleanPolicy(**params)
+
+    def _split_path(self, path):
+        """将路径规范化并拆分为组件"""
+        path = os.path.normcase(os.path.normpath(path))
+        drive, rest = os.path.splitdrive(path)
+        parts = [part for part in rest.split(os.sep) if part]
+        if drive:
+            parts.insert(0, drive)
+        return parts
+
+    def _add_safe_path(self, path):
+        """将安全路径加入前缀树"""
+        node = self.safe_trie
+        for part in self._split_path(path):
+            node = node.setdefault(part, {})
+        node[_TERMINAL] = True
+
+    def _find_trie_node(self, path):
+        """沿前缀树查找路径
+
+        返回 (是否位于安全路径内, 路径对应的树节点)；路径离开前缀树时节点为None。
+        """
+        node = self.safe_trie
+        if _TERMINAL in node:
+            return True, node
+        for part in self._split_path(path):
+            node = node.get(part)
+            if node is None:
+                return False, None
+            if _TERMINAL in node:
+                return True, node
+        return False, node
+
+    def is_path_safe(self, path):
+        """检查路径是否位于安全路径内"""
+        return self._find_trie_node(path)[0]
+
+    def _get_name_verdict(self, name):
+        """仅根据文件名判定（扩展名、受保护文件名、通配符）"""
+        normalized = os.path.normcase(name)
+        if self.extension_set and os.path.splitext(name.lower())[1] in self.extension_set:
+            return VERDICT_EXCLUDED
+        if normalized in self.protected_name_set:
+            return VERDICT_EXCLUDED
+        if self.glob_regex is not None and self.glob_regex.match(normalized):
+            return VERDICT_EXCLUDED
+        return None
+
+    def _get_stat_verdict(self, st, check_age=True):
+        """仅根据stat结果判定（年龄、大小）"""
+        if check_age and self.age_cutoff is not None and st.st_mtime > self.age_cutoff:
+            return VERDICT_TOO_NEW
+        if self.min_size is not None and st.st_size < self.min_size:
+            return VERDICT_SIZE_RULE
+        if self.max_size is not None and st.st_size > self.max_size:
+            return VERDICT_SIZE_RULE
+        return VERDICT_DELETE
+
+    def evaluate(self, path, st, check_age=True):
+        """判定单个文件是否可以删除"""
+        if self.is_path_safe(path):
+            return VERDICT_SAFE_PATH
+        verdict = self._get_name_verdict(os.path.basename(path))
+        if verdict is not None:
+            return verdict
+        return self._get_stat_verdict(st, check_age)
+
+    def evaluate_batch(self, directory, entries, check_age=True):
+        """批量判定同一目录下的文件
+
+        entries为 (名称, stat结果, ...) 元组或 os.DirEntry 的序列，返回与之等长的判定列表。
+        目录的安全路径检查只做一次；只有当安全路径深入到该目录之下时才逐个检查文件名。
+        """
+        is_safe, node = self._find_trie_node(directory)
+        if is_safe:
+            return [VERDICT_SAFE_PATH] * len(entries)
+
+        verdicts = []
+        for item in entries:
+            if isinstance(item, os.DirEntry):
+                name = item.name
+                st = item.stat(follow_symlinks=False)
+            else:
+                name, st = item[0], item[1]
+
+            if node is not None:
+                child = node.get(os.path.normcase(name))
+                if child is not None and _TERMINAL in child:
+                    verdicts.append(VERDICT_SAFE_PATH)
+                    continue
+
+            verdict = self._get_name_verdict(name)
+            if verdict is None:
+                verdict = self._get_stat_verdict(st, check_age)
+            verdicts.append(verdict)
+
+        return verdicts
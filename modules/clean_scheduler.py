@@ -0,0 +1,132 @@
+import os
+import time
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from modules.device_info import DeviceResolver
+from modules.io_throttle import lower_current_thread_priority
+
+# 清理任务：key唯一标识任务；paths用于确定任务读写的物理设备，为空时不受设备并发限制；
+# run(report)执行清理并返回结果，report接收0到1之间的任务进度；
+# weight为任务在总进度中的权重，通常为预计释放的字节数；
+# ready为threading.Event时，任务在事件被设置后才开始（如等待浏览器进程退出），为None时随时可以开始
+CleanJob = namedtuple('CleanJob', ['key', 'paths', 'run', 'weight', 'ready'], defaults=[None])
+
+# 有任务尚未就绪时，检查就绪状态的间隔（秒）
+READY_POLL_INTERVAL = 0.1
+
+# 每个物理设备上同时运行的任务数：固态硬盘允许并行，机械硬盘串行避免磁头来回寻道
+SSD_CONCURRENCY = 4
+HDD_CONCURRENCY = 1
+
+class CleanScheduler:
+    def __init__(self, max_workers=None, ssd_concurrency=SSD_CONCURRENCY, hdd_concurrency=HDD_CONCURRENCY,
+                 resolver=None):
+        # 设置日志
+        logging.basicConfig(level=logging.INFO,
+                           format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        self.logger = logging.getLogger('CleanScheduler')
+
+        # 同时运行的任务总数上限
+        if max_workers is None:
+            max_workers = min(8, os.cpu_count() or 1)
+        self.max_workers = max(1, max_workers)
+        self.ssd_concurrency = max(1, ssd_concurrency)
+        self.hdd_concurrency = max(1, hdd_concurrency)
+
+        self.resolver = resolver or DeviceResolver()
+
+        # 后台模式下工作线程以最低的CPU和I/O优先级运行
+        self.background = False
+
+    def set_background(self, enabled):
+        """开启或关闭后台模式"""
+        self.background = enabled
+
+    def _get_job_devices(self, job):
+        """获取任务涉及的物理设备，返回 {物理设备: 是否为机械硬盘}"""
+        devices = {}
+        for path in job.paths:
+            if not path:
+                continue
+            device, rotational = self.resolver.get_path_device(path)
+            # 同一设备只要有一个路径被识别为机械硬盘就按机械硬盘处理
+            devices[device] = devices.get(device, False) or rotational
+        return devices
+
+    def run(self, jobs, progress_callback=None):
+        """在有界的线程池中运行清理任务，返回 {任务key: 结果}
+
+        任务按提交顺序调度：总并发不超过max_workers，且每个物理设备上同时运行的任务
+        不超过该设备的并发上限；设备已满或尚未就绪的任务让位给其他任务，不占用工作线程。
+        progress_callback(总进度, 任务key, 任务进度)在任务报告进度时调用，总进度按任务权重加权，
+        取值0到1。任务抛出的异常转换为 {'success': False, 'error': ...} 结果。
+        """
+        jobs = list(jobs)
+        devices = {job.key: self._get_job_devices(job) for job in jobs}
+        weights = {job.key: max(1, job.weight or 0) for job in jobs}
+        total_weight = sum(weights.values()) or 1
+        progress = {job.key: 0.0 for job in jobs}
+        lock = threading.Lock()
+
+        def report(key, fraction):
+            with lock:
+                progress[key] = max(progress[key], min(1.0, fraction))
+                overall = sum(progress[k] * weights[k] for k in progress) / total_weight
+            if progress_callback:
+                progress_callback(overall, key, progress[key])
+
+        # 物理设备 -> 并发上限、正在运行的任务数
+        limits = {}
+        for job_devices in devices.values():
+            for device, rotational in job_devices.items():
+                if rotational or device not in limits:
+                    limits[device] = self.hdd_concurrency if rotational else self.ssd_concurrency
+        active = {}
+
+        def can_start(job):
+            if job.ready is not None and not job.ready.is_set():
+                return False
+            return all(active.get(device, 0) < limits[device] for device in devices[job.key])
+
+        results = {}
+        pending = jobs
+        running = {}
+        initializer = lower_current_thread_priority if self.background else None
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='CleanScheduler',
+                                initializer=initializer) as executor:
+            while pending or running:
+                waiting = []
+                for job in pending:
+                    if len(running) < self.max_workers and can_start(job):
+                        for device in devices[job.key]:
+                            active[device] = active.get(device, 0) + 1
+                        report_job = lambda fraction, key=job.key: report(key, fraction)
+                        running[executor.submit(job.run, report_job)] = job
+                    else:
+                        waiting.append(job)
+                pending = waiting
+
+                # 有未就绪的任务时定期醒来检查，就绪后立即开始
+                unready = any(job.ready is not None and not job.ready.is_set() for job in pending)
+                if not running:
+                    time.sleep(READY_POLL_INTERVAL)
+                    continue
+                done, _ = wait(running, timeout=READY_POLL_INTERVAL if unready else None,
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = running.pop(future)
+                    for device in devices[job.key]:
+                        active[device] -= 1
+                    try:
+                        results[job.key] = future.result()
+                    except Exception as e:
+                        self.logger.error(f"清理任务 {job.key} 出错: {e}")
+                        results[job.key] = {
+                            'success': False,
+                            'error': str(e)
+                        }
+                    report(job.key, 1.0)
+
+        return results
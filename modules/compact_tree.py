@@ -0,0 +1,282 @@
+import os
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy为可选依赖，缺失时排序和过滤退回纯Python实现
+    np = None
+
+# 节点标志位
+FLAG_DIR = 0x01
+# 已从树中移除的节点，槽位保留但不再参与查询
+FLAG_REMOVED = 0x02
+# 重复的硬链接：同一inode的大小已计入另一个链接，节点只计入0字节
+FLAG_LINKED = 0x04
+
+# 没有父节点、子节点或兄弟节点时使用的索引
+NO_NODE = -1
+
+# 按列存储的紧凑目录树：每个节点只占用各列数组中的一个定长槽位，
+# 名称统一保存在一个bytes缓冲区中，重复的名称只保存一次。
+# 子节点总是在父节点之后添加，因此逆序遍历索引即可自底向上汇总。
+class CompactTree:
+    def __init__(self, root_path):
+        self.parent = array('q')
+        self.first_child = array('q')
+        self.next_sibling = array('q')
+        self.name_offset = array('Q')
+        self.name_length = array('I')
+        self.size = array('Q')
+        self.allocated = array('Q')
+        self.mtime = array('d')
+        self.atime = array('d')
+        self.uid = array('I')
+        self.flags = array('B')
+
+        # 所有名称的UTF-8编码依次存放在同一个缓冲区中
+        self.names = bytearray()
+        # 构建期间用于名称去重，compact()后释放
+        self.name_cache = {}
+
+        self.root_path = root_path
+        self.add_node(NO_NODE, root_path, is_dir=True)
+
+    def __len__(self):
+        return len(self.parent)
+
+    def _intern_name(self, name):
+        """将名称写入字符串缓冲区，返回 (偏移, 长度)"""
+        cached = self.name_cache.get(name) if self.name_cache is not None else None
+        if cached is not None:
+            return cached
+        # surrogatepass可以往返保存Windows的孤立代理项和POSIX的surrogateescape字节
+        encoded = name.encode('utf-8', 'surrogatepass')
+        location = (len(self.names), len(encoded))
+        self.names += encoded
+        if self.name_cache is not None:
+            self.name_cache[name] = location
+        return location
+
+    def add_node(self, parent, name, size=0, allocated=0, mtime=0.0, is_dir=False, atime=0.0, uid=0,
+                 linked=False):
+        """添加节点并返回其索引，linked为True时节点为重复的硬链接，大小按0计入"""
+        if linked:
+            size = allocated = 0
+        index = len(self.parent)
+        offset, length = self._intern_name(name)
+
+        self.parent.append(parent)
+        self.first_child.append(NO_NODE)
+        self.next_sibling.append(NO_NODE)
+        self.name_offset.append(offset)
+        self.name_length.append(length)
+        self.size.append(size)
+        self.allocated.append(allocated)
+        self.mtime.append(mtime)
+        self.atime.append(atime)
+        self.uid.append(uid)
+        self.flags.append((FLAG_DIR if is_dir else 0) | (FLAG_LINKED if linked else 0))
+
+        if parent != NO_NODE:
+            # 头插法，添加子节点为O(1)
+            self.next_sibling[index] = self.first_child[parent]
+            self.first_child[parent] = index
+        return index
+
+    def compact(self):
+        """构建完成后释放名称去重表"""
+        self.name_cache = None
+
+    def add_size(self, index, size, allocated):
+        """累加节点自身的大小"""
+        self.size[index] += size
+        self.allocated[index] += allocated
+
+    def rollup(self, dirs_only=False, start=0):
+        """自底向上把每个节点的大小累加到父节点
+
+        dirs_only为True时只累加目录节点，用于文件大小已经计入所在目录的情况。
+        start大于0时只汇总以start为根、在其之后添加的子树，不向start之前的节点累加。
+        """
+        parent = self.parent
+        flags = self.flags
+        size = self.size
+        allocated = self.allocated
+        for index in range(len(parent) - 1, start, -1):
+            if dirs_only and not flags[index] & FLAG_DIR:
+                continue
+            p = parent[index]
+            size[p] += size[index]
+            allocated[p] += allocated[index]
+
+    def add_delta(self, index, size, allocated):
+        """把大小变化累加到节点及其所有祖先，结果不会小于0"""
+        while index != NO_NODE:
+            self.size[index] = max(0, self.size[index] + size)
+            self.allocated[index] = max(0, self.allocated[index] + allocated)
+            index = self.parent[index]
+
+    def update_file(self, index, size, allocated, mtime, atime, uid):
+        """更新文件节点的元数据，并把大小变化传递给所有祖先，重复的硬链接始终按0字节计入"""
+        if self.flags[index] & FLAG_LINKED:
+            size = allocated = 0
+        delta_size = size - self.size[index]
+        delta_allocated = allocated - self.allocated[index]
+        self.mtime[index] = mtime
+        self.atime[index] = atime
+        self.uid[index] = uid
+        if delta_size or delta_allocated:
+            self.add_delta(index, delta_size, delta_allocated)
+
+    def ancestors(self, index):
+        """获取节点自身及其所有祖先的索引，从节点自身开始"""
+        result = []
+        while index != NO_NODE:
+            result.append(index)
+            index = self.parent[index]
+        return result
+
+    def remove_node(self, index):
+        """从树中移除节点及其子树，并从祖先中减去其大小，返回被移除的目录节点索引
+
+        槽位不会被回收，被移除的节点只是不再出现在子节点链表和查询结果中。
+        """
+        parent = self.parent[index]
+        if parent != NO_NODE:
+            self.add_delta(parent, -self.size[index], -self.allocated[index])
+            # 从父节点的子节点链表中摘除
+            previous = NO_NODE
+            child = self.first_child[parent]
+            while child != NO_NODE and child != index:
+                previous = child
+                child = self.next_sibling[child]
+            if child == index:
+                if previous == NO_NODE:
+                    self.first_child[parent] = self.next_sibling[index]
+                else:
+                    self.next_sibling[previous] = self.next_sibling[index]
+            self.next_sibling[index] = NO_NODE
+
+        removed_dirs = []
+        stack = [index]
+        while stack:
+            node = stack.pop()
+            self.flags[node] |= FLAG_REMOVED
+            if self.flags[node] & FLAG_DIR:
+                removed_dirs.append(node)
+                stack.extend(self.children(node))
+        return removed_dirs
+
+    def is_dir(self, index):
+        """检查节点是否为目录"""
+        return bool(self.flags[index] & FLAG_DIR)
+
+    def is_linked(self, index):
+        """检查节点是否为大小未计入的重复硬链接"""
+        return bool(self.flags[index] & FLAG_LINKED)
+
+    def get_name(self, index):
+        """获取节点名称"""
+        offset = self.name_offset[index]
+        return self.names[offset:offset + self.name_length[index]].decode('utf-8', 'surrogatepass')
+
+    def get_path(self, index):
+        """沿父节点拼接出节点的完整路径"""
+        parts = []
+        while index > 0:
+            parts.append(self.get_name(index))
+            index = self.parent[index]
+        parts.append(self.root_path)
+        return os.path.join(*reversed(parts))
+
+    def children(self, index):
+        """获取节点的所有子节点索引，耗时与子节点数成正比"""
+        result = []
+        child = self.first_child[index]
+        while child != NO_NODE:
+            result.append(child)
+            child = self.next_sibling[child]
+        return result
+
+    def find_child(self, index, name):
+        """在子节点中按名称查找"""
+        child = self.first_child[index]
+        while child != NO_NODE:
+            if self.get_name(child) == name:
+                return child
+            child = self.next_sibling[child]
+        return NO_NODE
+
+    def find(self, path):
+        """按路径查找节点索引，找不到时返回NO_NODE"""
+        try:
+            relative = os.path.relpath(path, self.root_path)
+        except ValueError:
+            # Windows上不同驱动器之间无法计算相对路径
+            return NO_NODE
+
+        if relative == os.curdir:
+            return 0
+        parts = relative.split(os.sep)
+        # 只有第一段恰好是..时才在根目录之外，..cache之类的名称属于树内
+        if parts[0] == os.pardir:
+            return NO_NODE
+
+        index = 0
+        for part in parts:
+            index = self.find_child(index, part)
+            if index == NO_NODE:
+                return NO_NODE
+        return index
+
+    def sorted_children(self, index, limit=None, column='size'):
+        """获取按指定列降序排列的子节点索引"""
+        children = self.children(index)
+        values = getattr(self, column)
+        if np is not None and len(children) > 64:
+            ids = np.asarray(children, dtype=np.int64)
+            keys = np.frombuffer(values, dtype=values.typecode)[ids]
+            order = np.argsort(-keys.astype(np.float64), kind='stable')
+            if limit:
+                order = order[:limit]
+            return ids[order].tolist()
+
+        children.sort(key=values.__getitem__, reverse=True)
+        return children[:limit] if limit else children
+
+    def filter(self, min_size=0, dirs_only=False, files_only=False):
+        """按大小和类型过滤全树节点，返回节点索引列表"""
+        if np is not None:
+            sizes = np.frombuffer(self.size, dtype=np.uint64)
+            flags = np.frombuffer(self.flags, dtype=np.uint8)
+            mask = (sizes >= min_size) & ((flags & FLAG_REMOVED) == 0)
+            if dirs_only or files_only:
+                is_dir = (flags & FLAG_DIR) != 0
+                mask &= is_dir if dirs_only else ~is_dir
+            return np.nonzero(mask)[0].tolist()
+
+        result = []
+        for index in range(len(self.parent)):
+            if self.size[index] < min_size or self.flags[index] & FLAG_REMOVED:
+                continue
+            is_dir = self.flags[index] & FLAG_DIR
+            if (dirs_only and not is_dir) or (files_only and is_dir):
+                continue
+            result.append(index)
+        return result
+
+    def get_info(self, index):
+        """获取节点信息字典，格式与分析结果一致"""
+        return {
+            'path': self.get_path(index),
+            'size': self.size[index],
+            'allocated': self.allocated[index],
+            'is_dir': self.is_dir(index)
+        }
+
+    def memory_usage(self):
+        """估算树占用的内存字节数（不含构建期的名称去重表）"""
+        columns = (self.parent, self.first_child, self.next_sibling, self.name_offset,
+                   self.name_length, self.size, self.allocated, self.mtime, self.atime, self.uid, self.flags)
+        return sum(column.buffer_info()[1] * column.itemsize for column in columns) + len(self.names)
@@ -0,0 +1,433 @@
+import os
+import stat
+import errno
+import ctypes
+import logging
+from ctypes import wintypes
+from modules.file_walker import FileWalker, THROTTLE_ENTRIES
+
+# 单个条目的删除结果
+DELETE_OK = 'deleted'
+# 文件的大小或修改时间与预期不一致，未删除
+DELETE_CHANGED = 'changed'
+# 条目已不存在
+DELETE_MISSING = 'missing'
+# 目录非空，被保留
+DELETE_NOT_EMPTY = 'not_empty'
+DELETE_FAILED = 'failed'
+
+# 每个目标最多记录的失败条目数，避免大量失败时错误列表无限增长
+MAX_REPORTED_ERRORS = 100
+
+# NT文件访问权限和打开选项
+DELETE = 0x00010000
+SYNCHRONIZE = 0x00100000
+FILE_LIST_DIRECTORY = 0x0001
+FILE_TRAVERSE = 0x0020
+FILE_READ_ATTRIBUTES = 0x0080
+FILE_SHARE_ALL = 0x00000007
+OPEN_EXISTING = 3
+FILE_FLAG_BACKUP_SEMANTICS = 0x02000000
+FILE_DIRECTORY_FILE = 0x00000001
+FILE_SYNCHRONOUS_IO_NONALERT = 0x00000020
+FILE_OPEN_REPARSE_POINT = 0x00200000
+OBJ_CASE_INSENSITIVE = 0x00000040
+FILE_ATTRIBUTE_DIRECTORY = 0x10
+FILE_ATTRIBUTE_REPARSE_POINT = 0x400
+
+# GetFileInformationByHandleEx / SetFileInformationByHandle的信息类别
+FILE_BASIC_INFO_CLASS = 0
+FILE_STANDARD_INFO_CLASS = 1
+FILE_DISPOSITION_INFO_CLASS = 4
+FILE_DISPOSITION_INFO_EX_CLASS = 21
+# POSIX语义删除：名称立即从目录中消失，父目录随后可以直接删除
+FILE_DISPOSITION_FLAG_DELETE = 0x01
+FILE_DISPOSITION_FLAG_POSIX_SEMANTICS = 0x02
+ERROR_INVALID_PARAMETER = 87
+ERROR_NOT_SUPPORTED = 50
+
+# FILETIME（1601年起的100纳秒数）与Unix时间戳的差值
+FILETIME_EPOCH = 116444736000000000
+
+class UNICODE_STRING(ctypes.Structure):
+    _fields_ = [('Length', wintypes.USHORT),
+                ('MaximumLength', wintypes.USHORT),
+                ('Buffer', ctypes.c_void_p)]
+
+class OBJECT_ATTRIBUTES(ctypes.Structure):
+    _fields_ = [('Length', wintypes.ULONG),
+                ('RootDirectory', ctypes.c_void_p),
+                ('ObjectName', ctypes.POINTER(UNICODE_STRING)),
+                ('Attributes', wintypes.ULONG),
+                ('SecurityDescriptor', ctypes.c_void_p),
+                ('SecurityQualityOfService', ctypes.c_void_p)]
+
+class IO_STATUS_BLOCK(ctypes.Structure):
+    _fields_ = [('Status', ctypes.c_void_p),
+                ('Information', ctypes.c_void_p)]
+
+class FILE_BASIC_INFO(ctypes.Structure):
+    _fields_ = [('CreationTime', ctypes.c_longlong),
+                ('LastAccessTime', ctypes.c_longlong),
+                ('LastWriteTime', ctypes.c_longlong),
+                ('ChangeTime', ctypes.c_longlong),
+                ('FileAttributes', wintypes.DWORD)]
+
+class FILE_STANDARD_INFO(ctypes.Structure):
+    _fields_ = [('AllocationSize', ctypes.c_longlong),
+                ('EndOfFile', ctypes.c_longlong),
+                ('NumberOfLinks', wintypes.DWORD),
+                ('DeletePending', wintypes.BOOLEAN),
+                ('Directory', wintypes.BOOLEAN)]
+
+class PathOps:
+    """按完整路径删除的后备实现，用于不支持相对目录句柄删除的平台"""
+    name = 'path'
+
+    def open_root(self, path):
+        if not os.path.isdir(path):
+            # 与按描述符打开时一致：不存在的目录报告为FileNotFoundError
+            if not os.path.lexists(path):
+                raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+            raise NotADirectoryError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), path)
+        return path
+
+    def open_child(self, handle, path, name):
+        return os.path.join(path, name)
+
+    def close(self, handle):
+        pass
+
+    def scandir(self, handle, path):
+        return os.scandir(path)
+
+    def unlink(self, handle, path, name, expected=None):
+        """删除文件；expected为 (大小, 修改时间) 且与磁盘上不一致时不删除并返回False"""
+        full_path = os.path.join(path, name)
+        if expected is not None:
+            st = os.stat(full_path, follow_symlinks=False)
+            if (st.st_size, st.st_mtime) != expected:
+                return False
+        os.unlink(full_path)
+        return True
+
+    def remove_dir(self, parent_handle, parent_path, name, handle=None):
+        os.rmdir(os.path.join(parent_path, name))
+
+class PosixOps(PathOps):
+    """POSIX实现 - 目录以文件描述符打开，条目通过dir_fd相对删除，不再逐级解析完整路径"""
+    name = 'dir_fd'
+
+    def open_root(self, path):
+        return os.open(path, os.O_RDONLY | os.O_DIRECTORY | getattr(os, 'O_CLOEXEC', 0))
+
+    def open_child(self, handle, path, name):
+        # O_NOFOLLOW保证扫描后被替换为符号链接的子目录不会被跟随
+        return os.open(name, os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW | getattr(os, 'O_CLOEXEC', 0),
+                       dir_fd=handle)
+
+    def close(self, handle):
+        os.close(handle)
+
+    def scandir(self, handle, path):
+        # 以描述符枚举时，DirEntry.stat()也相对该描述符执行
+        return os.scandir(handle)
+
+    def unlink(self, handle, path, name, expected=None):
+        if expected is not None:
+            st = os.stat(name, dir_fd=handle, follow_symlinks=False)
+            if (st.st_size, st.st_mtime) != expected:
+                return False
+        os.unlink(name, dir_fd=handle)
+        return True
+
+    def remove_dir(self, parent_handle, parent_path, name, handle=None):
+        os.rmdir(name, dir_fd=parent_handle)
+
+class WindowsOps(PathOps):
+    """Windows实现 - 目录以句柄打开，条目通过NtOpenFile相对父目录句柄打开后按句柄删除"""
+    name = 'handle'
+
+    def __init__(self):
+        self.kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+        self.ntdll = ctypes.WinDLL('ntdll')
+        self.kernel32.CreateFileW.restype = ctypes.c_void_p
+        self.kernel32.CreateFileW.argtypes = [wintypes.LPCWSTR, wintypes.DWORD, wintypes.DWORD, ctypes.c_void_p,
+                                              wintypes.DWORD, wintypes.DWORD, ctypes.c_void_p]
+        self.kernel32.CloseHandle.argtypes = [ctypes.c_void_p]
+        self.kernel32.GetFileInformationByHandleEx.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p,
+                                                               wintypes.DWORD]
+        self.kernel32.SetFileInformationByHandle.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p,
+                                                             wintypes.DWORD]
+        self.ntdll.NtOpenFile.restype = ctypes.c_long
+        self.ntdll.NtOpenFile.argtypes = [ctypes.POINTER(ctypes.c_void_p), wintypes.ULONG,
+                                          ctypes.POINTER(OBJECT_ATTRIBUTES), ctypes.POINTER(IO_STATUS_BLOCK),
+                                          wintypes.ULONG, wintypes.ULONG]
+        self.ntdll.RtlNtStatusToDosError.restype = wintypes.ULONG
+        self.ntdll.RtlNtStatusToDosError.argtypes = [ctypes.c_long]
+        # 系统不支持POSIX语义删除时退回普通的删除标记
+        self.posix_delete = True
+
+    def open_root(self, path):
+        handle = self.kernel32.CreateFileW(path, FILE_LIST_DIRECTORY | FILE_TRAVERSE | SYNCHRONIZE,
+                                           FILE_SHARE_ALL, None, OPEN_EXISTING, FILE_FLAG_BACKUP_SEMANTICS, None)
+        if handle is None or handle == ctypes.c_void_p(-1).value:
+            raise ctypes.WinError(ctypes.get_last_error())
+        return handle
+
+    def _open_relative(self, handle, name, access, options):
+        """相对目录句柄打开条目本身（不跟随重解析点）"""
+        buffer = ctypes.create_unicode_buffer(name)
+        object_name = UNICODE_STRING(ctypes.sizeof(buffer) - ctypes.sizeof(ctypes.c_wchar),
+                                     ctypes.sizeof(buffer), ctypes.cast(buffer, ctypes.c_void_p))
+        attributes = OBJECT_ATTRIBUTES(ctypes.sizeof(OBJECT_ATTRIBUTES), handle, ctypes.pointer(object_name),
+                                       OBJ_CASE_INSENSITIVE, None, None)
+        io_status = IO_STATUS_BLOCK()
+        result = ctypes.c_void_p()
+        status = self.ntdll.NtOpenFile(ctypes.byref(result), access | SYNCHRONIZE, ctypes.byref(attributes),
+                                       ctypes.byref(io_status), FILE_SHARE_ALL,
+                                       options | FILE_SYNCHRONOUS_IO_NONALERT | FILE_OPEN_REPARSE_POINT)
+        if status < 0:
+            raise ctypes.WinError(self.ntdll.RtlNtStatusToDosError(status))
+        return result.value
+
+    def open_child(self, handle, path, name):
+        return self._open_relative(handle, name, FILE_LIST_DIRECTORY | FILE_TRAVERSE | DELETE,
+                                   FILE_DIRECTORY_FILE)
+
+    def close(self, handle):
+        self.kernel32.CloseHandle(handle)
+
+    def _mark_deleted(self, handle):
+        """为已打开的句柄设置删除标记，句柄关闭时条目被删除"""
+        if self.posix_delete:
+            flags = wintypes.ULONG(FILE_DISPOSITION_FLAG_DELETE | FILE_DISPOSITION_FLAG_POSIX_SEMANTICS)
+            if self.kernel32.SetFileInformationByHandle(handle, FILE_DISPOSITION_INFO_EX_CLASS,
+                                                        ctypes.byref(flags), ctypes.sizeof(flags)):
+                return
+            error = ctypes.get_last_error()
+            if error not in (ERROR_INVALID_PARAMETER, ERROR_NOT_SUPPORTED):
+                raise ctypes.WinError(error)
+            self.posix_delete = False
+
+        disposition = wintypes.BOOLEAN(True)
+        if not self.kernel32.SetFileInformationByHandle(handle, FILE_DISPOSITION_INFO_CLASS,
+                                                        ctypes.byref(disposition), ctypes.sizeof(disposition)):
+            raise ctypes.WinError(ctypes.get_last_error())
+
+    def _get_basic_info(self, handle):
+        basic = FILE_BASIC_INFO()
+        if not self.kernel32.GetFileInformationByHandleEx(handle, FILE_BASIC_INFO_CLASS, ctypes.byref(basic),
+                                                          ctypes.sizeof(basic)):
+            raise ctypes.WinError(ctypes.get_last_error())
+        return basic
+
+    def _get_size_and_mtime(self, handle, basic):
+        """按句柄查询文件大小和修改时间，修改时间的换算方式与os.stat一致"""
+        standard = FILE_STANDARD_INFO()
+        if not self.kernel32.GetFileInformationByHandleEx(handle, FILE_STANDARD_INFO_CLASS,
+                                                          ctypes.byref(standard), ctypes.sizeof(standard)):
+            raise ctypes.WinError(ctypes.get_last_error())
+        seconds, remainder = divmod(basic.LastWriteTime - FILETIME_EPOCH, 10000000)
+        return standard.EndOfFile, seconds + remainder * 100 * 1e-9
+
+    def unlink(self, handle, path, name, expected=None):
+        # 目录符号链接本身是带重解析点的目录，不能用FILE_NON_DIRECTORY_FILE打开；
+        # 打开后按属性拒绝真正的目录，与os.unlink的行为一致
+        file_handle = self._open_relative(handle, name, DELETE | FILE_READ_ATTRIBUTES, 0)
+        try:
+            basic = self._get_basic_info(file_handle)
+            if basic.FileAttributes & FILE_ATTRIBUTE_DIRECTORY and \
+                    not basic.FileAttributes & FILE_ATTRIBUTE_REPARSE_POINT:
+                raise IsADirectoryError(errno.EISDIR, os.strerror(errno.EISDIR), os.path.join(path, name))
+            # 校验和删除使用同一个句柄，两者之间文件不会被替换
+            if expected is not None and self._get_size_and_mtime(file_handle, basic) != expected:
+                return False
+            self._mark_deleted(file_handle)
+            return True
+        finally:
+            self.close(file_handle)
+
+    def remove_dir(self, parent_handle, parent_path, name, handle=None):
+        if handle is not None:
+            # 遍历时已打开的子目录句柄带有删除权限，直接标记删除
+            self._mark_deleted(handle)
+            return
+        dir_handle = self._open_relative(parent_handle, name, DELETE, FILE_DIRECTORY_FILE)
+        try:
+            self._mark_deleted(dir_handle)
+        finally:
+            self.close(dir_handle)
+
+def get_default_ops():
+    """选择当前平台可用的相对删除实现"""
+    if os.name == 'nt':
+        try:
+            return WindowsOps()
+        except (OSError, AttributeError):
+            return PathOps()
+    if os.unlink in os.supports_dir_fd and os.rmdir in os.supports_dir_fd and os.scandir in os.supports_fd:
+        return PosixOps()
+    return PathOps()
+
+class DeleteEngine:
+    def __init__(self, walker=None, ops=None):
+        # 设置日志
+        logging.basicConfig(level=logging.INFO,
+                           format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        self.logger = logging.getLogger('DeleteEngine')
+
+        # 用于计算文件实际占用的空间
+        self.walker = walker or FileWalker()
+        self.ops = ops or get_default_ops()
+
+    def _get_status(self, error):
+        """把删除时的异常转换为结果状态"""
+        if isinstance(error, FileNotFoundError):
+            return DELETE_MISSING
+        if error.errno in (errno.ENOTEMPTY, errno.EEXIST):
+            # Windows的ERROR_DIR_NOT_EMPTY同样映射为ENOTEMPTY
+            return DELETE_NOT_EMPTY
+        return DELETE_FAILED
+
+    def delete_batch(self, directory, items):
+        """删除同一目录下的一批条目，目录只打开一次，逐条产出 (条目, 状态, 异常)
+
+        items为 (名称, 是否目录, 预期的 (大小, 修改时间) 或None) 的序列。目录条目只在为空时删除，
+        非空时状态为DELETE_NOT_EMPTY；文件的当前大小或修改时间与预期不一致时状态为DELETE_CHANGED。
+        """
+        # 后台模式下磁盘繁忙时先等待
+        self.walker.throttle_wait()
+        try:
+            handle = self.ops.open_root(directory)
+        except OSError as e:
+            status = self._get_status(e)
+            for item in items:
+                yield item, status, e
+            return
+
+        try:
+            for item in items:
+                name, is_dir, expected = item
+                try:
+                    if is_dir:
+                        self.ops.remove_dir(handle, directory, name)
+                        yield item, DELETE_OK, None
+                    elif self.ops.unlink(handle, directory, name, expected):
+                        yield item, DELETE_OK, None
+                    else:
+                        yield item, DELETE_CHANGED, None
+                except OSError as e:
+                    yield item, self._get_status(e), e
+        finally:
+            self.ops.close(handle)
+
+    def _new_stats(self):
+        return {
+            'freed': 0,
+            'freed_apparent': 0,
+            'deleted': 0,
+            'dirs_removed': 0,
+            'failed': 0,
+            'errors': []
+        }
+
+    def _record_error(self, stats, path, error):
+        stats['failed'] += 1
+        if len(stats['errors']) < MAX_REPORTED_ERRORS:
+            stats['errors'].append((path, str(error)))
+
+    def delete_tree(self, root, keep_root=True, on_entry=None):
+        """删除目录树中的所有条目，在同一次遍历中自底向上删除已清空的目录
+
+        目录以句柄打开后用os.scandir枚举，文件和子目录都相对所在目录的句柄删除，
+        打开的句柄数等于当前深度。on_entry(路径, 是否目录, 释放的字节数, 异常或None)逐条报告结果。
+        有多个硬链接的文件只有最后一个链接被删除时才释放空间，因此不计入freed。
+        """
+        stats = self._new_stats()
+
+        def report(path, is_dir, freed, error):
+            if error is not None:
+                self._record_error(stats, path, error)
+            if on_entry is not None:
+                on_entry(path, is_dir, freed, error)
+
+        try:
+            root_handle = self.ops.open_root(root)
+            iterator = self.ops.scandir(root_handle, root)
+        except OSError as e:
+            if not isinstance(e, FileNotFoundError):
+                report(root, True, 0, e)
+            return stats
+
+        # 每一层：[句柄, 路径, 名称, 枚举器]，只保存当前路径上的目录
+        frames = [[root_handle, root, None, iterator]]
+        processed = 0
+        try:
+            while frames:
+                handle, path, name, iterator = frames[-1]
+                entry = next(iterator, None)
+                processed += 1
+                if processed % THROTTLE_ENTRIES == 0:
+                    self.walker.throttle_wait()
+                if entry is None:
+                    iterator.close()
+                    frames.pop()
+                    if not frames:
+                        continue
+                    parent_handle, parent_path = frames[-1][0], frames[-1][1]
+                    try:
+                        self.ops.remove_dir(parent_handle, parent_path, name, handle)
+                        stats['dirs_removed'] += 1
+                        report(path, True, 0, None)
+                    except OSError as e:
+                        if self._get_status(e) != DELETE_MISSING:
+                            report(path, True, 0, e)
+                    finally:
+                        self.ops.close(handle)
+                    continue
+
+                entry_path = os.path.join(path, entry.name)
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                    if stat.S_ISDIR(st.st_mode) and not getattr(st, 'st_file_attributes', 0) & \
+                            FILE_ATTRIBUTE_REPARSE_POINT:
+                        child = self.ops.open_child(handle, path, entry.name)
+                        try:
+                            child_iterator = self.ops.scandir(child, entry_path)
+                        except OSError:
+                            self.ops.close(child)
+                            raise
+                        frames.append([child, entry_path, entry.name, child_iterator])
+                        self.walker.throttle_wait()
+                        continue
+                    if stat.S_ISDIR(st.st_mode):
+                        # 目录联接和目录符号链接只删除链接本身
+                        self.ops.remove_dir(handle, path, entry.name)
+                        report(entry_path, True, 0, None)
+                        continue
+
+                    # 删除前补全链接数，链接数未知(0)时不计入释放空间
+                    st = self.walker.get_link_stat(entry_path, st)
+                    self.ops.unlink(handle, path, entry.name)
+                    freed = self.walker.get_allocated_size(entry_path, st) if st.st_nlink == 1 else 0
+                    stats['freed'] += freed
+                    stats['freed_apparent'] += st.st_size
+                    stats['deleted'] += 1
+                    report(entry_path, False, freed, None)
+                except OSError as e:
+                    if self._get_status(e) != DELETE_MISSING:
+                        report(entry_path, entry.is_dir(follow_symlinks=False), 0, e)
+        finally:
+            # 出错或调用方中断时关闭所有仍打开的句柄
+            for handle, path, name, iterator in frames:
+                iterator.close()
+                self.ops.close(handle)
+
+        if not keep_root:
+            try:
+                os.rmdir(root)
+                stats['dirs_removed'] += 1
+            except OSError as e:
+                self._record_error(stats, root, e)
+        return stats
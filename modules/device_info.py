@@ -0,0 +1,162 @@
+import os
+import struct
+import ctypes
+import logging
+from ctypes import wintypes
+import threading
+import psutil
+
+# Windows设备控制码 - 查询卷所在的物理磁盘和磁盘是否有寻道惩罚（机械硬盘）
+IOCTL_VOLUME_GET_VOLUME_DISK_EXTENTS = 0x00560000
+IOCTL_STORAGE_QUERY_PROPERTY = 0x002D1400
+STORAGE_DEVICE_SEEK_PENALTY_PROPERTY = 7
+
+class DeviceResolver:
+    def __init__(self):
+        # 设置日志
+        logging.basicConfig(level=logging.INFO,
+                           format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        self.logger = logging.getLogger('DeviceResolver')
+
+        # 挂载点 -> (物理设备标识, 是否为机械硬盘)
+        self.cache = {}
+        self.lock = threading.Lock()
+
+        # 使用独立的kernel32实例设置函数签名，不影响ctypes.windll上的全局定义
+        self.kernel32 = self._load_kernel32() if os.name == 'nt' else None
+
+    def _load_kernel32(self):
+        kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+        kernel32.CreateFileW.restype = ctypes.c_void_p
+        kernel32.CreateFileW.argtypes = [wintypes.LPCWSTR, wintypes.DWORD, wintypes.DWORD, ctypes.c_void_p,
+                                         wintypes.DWORD, wintypes.DWORD, ctypes.c_void_p]
+        kernel32.DeviceIoControl.argtypes = [ctypes.c_void_p, wintypes.DWORD, ctypes.c_char_p, wintypes.DWORD,
+                                             ctypes.c_void_p, wintypes.DWORD, ctypes.POINTER(wintypes.DWORD),
+                                             ctypes.c_void_p]
+        kernel32.CloseHandle.argtypes = [ctypes.c_void_p]
+        kernel32.GetVolumeNameForVolumeMountPointW.argtypes = [wintypes.LPCWSTR, wintypes.LPWSTR, wintypes.DWORD]
+        return kernel32
+
+    def get_path_device(self, path):
+        """获取路径所在卷的物理设备，返回 (物理设备标识, 是否为机械硬盘)
+
+        按最长前缀匹配挂载点，结果按挂载点缓存。
+        """
+        path = os.path.normcase(os.path.abspath(path))
+        best = None
+        try:
+            partitions = psutil.disk_partitions(all=True)
+        except Exception as e:
+            self.logger.warning(f"无法获取分区列表: {e}")
+            partitions = []
+        for partition in partitions:
+            mountpoint = os.path.normcase(partition.mountpoint)
+            prefix = mountpoint if mountpoint.endswith(os.sep) else mountpoint + os.sep
+            if path == mountpoint or path.startswith(prefix):
+                if best is None or len(mountpoint) > len(os.path.normcase(best.mountpoint)):
+                    best = partition
+        if best is None:
+            # 找不到所在的卷时按未知的机械硬盘保守处理
+            return None, True
+
+        return self.get_physical_device(best.device, best.mountpoint)
+
+    def get_physical_device(self, device, mountpoint):
+        """获取卷所在的物理设备，返回 (物理设备标识, 是否为机械硬盘)，结果按挂载点缓存
+
+        无法识别时以卷设备本身作为物理设备，并按机械硬盘保守处理。
+        """
+        with self.lock:
+            cached = self.cache.get(mountpoint)
+        if cached is None:
+            cached = self._resolve_physical_device(device, mountpoint)
+            with self.lock:
+                self.cache[mountpoint] = cached
+        return cached
+
+    def _resolve_physical_device(self, device, mountpoint):
+        """查询卷所在的物理设备，不使用缓存"""
+        try:
+            if os.name == 'nt':
+                result = self._get_windows_physical_device(mountpoint)
+            else:
+                result = self._get_linux_physical_device(device, mountpoint)
+            if result is not None:
+                return result
+        except Exception as e:
+            self.logger.warning(f"无法识别 {mountpoint} 所在的物理设备: {e}")
+        return device, True
+
+    def _get_linux_physical_device(self, device, mountpoint):
+        """通过sysfs把分区、LVM和dm-crypt卷归属到底层磁盘"""
+        sys_path = None
+        if device.startswith('/dev/'):
+            candidate = os.path.join('/sys/class/block', os.path.basename(os.path.realpath(device)))
+            if os.path.exists(candidate):
+                sys_path = os.path.realpath(candidate)
+        if sys_path is None:
+            # btrfs、overlay等设备名无法直接对应时，按挂载点的设备号查找
+            st = os.stat(mountpoint)
+            candidate = f"/sys/dev/block/{os.major(st.st_dev)}:{os.minor(st.st_dev)}"
+            if not os.path.exists(candidate):
+                return None
+            sys_path = os.path.realpath(candidate)
+
+        # 设备映射和软RAID沿slaves找到底层设备，跨多个磁盘时取第一个
+        for _ in range(8):
+            slaves_dir = os.path.join(sys_path, 'slaves')
+            slaves = sorted(os.listdir(slaves_dir)) if os.path.isdir(slaves_dir) else []
+            if not slaves:
+                break
+            sys_path = os.path.realpath(os.path.join(slaves_dir, slaves[0]))
+
+        # 分区归属于其父磁盘
+        if os.path.exists(os.path.join(sys_path, 'partition')):
+            sys_path = os.path.dirname(sys_path)
+
+        rotational = True
+        try:
+            with open(os.path.join(sys_path, 'queue', 'rotational')) as f:
+                rotational = f.read().strip() == '1'
+        except OSError:
+            pass
+        return '/dev/' + os.path.basename(sys_path), rotational
+
+    def _get_windows_physical_device(self, mountpoint):
+        """通过卷的磁盘区段获取物理磁盘编号，并查询磁盘是否有寻道惩罚"""
+        mount = mountpoint if mountpoint.endswith('\\') else mountpoint + '\\'
+        name = ctypes.create_unicode_buffer(64)
+        if self.kernel32.GetVolumeNameForVolumeMountPointW(mount, name, 64):
+            volume = name.value.rstrip('\\')
+        else:
+            volume = '\\\\.\\' + os.path.splitdrive(mountpoint)[0]
+
+        extents = self._device_io_control(volume, IOCTL_VOLUME_GET_VOLUME_DISK_EXTENTS)
+        if not extents or len(extents) < 12:
+            return None
+        # VOLUME_DISK_EXTENTS: 区段数(4字节) + 对齐(4字节) + 第一个区段的DiskNumber
+        physical = f"\\\\.\\PhysicalDrive{struct.unpack_from('<I', extents, 8)[0]}"
+
+        # STORAGE_PROPERTY_QUERY: PropertyId, QueryType=PropertyStandardQuery, AdditionalParameters
+        query = struct.pack('<III', STORAGE_DEVICE_SEEK_PENALTY_PROPERTY, 0, 0)
+        # DEVICE_SEEK_PENALTY_DESCRIPTOR: Version, Size, IncursSeekPenalty
+        penalty = self._device_io_control(physical, IOCTL_STORAGE_QUERY_PROPERTY, query, 12)
+        rotational = bool(penalty[8]) if penalty and len(penalty) > 8 else True
+        return physical, rotational
+
+    def _device_io_control(self, path, code, in_buffer=None, out_size=256):
+        """对设备执行DeviceIoControl，返回输出数据，失败时返回None"""
+        kernel32 = self.kernel32
+        # 访问权限为0即可查询设备属性，无需管理员权限
+        handle = kernel32.CreateFileW(path, 0, 0x3, None, 3, 0, None)
+        if handle is None or handle == ctypes.c_void_p(-1).value:
+            return None
+        try:
+            out_buffer = ctypes.create_string_buffer(out_size)
+            returned = wintypes.DWORD(0)
+            if not kernel32.DeviceIoControl(handle, code, in_buffer, len(in_buffer) if in_buffer else 0,
+                                            out_buffer, out_size, ctypes.byref(returned), None):
+                return None
+            return out_buffer.raw[:returned.value]
+        finally:
+            kernel32.CloseHandle(handle)
@@ -1,9 +1,64 @@
 import os
+import stat
+import mmap
+import heapq
+import hashlib
+import sqlite3
 import logging
 import psutil
 from pathlib import Path
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from modules.file_walker import FileWalker
+from modules.size_index import SizeIndex
+from modules.compact_tree import CompactTree, NO_NODE, FLAG_DIR
+from modules.file_cube import FileCube
+from modules.fs_watcher import FsWatcher
+from modules.snapshot_store import SnapshotStore
+from modules.result_exporter import ResultExporter
+from modules.device_info import DeviceResolver
+from modules.io_throttle import lower_current_thread_priority, DEFAULT_MAX_UTILIZATION
+
+# 重复文件查找时部分哈希读取的首尾字节数
+PARTIAL_HASH_BYTES = 64 * 1024
+
+# 目录分析写入检查点的间隔（秒）
+CHECKPOINT_INTERVAL = 10
+
+# 各类结果导出为CSV时的列
+TREE_EXPORT_FIELDS = ('path', 'is_dir', 'depth', 'size', 'allocated', 'mtime', 'atime')
+LARGE_FILE_EXPORT_FIELDS = ('rank', 'path', 'size')
+DUPLICATE_EXPORT_FIELDS = ('group', 'size', 'allocated', 'hash', 'reclaimable', 'path')
+
+def _hash_file_partial(path, size):
+    """计算文件首尾各64KiB的哈希"""
+    try:
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            digest.update(f.read(PARTIAL_HASH_BYTES))
+            if size > PARTIAL_HASH_BYTES * 2:
+                f.seek(size - PARTIAL_HASH_BYTES)
+                digest.update(f.read(PARTIAL_HASH_BYTES))
+            elif size > PARTIAL_HASH_BYTES:
+                digest.update(f.read())
+        return path, digest.hexdigest()
+    except (PermissionError, FileNotFoundError, OSError):
+        return path, None
+
+def _hash_file_full(path):
+    """通过mmap计算文件完整内容的哈希，在子进程中执行"""
+    try:
+        digest = hashlib.blake2b()
+        with open(path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                # 分块更新，避免一次性触发整个映射的缺页
+                chunk = 8 * 1024 * 1024
+                for offset in range(0, len(mapped), chunk):
+                    digest.update(mapped[offset:offset + chunk])
+        return path, digest.hexdigest()
+    except (PermissionError, FileNotFoundError, OSError, ValueError):
+        return path, None
 
 class DiskAnalyzer:
     def __init__(self):
@@ -14,10 +69,45 @@ class DiskAnalyzer:
         
         # 分析结果
         self.analysis_results = {}
+        self.analysis_tree = None
+        self.analysis_root = None
         self.analysis_in_progress = False
         self.analysis_progress = 0
+        # 已处理的条目数（文件和子目录），多卷分析时为所有卷之和
+        self.analysis_entries = 0
         self.analysis_cancel = False
         
+        # 共享的并行目录遍历器
+        self.walker = FileWalker()
+        
+        # 识别卷所在的物理设备
+        self.device_resolver = DeviceResolver()
+        
+        # 持久化的目录大小索引，用于增量重新分析
+        self.size_index = SizeIndex()
+        self.use_index = True
+        
+        # 多卷分析：每个卷的目录树、每个物理设备的遍历器
+        self.volume_trees = {}
+        self.volume_walkers = []
+        self.volume_lock = threading.Lock()
+        
+        # 按分析根目录保存的扩展名、年龄和所有者汇总
+        self.analysis_cubes = {}
+        
+        # 分析完成后的文件系统监视器：分析根目录 -> FsWatcher
+        self.watchers = {}
+        # 监视器增量更新分析树时与查询互斥
+        self.tree_lock = threading.RLock()
+        # 监视器扫描新出现目录时使用的遍历器，不受分析取消的影响
+        self.watch_walker = FileWalker()
+        
+        # 分析结果快照，用于比较两次分析之间的变化
+        self.snapshot_store = SnapshotStore()
+        
+        # 流式导出分析结果
+        self.exporter = ResultExporter()
+        
     def get_disk_info(self):
         """获取所有磁盘信息"""
         try:
@@ -28,6 +118,7 @@ class DiskAnalyzer:
                     continue
                     
                 usage = psutil.disk_usage(partition.mountpoint)
+                physical_device, rotational = self._get_physical_device(partition.device, partition.mountpoint)
                 disks.append({
                     'device': partition.device,
                     'mountpoint': partition.mountpoint,
@@ -35,7 +126,9 @@ class DiskAnalyzer:
                     'total': usage.total,
                     'used': usage.used,
                     'free': usage.free,
-                    'percent': usage.percent
+                    'percent': usage.percent,
+                    'physical_device': physical_device,
+                    'rotational': rotational
                 })
                 
             return disks
@@ -43,8 +136,16 @@ class DiskAnalyzer:
             self.logger.error(f"获取磁盘信息时出错: {e}")
             return []
             
-    def analyze_directory_size(self, directory, callback=None):
-        """分析目录大小"""
+    def _get_physical_device(self, device, mountpoint):
+        """获取卷所在的物理设备，返回 (物理设备标识, 是否为机械硬盘)，结果按挂载点缓存"""
+        return self.device_resolver.get_physical_device(device, mountpoint)
+        
+    def analyze_directory_size(self, directory, callback=None, use_index=None, resume=False):
+        """分析目录大小
+
+        use_index为True时，元数据未变化的目录直接复用索引中的结果而不重新枚举。
+        resume为True且存在该目录的检查点时，从检查点恢复已扫描的部分，只遍历尚未扫描的目录。
+        """
         try:
             if not os.path.exists(directory) or not os.path.isdir(directory):
                 return {
@@ -52,20 +153,31 @@ class DiskAnalyzer:
                     'error': f"目录不存在或不是有效目录: {directory}"
                 }
                 
+            self.stop_watching()
             self.analysis_results = {}
+            self.analysis_tree = None
+            self.analysis_root = None
+            self.volume_trees = {}
+            self.volume_walkers = []
+            self.analysis_cubes = {}
             self.analysis_in_progress = True
             self.analysis_progress = 0
+            self.analysis_entries = 0
             self.analysis_cancel = False
+            self.walker.reset()
             
+            if use_index is None:
+                use_index = self.use_index
+                
             # 在新线程中运行分析
             thread = threading.Thread(target=self._analyze_directory_thread, 
-                                     args=(directory, callback))
+                                     args=(directory, callback, use_index, resume))
             thread.daemon = True
             thread.start()
             
             return {
                 'success': True,
-                'message': f"开始分析目录: {directory}"
+                'message': f"{'继续' if resume else '开始'}分析目录: {directory}"
             }
         except Exception as e:
             self.logger.error(f"分析目录大小时出错: {e}")
@@ -74,45 +186,185 @@ class DiskAnalyzer:
                 'error': str(e)
             }
             
-    def _analyze_directory_thread(self, directory, callback):
-        """在线程中运行目录分析"""
-        try:
-            # 获取目录中的所有项目
-            items = os.listdir(directory)
-            total_items = len(items)
-            processed_items = 0
+    def resume_directory_analysis(self, directory, callback=None, use_index=None):
+        """从检查点继续被中断的目录分析，没有检查点时重新开始"""
+        return self.analyze_directory_size(directory, callback, use_index, resume=True)
+        
+    def get_analysis_checkpoint(self, directory):
+        """获取目录未完成分析的检查点概况，没有检查点时返回None"""
+        return self.size_index.get_checkpoint_info(directory)
+        
+    def discard_analysis_checkpoint(self, directory):
+        """丢弃目录未完成分析的检查点"""
+        return self.size_index.clear_checkpoint(directory)
             
-            # 分析每个项目
-            for item in items:
-                if self.analysis_cancel:
-                    break
-                    
-                item_path = os.path.join(directory, item)
-                try:
-                    if os.path.isdir(item_path):
-                        # 如果是目录，递归计算大小
-                        size = self._get_dir_size(item_path)
-                    else:
-                        # 如果是文件，直接获取大小
-                        size = os.path.getsize(item_path)
-                        
-                    self.analysis_results[item] = {
-                        'path': item_path,
-                        'size': size,
-                        'is_dir': os.path.isdir(item_path)
+    def analyze_all_volumes(self, callback=None, use_index=None, mountpoints=None, volume_callback=None):
+        """并发分析所有卷
+
+        按物理设备对get_disk_info中的卷分组，每个物理设备一个工作线程：同一设备上的卷依次分析，
+        不同设备之间并行。机械硬盘上的卷使用单线程遍历，避免磁头来回寻道。
+        mountpoints可限定要分析的挂载点。callback接收按已用空间加权的总进度，
+        volume_callback接收 (挂载点, 进度)。
+        """
+        try:
+            disks = self.get_disk_info()
+            if mountpoints is not None:
+                disks = [disk for disk in disks if disk['mountpoint'] in mountpoints]
+            if not disks:
+                return {
+                    'success': False,
+                    'error': "没有可分析的卷"
+                }
+                
+            self.analysis_results = {
+                'volumes': {
+                    disk['mountpoint']: {
+                        'device': disk['device'],
+                        'physical_device': disk['physical_device'],
+                        'rotational': disk['rotational'],
+                        'used': disk['used'],
+                        'status': 'pending',
+                        'progress': 0,
+                        'size': 0,
+                        'allocated': 0,
+                        'items': {}
                     }
-                except (PermissionError, FileNotFoundError) as e:
-                    self.logger.warning(f"无法访问 {item_path}: {e}")
-                    
-                processed_items += 1
-                self.analysis_progress = (processed_items / total_items) * 100
+                    for disk in disks
+                }
+            }
+            self.stop_watching()
+            self.analysis_tree = None
+            self.analysis_root = None
+            self.volume_trees = {}
+            self.volume_walkers = []
+            self.analysis_cubes = {}
+            self.analysis_in_progress = True
+            self.analysis_progress = 0
+            self.analysis_entries = 0
+            self.analysis_cancel = False
+            self.walker.reset()
+            
+            if use_index is None:
+                use_index = self.use_index
                 
-                if callback:
-                    callback(self.analysis_progress)
+            # 在新线程中运行分析
+            thread = threading.Thread(target=self._analyze_volumes_thread,
+                                     args=(disks, callback, use_index, volume_callback))
+            thread.daemon = True
+            thread.start()
+            
+            devices = len({disk['physical_device'] for disk in disks})
+            return {
+                'success': True,
+                'message': f"开始分析 {len(disks)} 个卷（{devices} 个物理设备）"
+            }
+        except Exception as e:
+            self.logger.error(f"分析所有卷时出错: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+            
+    def _analyze_volumes_thread(self, disks, callback, use_index, volume_callback=None):
+        """在线程中按物理设备并行分析多个卷"""
+        try:
+            groups = {}
+            for disk in disks:
+                groups.setdefault(disk['physical_device'], []).append(disk)
+                
+            # 其他卷的挂载点不在当前卷中遍历，嵌套挂载的卷只计入自己
+            all_mountpoints = {partition.mountpoint for partition in psutil.disk_partitions(all=True)}
+            
+            with ThreadPoolExecutor(max_workers=len(groups), thread_name_prefix='VolumeAnalyzer') as executor:
+                futures = [
+                    executor.submit(self._analyze_device_volumes, volumes, all_mountpoints,
+                                    callback, use_index, volume_callback)
+                    for volumes in groups.values()
+                ]
+                for future in futures:
+                    future.result()
                     
-            # 按大小排序结果
-            self.analysis_results = dict(sorted(self.analysis_results.items(), 
-                                              key=lambda x: x[1]['size'], reverse=True))
+            if not self.analysis_cancel:
+                self.analysis_progress = 100
+            self.analysis_in_progress = False
+            
+            if callback:
+                callback(100)  # 完成
+        except Exception as e:
+            self.logger.error(f"分析所有卷线程出错: {e}")
+            self.analysis_in_progress = False
+            
+    def _analyze_device_volumes(self, volumes, all_mountpoints, callback, use_index, volume_callback=None):
+        """依次分析同一物理设备上的卷"""
+        walker = FileWalker(max_workers=1 if volumes[0]['rotational'] else None)
+        # 与共享遍历器使用同一个节流器，后台模式下所有卷按同一磁盘利用率目标调节
+        walker.throttle = self.walker.throttle
+        with self.volume_lock:
+            self.volume_walkers.append(walker)
+            # 注册前已请求的暂停或取消同样作用于新的遍历器
+            if self.walker.is_cancelled():
+                walker.cancel()
+            elif self.walker.is_paused():
+                walker.pause()
+                
+        for disk in volumes:
+            mountpoint = disk['mountpoint']
+            info = self.analysis_results['volumes'][mountpoint]
+            if walker.is_cancelled():
+                info['status'] = 'cancelled'
+                continue
+                
+            info['status'] = 'running'
+            report = lambda progress, mountpoint=mountpoint: self._update_volume_progress(
+                mountpoint, progress, callback, volume_callback)
+            try:
+                tree, cube = self._build_directory_tree(mountpoint, report, use_index, walker=walker,
+                                                        excluded_dirs=all_mountpoints - {mountpoint})
+            except Exception as e:
+                self.logger.error(f"分析卷 {mountpoint} 时出错: {e}")
+                info['status'] = 'error'
+                continue
+                
+            self.volume_trees[mountpoint] = tree
+            self.analysis_cubes[mountpoint] = cube
+            info['size'] = tree.size[0]
+            info['allocated'] = tree.allocated[0]
+            info['items'] = self._get_node_children(tree, 0)
+            if walker.is_cancelled():
+                info['status'] = 'cancelled'
+            else:
+                info['status'] = 'done'
+                report(100)
+                
+    def _update_volume_progress(self, mountpoint, progress, callback=None, volume_callback=None):
+        """更新单个卷的进度，并按已用空间加权合并为总进度"""
+        with self.volume_lock:
+            volumes = self.analysis_results['volumes']
+            volumes[mountpoint]['progress'] = progress
+            weights = {key: max(1, info['used']) for key, info in volumes.items()}
+            overall = sum(volumes[key]['progress'] * weight for key, weight in weights.items())
+            self.analysis_progress = min(99, overall / sum(weights.values()))
+            
+        if volume_callback:
+            volume_callback(mountpoint, progress)
+        if callback:
+            callback(self.analysis_progress)
+            
+    def _analyze_directory_thread(self, directory, callback, use_index=False, resume=False):
+        """在线程中运行目录分析"""
+        def report(progress):
+            self.analysis_progress = progress
+            if callback:
+                callback(progress)
+                
+        try:
+            tree, cube = self._build_directory_tree(directory, report, use_index, resume)
+            self.analysis_root = directory
+            self.analysis_tree = tree
+            self.analysis_cubes[directory] = cube
+            
+            # 根目录一层的结果保持原有格式
+            self.analysis_results = self._get_node_children(tree, 0)
                                               
             self.analysis_in_progress = False
             
@@ -122,36 +374,384 @@ class DiskAnalyzer:
             self.logger.error(f"分析目录线程出错: {e}")
             self.analysis_in_progress = False
             
-    def _get_dir_size(self, directory):
-        """递归获取目录大小"""
-        total_size = 0
+    def _build_directory_tree(self, directory, callback=None, use_index=False, resume=False,
+                              walker=None, excluded_dirs=None):
+        """单次遍历构建紧凑目录树，并自底向上汇总每个目录的大小，返回 (目录树, 文件汇总)
+
+        文件汇总按扩展名、年龄和所有者统计，在同一次遍历中计算。遍历期间定期把新扫描完成的目录和待扫描目录写入检查点，取消时也会写入，
+        以便之后通过resume从中断处继续；遍历完整结束后删除检查点。
+        walker默认为共享遍历器；excluded_dirs中的子目录（如其他卷的挂载点）不会被遍历。
+        callback接收估算的进度百分比。
+        """
+        if walker is None:
+            walker = self.walker
+        tree = CompactTree(directory)
+        cube = FileCube()
+        # 已发现但尚未扫描的目录：路径 -> 节点索引
+        pending = {directory: 0}
+        # 每个目录的元数据 (索引, mtime_ns, file_id, 直接文件大小, 直接文件占用, 是否复用索引)，用于写回索引
+        dir_meta = []
+        # 自上次写入检查点以来扫描完成的目录
+        checkpoint_rows = []
+        cached_dirs = 0
+        discovered_dirs = 1
+        processed_dirs = 0
+        # 已处理的条目数（文件和子目录），超大目录分批产出时进度也随之推进
+        processed_entries = 0
+        reported_entries = 0
+        last_callback = 0
+        last_checkpoint = time.time()
+        start = None
+        
+        checkpoint = self.size_index.load_checkpoint(directory) if resume else None
+        if checkpoint:
+            # 按扫描顺序重放检查点中的目录，父目录总是先于子目录
+            records, pending_paths = checkpoint
+            for record in records:
+                result = self._result_from_record(record['path'], record)
+                # 检查点中的目录不在索引中，分析结束后需要写回
+                result['cached'] = False
+                if self._add_scan_result(tree, cube, pending, result, dir_meta if use_index else None) != NO_NODE:
+                    discovered_dirs += len(result['subdirs'])
+                    if not result.get('partial'):
+                        processed_dirs += 1
+            start = [path for path in pending_paths if path in pending]
+            self.logger.info(f"从检查点恢复分析 {directory}: 已扫描 {processed_dirs} 个目录，"
+                             f"剩余 {len(start)} 个目录")
+        else:
+            # 重新开始的分析使旧检查点失效
+            self.size_index.clear_checkpoint(directory)
+        
+        scanner = walker.scan_directory
+        cached = {}
+        if use_index:
+            cached = self.size_index.load(directory)
+            scanner = lambda path, collect_files, emit=None: self._scan_with_index(path, collect_files, cached,
+                                                                                   walker, emit)
+        if excluded_dirs:
+            scanner = self._exclude_subdirs(scanner, excluded_dirs)
+        
+        for result in walker.walk(directory, collect_files=True, scanner=scanner, start=start):
+            if result.get('incomplete'):
+                # 因取消而中断的目录保留在待扫描列表中，恢复时重新扫描
+                continue
+            index = self._add_scan_result(tree, cube, pending, result, dir_meta if use_index else None)
+            if index == NO_NODE:
+                continue
+            checkpoint_rows.append(self._checkpoint_row(result))
+            discovered_dirs += len(result['subdirs'])
+            processed_entries += len(result['file_entries']) + len(result['subdirs'])
+            if not result.get('partial'):
+                if result.get('cached'):
+                    cached_dirs += 1
+                processed_dirs += 1
+            
+            now = time.time()
+            if now - last_callback >= 0.1:
+                last_callback = now
+                reported_entries = self._add_analysis_entries(processed_entries, reported_entries)
+                if callback:
+                    # 已发现目录数随遍历增长，进度为估算值
+                    callback(min(99, (processed_dirs / discovered_dirs) * 100))
+            if now - last_checkpoint >= CHECKPOINT_INTERVAL:
+                last_checkpoint = now
+                self.size_index.save_checkpoint(directory, checkpoint_rows, pending)
+                checkpoint_rows = []
+                
+        self._add_analysis_entries(processed_entries, reported_entries)
+        if walker.is_cancelled():
+            # 保存到取消为止的进度
+            self.size_index.save_checkpoint(directory, checkpoint_rows, pending)
+            self.logger.info(f"分析 {directory} 已取消，检查点中剩余 {len(pending)} 个目录")
+        else:
+            self.size_index.clear_checkpoint(directory)
+                
+        # 自底向上汇总目录大小，文件大小已计入所在目录
+        tree.rollup(dirs_only=True)
+        tree.compact()
+        cube.rollup(tree)
+            
+        # 只有完整的遍历才写回索引，避免把部分结果当作缓存
+        if use_index and not walker.is_cancelled():
+            self.logger.info(f"分析 {directory}: {len(dir_meta)} 个目录，其中 {cached_dirs} 个复用索引")
+            self._save_index(tree, dir_meta, cached, excluded_dirs)
+            
+        return tree, cube
+        
+    def _add_analysis_entries(self, processed, reported):
+        """把本次遍历新处理的条目数计入总数，返回已计入的条目数"""
+        with self.volume_lock:
+            self.analysis_entries += processed - reported
+        return processed
+        
+    def _add_scan_result(self, tree, cube, pending, result, dir_meta=None):
+        """把单个目录的一批扫描结果加入目录树和文件汇总，返回目录的节点索引，不属于本次遍历时返回NO_NODE
+
+        目录在最后一批（不带partial标记）加入后才从待扫描列表中移除。
+        """
+        if result.get('partial'):
+            index = pending.get(result['path'])
+        else:
+            index = pending.pop(result['path'], None)
+        if index is None:
+            return NO_NODE
+            
+        # 目录自身直接包含的文件（硬链接已由遍历器去重）
+        tree.add_size(index, result['size'], result['allocated'])
+        duplicates = set(result.get('duplicates', ()))
+        if dir_meta is not None and result.get('mtime_ns'):
+            # 分批扫描的目录此时已累加了所有批次的直接文件大小
+            dir_meta.append((index, result['mtime_ns'], result['file_id'],
+                             tree.size[index], tree.allocated[index], bool(result.get('cached'))))
+        for name, st, allocated in result['file_entries']:
+            # 文件大小已计入目录自身，文件节点不再参与汇总；未计入目录的重复硬链接按0字节记录
+            tree.add_node(index, name, st.st_size, allocated, st.st_mtime, atime=st.st_atime, uid=st.st_uid,
+                          linked=name in duplicates)
+        cube.add(index, cube.aggregate_entries(result['path'], result['file_entries'], duplicates))
+            
+        for subdir in result['subdirs']:
+            pending[subdir] = tree.add_node(index, os.path.basename(subdir), is_dir=True)
+        return index
+        
+    def _checkpoint_row(self, result):
+        """将单个目录的一批扫描结果转换为检查点记录"""
+        duplicates = set(result.get('duplicates', ()))
+        return (
+            result['path'],
+            result.get('batch', 0),
+            bool(result.get('partial')),
+            result.get('mtime_ns', 0),
+            result.get('file_id', 0),
+            result['size'],
+            result['allocated'],
+            [(name, st.st_size, allocated, st.st_mtime, st.st_atime, st.st_uid, int(name in duplicates))
+             for name, st, allocated in result['file_entries']],
+            [os.path.basename(subdir) for subdir in result['subdirs']]
+        )
+        
+    def _result_from_record(self, directory, record):
+        """将索引或检查点中的目录记录还原为与scan_directory相同格式的扫描结果"""
+        files, subdir_names, duplicates = self.size_index.decode_entries(record)
+        result = {
+            'path': directory,
+            'size': record['own_size'],
+            'allocated': record['own_allocated'],
+            'files': len(files),
+            'subdirs': [os.path.join(directory, name) for name in subdir_names],
+            'file_entries': files,
+            'linked': [],
+            'duplicates': duplicates,
+            'errors': 0,
+            'mtime_ns': record['mtime_ns'],
+            'file_id': record['file_id'],
+            'batch': record.get('batch', 0)
+        }
+        if record.get('partial'):
+            result['partial'] = True
+        return result
+        
+    def _scan_with_index(self, directory, collect_files, cached, walker=None, emit=None):
+        """扫描单个目录，目录的mtime和文件ID未变化时复用索引记录
+
+        重新扫描时emit的含义同FileWalker.scan_directory，目录元数据只附加在最后一批结果上。
+        """
+        if walker is None:
+            walker = self.walker
         try:
-            for dirpath, dirnames, filenames in os.walk(directory):
-                for f in filenames:
-                    try:
-                        fp = os.path.join(dirpath, f)
-                        if os.path.exists(fp):
-                            total_size += os.path.getsize(fp)
-                    except (PermissionError, FileNotFoundError) as e:
-                        self.logger.warning(f"无法访问文件 {fp}: {e}")
-        except Exception as e:
-            self.logger.warning(f"获取目录 {directory} 大小时出错: {e}")
+            # 先取目录元数据再枚举，枚举期间的修改会在下次分析时被发现
+            st = os.stat(directory)
+        except OSError as e:
+            self.logger.warning(f"无法访问目录 {directory}: {e}")
+            return walker.scan_directory(directory, collect_files, emit)
+            
+        record = cached.get(directory)
+        if record and record['mtime_ns'] == st.st_mtime_ns and record['file_id'] == st.st_ino:
+            result = self._result_from_record(directory, record)
+            result['cached'] = True
+            return result
+            
+        result = walker.scan_directory(directory, collect_files, emit)
+        result['mtime_ns'] = st.st_mtime_ns
+        result['file_id'] = st.st_ino
+        return result
+        
+    def _exclude_subdirs(self, scanner, excluded_dirs):
+        """包装目录扫描函数，从结果中剔除excluded_dirs中的子目录"""
+        def exclude(result):
+            result['subdirs'] = [subdir for subdir in result['subdirs'] if subdir not in excluded_dirs]
+            return result
+            
+        def scan(directory, collect_files, emit=None):
+            # 分批产出的部分结果同样剔除
+            batch_emit = (lambda partial: emit(exclude(partial))) if emit is not None else None
+            return exclude(scanner(directory, collect_files, batch_emit))
+        return scan
+        
+    def _save_index(self, tree, dir_meta, cached, excluded_dirs=None):
+        """将本次分析的变化写回索引
+
+        只有重新扫描的目录写入完整记录；复用索引的目录内容未变，只在子树总大小变化时更新总大小；
+        索引中本次没有遍历到的目录（已删除或无法访问）被删除，被排除的子目录（如其他卷）的记录保留。
+        """
+        rows = []
+        totals = []
+        seen = set()
+        for index, mtime_ns, file_id, own_size, own_allocated, from_index in dir_meta:
+            path = tree.get_path(index)
+            seen.add(path)
+            if from_index:
+                record = cached[path]
+                if record['total_size'] != tree.size[index] or record['total_allocated'] != tree.allocated[index]:
+                    totals.append((path, tree.size[index], tree.allocated[index]))
+                continue
+                
+            files = []
+            subdirs = []
+            for child in tree.children(index):
+                if tree.is_dir(child):
+                    subdirs.append(tree.get_name(child))
+                else:
+                    files.append((tree.get_name(child), tree.size[child], tree.allocated[child],
+                                  tree.mtime[child], tree.atime[child], tree.uid[child], int(tree.is_linked(child))))
+            rows.append((
+                path,
+                mtime_ns,
+                file_id,
+                own_size,
+                tree.size[index],
+                own_allocated,
+                tree.allocated[index],
+                files,
+                subdirs
+            ))
+            
+        # 只有位于根目录之下的排除目录会出现在索引的子树中
+        root_prefix = os.path.join(tree.root_path, '')
+        excluded = {path for path in excluded_dirs or () if path.startswith(root_prefix) and path != tree.root_path}
+        excluded_prefixes = tuple(os.path.join(path, '') for path in excluded)
+        removed = [path for path in cached
+                   if path not in seen and path not in excluded and not path.startswith(excluded_prefixes)]
+        self.logger.info(f"写回索引 {tree.root_path}: {len(rows)} 个目录重新扫描，"
+                         f"{len(totals)} 个目录更新总大小，{len(removed)} 个目录已删除")
+        self.size_index.save(rows, totals, removed)
+        
+    def invalidate_index(self, directory=None):
+        """使目录大小索引失效，directory为空时清空全部索引"""
+        return self.size_index.invalidate(directory)
+        
+    def rebuild_index(self, directory, callback=None):
+        """丢弃目录的索引并完整重新分析"""
+        self.invalidate_index(directory)
+        return self.analyze_directory_size(directory, callback, use_index=True)
+        
+    def _find_node(self, path):
+        """在分析树或各卷的目录树中查找路径，返回 (目录树, 节点索引)"""
+        trees = [self.analysis_tree] if self.analysis_tree is not None else []
+        # 嵌套挂载时优先匹配挂载点最深的卷
+        trees += sorted(self.volume_trees.values(), key=lambda tree: len(tree.root_path), reverse=True)
+        for tree in trees:
+            index = tree.find(path)
+            if index != NO_NODE:
+                return tree, index
+        return None, NO_NODE
+        
+    def _get_node_children(self, tree, index, limit=None):
+        """获取节点的子项，按大小降序排列"""
+        results = {}
+        for child in tree.sorted_children(index, limit):
+            results[tree.get_name(child)] = tree.get_info(child)
+        return results
             
-        return total_size
+    def _get_dir_size(self, directory):
+        """递归获取目录大小"""
+        return self.walker.get_size(directory)
+        
+    def _get_walkers(self):
+        """获取共享遍历器和多卷分析中各物理设备的遍历器"""
+        with self.volume_lock:
+            return [self.walker] + self.volume_walkers
+        
+    def set_background_mode(self, enabled, max_utilization=DEFAULT_MAX_UTILIZATION):
+        """开启或关闭后台分析模式
+
+        后台模式下遍历和哈希的工作线程以最低的CPU和I/O优先级运行，并根据磁盘利用率和延迟
+        自适应地放慢遍历，使磁盘利用率不超过max_utilization（0到1）。对之后开始的分析生效。
+        """
+        self.walker.set_background(enabled, max_utilization)
+        # 监视器和多卷分析的遍历器共享同一个节流器
+        self.watch_walker.set_background(enabled, throttle=self.walker.throttle)
+        
+    def get_background_status(self):
+        """获取后台模式的状态，未开启时返回None"""
+        if self.walker.throttle is None:
+            return None
+        return self.walker.throttle.get_status()
         
     def cancel_analysis(self):
-        """取消正在进行的分析"""
+        """取消正在进行的分析，工作线程在处理完当前条目后立即停止"""
         self.analysis_cancel = True
+        for walker in self._get_walkers():
+            walker.cancel()
+        
+    def pause_analysis(self):
+        """暂停正在进行的分析"""
+        if self.analysis_in_progress:
+            for walker in self._get_walkers():
+                walker.pause()
+            
+    def resume_analysis(self):
+        """继续已暂停的分析"""
+        for walker in self._get_walkers():
+            walker.resume()
         
     def get_analysis_progress(self):
-        """获取分析进度"""
-        return {
+        """获取分析进度，多卷分析时包含每个卷的状态和进度"""
+        progress = {
             'in_progress': self.analysis_in_progress,
-            'progress': self.analysis_progress
+            'progress': self.analysis_progress,
+            'entries': self.analysis_entries,
+            'paused': self.analysis_in_progress and self.walker.is_paused()
         }
+        if 'volumes' in self.analysis_results:
+            progress['volumes'] = {
+                mountpoint: {'status': info['status'], 'progress': info['progress']}
+                for mountpoint, info in self.analysis_results['volumes'].items()
+            }
+        return progress
+        
+    def get_file_summary(self, path=None, group_by='extension', mtime_older_than=None, atime_older_than=None,
+                         extensions=None, owners=None, limit=None):
+        """按扩展名、年龄或所有者汇总分析树中某个目录的整个子树，无需重新遍历磁盘
+
+        path为空时汇总分析根目录。例如group_by='extension', mtime_older_than=365
+        返回一年以上未修改的文件按类型的占用排行。参数含义见FileCube.summarize。
+        """
+        if path is None:
+            path = self.analysis_root
+        if path is None:
+            return []
+        with self.tree_lock:
+            tree, index = self._find_node(path)
+            if index == NO_NODE or not tree.is_dir(index):
+                return []
+            cube = self.analysis_cubes.get(tree.root_path)
+            if cube is None:
+                return []
+            return cube.summarize(index, group_by, mtime_older_than, atime_older_than, extensions, owners, limit)
         
-    def get_analysis_results(self, limit=None):
-        """获取分析结果"""
+    def get_analysis_results(self, limit=None, path=None):
+        """获取分析结果
+
+        path为空时返回分析根目录一层的结果；否则返回分析树中该子目录的结果，
+        无需重新遍历磁盘。
+        """
+        if path is not None:
+            with self.tree_lock:
+                tree, index = self._find_node(path)
+                if index == NO_NODE or not tree.is_dir(index):
+                    return {}
+                return self._get_node_children(tree, index, limit)
+            
         if limit:
             # 返回前N个最大的项目
             results = {}
@@ -163,8 +763,387 @@ class DiskAnalyzer:
         else:
             return self.analysis_results
             
-    def find_large_files(self, directory, min_size_mb=100, callback=None):
-        """查找大文件"""
+    def start_watching(self, callback=None, batch_interval=1.0, backend=None):
+        """监视已分析的目录，把文件系统变化增量应用到分析树，无需重新扫描
+
+        一段时间内的突发事件合并为一批处理。callback在每批变化应用后接收本批涉及的路径数。
+        多卷分析时每个卷各有一个监视器。backend见FsWatcher。
+        """
+        if self.analysis_in_progress:
+            return {
+                'success': False,
+                'error': "分析进行中，无法开始监视"
+            }
+            
+        self.stop_watching()
+        trees = [self.analysis_tree] if self.analysis_tree is not None else list(self.volume_trees.values())
+        if not trees:
+            return {
+                'success': False,
+                'error': "没有可监视的分析结果"
+            }
+            
+        try:
+            for tree in trees:
+                with self.tree_lock:
+                    directories = [tree.get_path(index) for index in tree.filter(dirs_only=True)]
+                on_changes = lambda changes, tree=tree: self._apply_fs_changes(tree, changes, callback)
+                watcher = FsWatcher(tree.root_path, directories, on_changes, batch_interval, backend)
+                watcher.start()
+                self.watchers[tree.root_path] = watcher
+        except Exception as e:
+            self.logger.error(f"启动文件系统监视时出错: {e}")
+            self.stop_watching()
+            return {
+                'success': False,
+                'error': str(e)
+            }
+            
+        return {
+            'success': True,
+            'message': f"开始监视 {len(trees)} 个目录树"
+        }
+        
+    def stop_watching(self):
+        """停止所有文件系统监视器"""
+        watchers = self.watchers
+        self.watchers = {}
+        for watcher in watchers.values():
+            watcher.stop()
+            
+    def is_watching(self):
+        """检查是否正在监视分析结果"""
+        return bool(self.watchers)
+        
+    def _apply_fs_changes(self, tree, changes, callback=None):
+        """在监视器的分发线程中把一批变化应用到分析树和文件汇总"""
+        cube = self.analysis_cubes.get(tree.root_path)
+        watcher = self.watchers.get(tree.root_path)
+        
+        with self.tree_lock:
+            if changes['overflow']:
+                self.logger.warning(f"{tree.root_path} 的变化事件溢出，重新核对整个目录树")
+                self._reconcile_directory(tree, cube, watcher, 0, recursive=True)
+            else:
+                # 路径短的先处理，同一批中新建目录里的文件能找到已加入树的父目录；
+                # 每个路径单独处理，一个路径出错不影响同一批中的其他变化
+                for path in sorted(changes['entries'], key=len):
+                    if path == tree.root_path:
+                        continue
+                    parent = tree.find(os.path.dirname(path))
+                    if parent != NO_NODE and tree.is_dir(parent):
+                        self._apply_entry_change(self._refresh_child, tree, cube, watcher, parent, path)
+                for directory in sorted(changes['directories'], key=len):
+                    index = tree.find(directory)
+                    if index != NO_NODE and tree.is_dir(index):
+                        self._reconcile_directory(tree, cube, watcher, index)
+                        
+            # 刷新根目录一层的结果
+            if tree is self.analysis_tree:
+                self.analysis_results = self._get_node_children(tree, 0)
+            for mountpoint, volume_tree in self.volume_trees.items():
+                if volume_tree is tree:
+                    info = self.analysis_results['volumes'][mountpoint]
+                    info['size'] = tree.size[0]
+                    info['allocated'] = tree.allocated[0]
+                    info['items'] = self._get_node_children(tree, 0)
+                    
+        if callback:
+            callback(len(changes['entries']) + len(changes['directories']))
+            
+    def _refresh_child(self, tree, cube, watcher, parent, path, child=None):
+        """按磁盘上的当前状态刷新目录下的单个条目：新增、更新大小或移除"""
+        if child is None:
+            child = tree.find_child(parent, os.path.basename(path))
+        try:
+            st = os.stat(path, follow_symlinks=False)
+        except FileNotFoundError:
+            st = None
+        except OSError as e:
+            self.logger.warning(f"无法访问 {path}: {e}")
+            return
+            
+        if child != NO_NODE and (st is None or tree.is_dir(child) != stat.S_ISDIR(st.st_mode)):
+            self._remove_tree_node(tree, cube, watcher, child, path)
+            child = NO_NODE
+        if st is None:
+            return
+            
+        if stat.S_ISDIR(st.st_mode):
+            # 已有目录的内容变化由其中条目各自的事件处理；新挂载的卷不计入
+            if child == NO_NODE and not os.path.ismount(path):
+                self._add_tree_subtree(tree, cube, watcher, parent, path)
+            return
+            
+        if child != NO_NODE:
+            # 未计入目录大小的重复硬链接只更新元数据，增减的都是已计入的字节数
+            counted = not tree.is_linked(child)
+            if tree.size[child] == (st.st_size if counted else 0) and tree.mtime[child] == st.st_mtime:
+                return
+            if cube is not None and counted:
+                cube.apply_delta(tree, parent, {cube.get_file_key(tree, child, path): [tree.size[child], 1]}, sign=-1)
+            allocated = self.walker.get_allocated_size(path, st)
+            tree.update_file(child, st.st_size, allocated, st.st_mtime, st.st_atime, st.st_uid)
+        else:
+            counted = True
+            allocated = self.walker.get_allocated_size(path, st)
+            child = tree.add_node(parent, os.path.basename(path), st.st_size, allocated, st.st_mtime,
+                                  atime=st.st_atime, uid=st.st_uid)
+            tree.add_delta(parent, st.st_size, allocated)
+        if cube is not None and counted:
+            cube.apply_delta(tree, parent, {cube.get_file_key(tree, child, path): [st.st_size, 1]})
+            
+    def _remove_tree_node(self, tree, cube, watcher, index, path):
+        """从分析树和文件汇总中移除已不存在的条目"""
+        is_dir = tree.is_dir(index)
+        if cube is not None and not is_dir and not tree.is_linked(index):
+            cube.apply_delta(tree, tree.parent[index], {cube.get_file_key(tree, index, path): [tree.size[index], 1]},
+                             sign=-1)
+        removed_dirs = tree.remove_node(index)
+        if cube is not None and is_dir:
+            cube.remove_subtree(tree, index, removed_dirs)
+        if watcher is not None and is_dir:
+            watcher.remove_directory(path)
+            
+    def _add_tree_subtree(self, tree, cube, watcher, parent, path):
+        """扫描新出现的目录，把整个子树加入分析树和文件汇总"""
+        start = tree.add_node(parent, os.path.basename(path), is_dir=True)
+        pending = {path: start}
+        
+        def scanner(directory, collect_files, emit=None):
+            # 先注册监视再枚举，枚举期间的新文件不会遗漏
+            if watcher is not None:
+                watcher.add_directory(directory)
+            return self.watch_walker.scan_directory(directory, collect_files, emit)
+            
+        for result in self.watch_walker.walk(path, collect_files=True, scanner=scanner):
+            self._add_scan_result(tree, cube, pending, result)
+            
+        tree.rollup(dirs_only=True, start=start)
+        tree.add_delta(parent, tree.size[start], tree.allocated[start])
+        if cube is not None:
+            cube.rollup(tree, start)
+            cube.apply_delta(tree, parent, cube.totals.get(start))
+            
+    def _apply_entry_change(self, handler, tree, cube, watcher, index, path, *args):
+        """对单个条目调用handler，出错时记录日志并继续，一个条目的错误不影响同一批中的其他条目"""
+        try:
+            handler(tree, cube, watcher, index, path, *args)
+        except Exception as e:
+            self.logger.error(f"更新 {path} 的分析结果时出错: {e}")
+            
+    def _reconcile_directory(self, tree, cube, watcher, index, recursive=False):
+        """把目录节点的子项与磁盘上的内容逐一核对，用于轮询后端和事件溢出"""
+        stack = [index]
+        while stack:
+            index = stack.pop()
+            directory = tree.get_path(index)
+            try:
+                names = set(os.listdir(directory))
+            except OSError as e:
+                self.logger.warning(f"无法访问目录 {directory}: {e}")
+                continue
+                
+            children = {tree.get_name(child): child for child in tree.children(index)}
+            for name, child in children.items():
+                if name not in names:
+                    self._apply_entry_change(self._remove_tree_node, tree, cube, watcher, child,
+                                             os.path.join(directory, name))
+            for name in names:
+                self._apply_entry_change(self._refresh_child, tree, cube, watcher, index,
+                                         os.path.join(directory, name), children.get(name, NO_NODE))
+                
+            if recursive:
+                stack.extend(child for child in tree.children(index) if tree.is_dir(child))
+                
+    def save_snapshot(self, path=None, label=None):
+        """把分析树中path（默认为分析根目录）的子树保存为快照
+
+        快照记录每个目录的总大小、直接文件大小和文件数，以及按扩展名的汇总。
+        """
+        with self.tree_lock:
+            if path is None:
+                path = self.analysis_root
+            tree, index = self._find_node(path) if path is not None else (None, NO_NODE)
+            if index == NO_NODE or not tree.is_dir(index):
+                return {
+                    'success': False,
+                    'error': f"没有 {path} 的分析结果"
+                }
+                
+            root = tree.get_path(index)
+            directories = []
+            stack = [(index, '')]
+            while stack:
+                node, relative = stack.pop()
+                own_size = 0
+                files = 0
+                for child in tree.children(node):
+                    if tree.is_dir(child):
+                        name = tree.get_name(child)
+                        stack.append((child, os.path.join(relative, name) if relative else name))
+                    else:
+                        own_size += tree.size[child]
+                        files += 1
+                directories.append((relative, tree.size[node], tree.allocated[node], own_size, files))
+                
+            cube = self.analysis_cubes.get(tree.root_path)
+            extensions = []
+            if cube is not None:
+                extensions = [(row['extension'], row['size'], row['files'])
+                              for row in cube.summarize(index, 'extension')]
+                
+        snapshot_id = self.snapshot_store.save(root, directories, extensions, label)
+        if snapshot_id is None:
+            return {
+                'success': False,
+                'error': "保存快照失败"
+            }
+        return {
+            'success': True,
+            'snapshot_id': snapshot_id,
+            'message': f"已保存 {root} 的快照（{len(directories)} 个目录）"
+        }
+        
+    def list_snapshots(self, root=None):
+        """列出已保存的快照，root不为空时只列出该目录的快照"""
+        return self.snapshot_store.list_snapshots(root)
+        
+    def delete_snapshot(self, snapshot_id):
+        """删除快照"""
+        return self.snapshot_store.delete(snapshot_id)
+        
+    def diff_snapshots(self, old_id, new_id, limit=20):
+        """比较同一根目录的两份快照，返回增长和缩减最多的目录与扩展名"""
+        try:
+            return {
+                'success': True,
+                'diff': self.snapshot_store.diff(old_id, new_id, limit)
+            }
+        except (ValueError, sqlite3.Error) as e:
+            self.logger.error(f"比较快照时出错: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+            
+    def _iter_subtree(self, tree, start, files=True, min_size=0):
+        """按先序遍历目录树中以start为根的子树，产出 (节点索引, 完整路径, 相对深度)
+
+        沿子节点和兄弟节点指针移动，只保存当前路径上各级目录的路径，内存与树的深度成正比。
+        小于min_size的目录连同其子树一起跳过。
+        """
+        parent = tree.parent
+        first_child = tree.first_child
+        next_sibling = tree.next_sibling
+        flags = tree.flags
+        size = tree.size
+        
+        # parts[-1]是当前节点所在目录的路径
+        parts = [tree.get_path(start)]
+        yield start, parts[0], 0
+        node = first_child[start]
+        while node != NO_NODE:
+            is_dir = flags[node] & FLAG_DIR
+            if size[node] >= min_size and (is_dir or files):
+                path = os.path.join(parts[-1], tree.get_name(node))
+                yield node, path, len(parts)
+                if is_dir and first_child[node] != NO_NODE:
+                    parts.append(path)
+                    node = first_child[node]
+                    continue
+                    
+            # 没有可进入的子节点时前往兄弟节点，没有兄弟节点时向上回溯
+            while next_sibling[node] == NO_NODE:
+                node = parent[node]
+                if node == start:
+                    return
+                parts.pop()
+            node = next_sibling[node]
+            
+    def iter_analysis_entries(self, path=None, files=True, min_size=0):
+        """逐条产出分析树中的目录和文件记录，内存占用与条目数无关
+
+        path为空时导出分析根目录，多卷分析时依次导出各卷。files为False时只导出目录，
+        min_size大于0时跳过更小的条目。迭代期间持有分析树的锁，监视器的增量更新会等待迭代结束。
+        """
+        with self.tree_lock:
+            if path is not None:
+                tree, index = self._find_node(path)
+                roots = [(tree, index)] if index != NO_NODE and tree.is_dir(index) else []
+            elif self.analysis_tree is not None:
+                roots = [(self.analysis_tree, 0)]
+            else:
+                roots = [(tree, 0) for tree in self.volume_trees.values()]
+                
+            for tree, start in roots:
+                for index, entry_path, depth in self._iter_subtree(tree, start, files, min_size):
+                    is_dir = tree.is_dir(index)
+                    yield {
+                        'path': entry_path,
+                        'is_dir': is_dir,
+                        'depth': depth,
+                        'size': tree.size[index],
+                        'allocated': tree.allocated[index],
+                        'mtime': None if is_dir else tree.mtime[index],
+                        'atime': None if is_dir else tree.atime[index]
+                    }
+                    
+    def iter_large_files(self):
+        """逐条产出大文件查找的结果"""
+        for rank, file_info in enumerate(self.analysis_results.get('large_files', []), 1):
+            yield {
+                'rank': rank,
+                'path': file_info['path'],
+                'size': file_info['size']
+            }
+            
+    def iter_duplicate_files(self):
+        """逐条产出重复文件查找的结果，每个文件一条记录，同组文件的group相同"""
+        for group_id, group in enumerate(self.analysis_results.get('duplicate_groups', []), 1):
+            for path, allocated in zip(group['paths'], group['allocated']):
+                yield {
+                    'group': group_id,
+                    'size': group['size'],
+                    'allocated': allocated,
+                    'hash': group['hash'],
+                    'reclaimable': group['reclaimable'],
+                    'path': path
+                }
+                
+    def export_results(self, kind, file_path, fmt='ndjson', path=None, files=True, min_size=0):
+        """把完整结果流式导出为NDJSON或CSV文件，不受格式化输出的条数限制
+
+        kind为'tree'（目录分析树，path、files和min_size的含义见iter_analysis_entries）、
+        'large_files'（大文件列表）或'duplicates'（重复文件，每个文件一行）。
+        """
+        if kind == 'tree':
+            records = self.iter_analysis_entries(path, files, min_size)
+            fields = TREE_EXPORT_FIELDS
+        elif kind == 'large_files':
+            records = self.iter_large_files()
+            fields = LARGE_FILE_EXPORT_FIELDS
+        elif kind == 'duplicates':
+            records = self.iter_duplicate_files()
+            fields = DUPLICATE_EXPORT_FIELDS
+        else:
+            return {
+                'success': False,
+                'error': f"不支持的导出类型: {kind}"
+            }
+            
+        try:
+            return self.exporter.export(records, file_path, fmt, fields)
+        finally:
+            # 提前结束时也要释放迭代器持有的分析树锁
+            records.close()
+            
+    def find_large_files(self, directory, min_size_mb=100, callback=None, top_k=100, snapshot_callback=None):
+        """查找大文件
+
+        单次遍历，只保留最大的top_k个文件。snapshot_callback在遍历过程中
+        接收按大小降序排列的当前前K个大文件列表。
+        """
         try:
             if not os.path.exists(directory) or not os.path.isdir(directory):
                 return {
@@ -173,15 +1152,17 @@ class DiskAnalyzer:
                 }
                 
             min_size = min_size_mb * 1024 * 1024  # 转换为字节
-            large_files = []
             
+            self.analysis_results = {'large_files': []}
             self.analysis_in_progress = True
             self.analysis_progress = 0
+            self.analysis_entries = 0
             self.analysis_cancel = False
+            self.walker.reset()
             
             # 在新线程中运行查找
             thread = threading.Thread(target=self._find_large_files_thread, 
-                                     args=(directory, min_size, large_files, callback))
+                                     args=(directory, min_size, top_k, callback, snapshot_callback))
             thread.daemon = True
             thread.start()
             
@@ -196,47 +1177,278 @@ class DiskAnalyzer:
                 'error': str(e)
             }
             
-    def _find_large_files_thread(self, directory, min_size, large_files, callback):
+    def _find_large_files_thread(self, directory, min_size, top_k, callback, snapshot_callback=None):
         """在线程中运行大文件查找"""
         try:
-            total_items = sum([len(files) for _, _, files in os.walk(directory)])
-            processed_items = 0
+            # 以卷的已用空间估算总量，避免为统计进度而预先遍历一次
+            try:
+                total_bytes = psutil.disk_usage(directory).used
+            except Exception as e:
+                self.logger.warning(f"无法获取 {directory} 所在磁盘的使用量: {e}")
+                total_bytes = 0
+                
+            # 最小堆，堆顶是当前前K个中最小的文件
+            heap = []
+            bytes_seen = 0
+            last_callback = 0
+            # 自上次快照以来前K个结果是否有变化
+            dirty = False
             
-            for dirpath, dirnames, filenames in os.walk(directory):
+            for result in self.walker.walk(directory, collect_files=True):
                 if self.analysis_cancel:
                     break
                     
-                for f in filenames:
-                    try:
-                        file_path = os.path.join(dirpath, f)
-                        if os.path.exists(file_path):
-                            size = os.path.getsize(file_path)
-                            if size >= min_size:
-                                large_files.append({
-                                    'path': file_path,
-                                    'size': size
-                                })
-                    except (PermissionError, FileNotFoundError) as e:
-                        self.logger.warning(f"无法访问文件 {file_path}: {e}")
-                        
-                    processed_items += 1
-                    if total_items > 0:
-                        self.analysis_progress = (processed_items / total_items) * 100
+                bytes_seen += result['size']
+                self.analysis_entries += len(result['file_entries']) + len(result['subdirs'])
+                for name, st, allocated in result['file_entries']:
+                    size = st.st_size
+                    if size < min_size:
+                        continue
+                    if len(heap) < top_k:
+                        heapq.heappush(heap, (size, os.path.join(result['path'], name)))
+                        dirty = True
+                    elif size > heap[0][0]:
+                        heapq.heapreplace(heap, (size, os.path.join(result['path'], name)))
+                        dirty = True
                         
+                if total_bytes > 0:
+                    self.analysis_progress = min(99, (bytes_seen / total_bytes) * 100)
+                    
+                now = time.time()
+                if now - last_callback >= 0.1:
+                    last_callback = now
+                    if dirty:
+                        dirty = False
+                        self.analysis_results = {'large_files': self._heap_to_large_files(heap)}
+                        if snapshot_callback:
+                            snapshot_callback(self.analysis_results['large_files'])
                     if callback:
                         callback(self.analysis_progress)
                         
             # 按大小排序结果
-            large_files.sort(key=lambda x: x['size'], reverse=True)
-            self.analysis_results = {'large_files': large_files}
+            self.analysis_results = {'large_files': self._heap_to_large_files(heap)}
             self.analysis_in_progress = False
             
+            if snapshot_callback:
+                snapshot_callback(self.analysis_results['large_files'])
             if callback:
                 callback(100)  # 完成
         except Exception as e:
             self.logger.error(f"查找大文件线程出错: {e}")
             self.analysis_in_progress = False
             
+    def _heap_to_large_files(self, heap):
+        """将前K个大文件的堆转换为按大小降序排列的列表"""
+        return [
+            {
+                'path': path,
+                'size': size
+            }
+            for size, path in sorted(heap, reverse=True)
+        ]
+            
+    def find_duplicate_files(self, directory, min_size_kb=1, callback=None):
+        """查找重复文件
+
+        依次按大小、首尾64KiB哈希、完整内容哈希分组，只有仍然冲突的组才计算完整哈希。
+        同一文件的多个硬链接只计为一个文件。
+        """
+        try:
+            if not os.path.exists(directory) or not os.path.isdir(directory):
+                return {
+                    'success': False,
+                    'error': f"目录不存在或不是有效目录: {directory}"
+                }
+                
+            min_size = max(1, int(min_size_kb * 1024))  # 转换为字节
+            
+            self.analysis_results = {'duplicate_groups': []}
+            self.analysis_in_progress = True
+            self.analysis_progress = 0
+            self.analysis_entries = 0
+            self.analysis_cancel = False
+            self.walker.reset()
+            
+            # 在新线程中运行查找
+            thread = threading.Thread(target=self._find_duplicate_files_thread,
+                                     args=(directory, min_size, callback))
+            thread.daemon = True
+            thread.start()
+            
+            return {
+                'success': True,
+                'message': f"开始查找重复文件: {directory}"
+            }
+        except Exception as e:
+            self.logger.error(f"查找重复文件时出错: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+            
+    def _find_duplicate_files_thread(self, directory, min_size, callback):
+        """在线程中运行重复文件查找"""
+        try:
+            # 第一阶段：按大小分组（进度0-40）
+            size_groups, allocated = self._group_files_by_size(directory, min_size, callback)
+            
+            # 第二阶段：按首尾部分哈希细分（进度40-70）
+            candidates = self._refine_groups(size_groups, 40, 70, callback, full=False)
+            
+            # 第三阶段：仍然冲突的组计算完整哈希（进度70-100）
+            duplicates = self._refine_groups(candidates, 70, 100, callback, full=True)
+            
+            groups = []
+            for (size, digest), paths in duplicates.items():
+                paths = sorted(paths)
+                allocations = [allocated[path][0] for path in paths]
+                # 按实际占用计算，还有其他硬链接的副本删除后不释放空间；保留释放最少的一份
+                freeable = [allocated[path][1] for path in paths]
+                groups.append({
+                    'size': size,
+                    'hash': digest,
+                    'paths': paths,
+                    'allocated': allocations,
+                    'reclaimable': sum(freeable) - min(freeable)
+                })
+            groups.sort(key=lambda x: x['reclaimable'], reverse=True)
+            
+            self.analysis_results = {'duplicate_groups': groups}
+            self.analysis_in_progress = False
+            
+            if callback:
+                callback(100)  # 完成
+        except Exception as e:
+            self.logger.error(f"查找重复文件线程出错: {e}")
+            self.analysis_in_progress = False
+            
+    def _group_files_by_size(self, directory, min_size, callback=None):
+        """遍历目录并按文件大小分组，只保留包含多个不同文件的组
+
+        返回 ({大小: [路径]}, {路径: (实际占用, 删除后释放的空间)})，只记录候选组中的文件。
+        """
+        # 大小 -> 第一个文件；出现第二个同样大小的文件时才升级为列表，节省内存
+        first_by_size = {}
+        groups = {}
+        discovered_dirs = 1
+        processed_dirs = 0
+        last_callback = 0
+        
+        for result in self.walker.walk(directory, collect_files=True):
+            if self.analysis_cancel:
+                break
+                
+            for name, st, allocated in result['file_entries']:
+                size = st.st_size
+                if size < min_size:
+                    continue
+                item = (os.path.join(result['path'], name), st, allocated)
+                if size in groups:
+                    groups[size].append(item)
+                elif size in first_by_size:
+                    groups[size] = [first_by_size.pop(size), item]
+                else:
+                    first_by_size[size] = item
+                    
+            discovered_dirs += len(result['subdirs'])
+            self.analysis_entries += len(result['file_entries']) + len(result['subdirs'])
+            if not result.get('partial'):
+                processed_dirs += 1
+            self.analysis_progress = (processed_dirs / discovered_dirs) * 40
+            now = time.time()
+            if callback and now - last_callback >= 0.1:
+                last_callback = now
+                callback(self.analysis_progress)
+                
+        # 同一inode的硬链接不算重复
+        size_groups = {}
+        allocations = {}
+        for size, items in groups.items():
+            allocated_by_path = {path: allocated for path, _, allocated in items}
+            linked = self._dedupe_hard_links([(path, st) for path, st, _ in items])
+            if len(linked) > 1:
+                size_groups[size] = [path for path, _ in linked]
+                for path, st in linked:
+                    allocated = allocated_by_path[path]
+                    allocations[path] = (allocated, allocated if st.st_nlink == 1 else 0)
+        return size_groups, allocations
+        
+    def _dedupe_hard_links(self, items):
+        """按(st_dev, st_ino)去重，每个inode只保留一个 (路径, stat结果)"""
+        seen = set()
+        kept = []
+        for path, st in items:
+            if st.st_ino == 0:
+                # Windows上DirEntry.stat()不提供文件ID，仅对候选文件补充一次stat
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+            key = (st.st_dev, st.st_ino)
+            if st.st_ino and key in seen:
+                continue
+            seen.add(key)
+            kept.append((path, st))
+        return kept
+        
+    def _refine_groups(self, groups, progress_start, progress_end, callback=None, full=False):
+        """按哈希细分候选组，返回 {(大小, 哈希): [路径]}，只保留仍有多个文件的组"""
+        refined = {}
+        total = sum(len(paths) for paths in groups.values())
+        if total == 0:
+            return refined
+            
+        jobs = []
+        for key, paths in groups.items():
+            size = key[0] if isinstance(key, tuple) else key
+            for path in paths:
+                jobs.append((size, path))
+                
+        digests = {}
+        processed = 0
+        last_callback = 0
+        # 后台模式下哈希的工作进程和线程同样以最低优先级运行
+        initializer = lower_current_thread_priority if self.walker.is_background() else None
+        if full:
+            # 完整哈希受CPU限制，使用进程池
+            executor = ProcessPoolExecutor(initializer=initializer)
+            results = executor.map(_hash_file_full, [path for _, path in jobs], chunksize=16)
+        else:
+            # 部分哈希受I/O延迟限制，使用线程池
+            executor = ThreadPoolExecutor(max_workers=self.walker.max_workers, initializer=initializer)
+            results = executor.map(self._hash_partial_job, jobs)
+            
+        try:
+            for path, digest in results:
+                # 暂停时停止消费结果，部分哈希的工作线程也会在下一个文件前等待
+                if self.analysis_cancel or not self.walker.wait_if_paused():
+                    break
+                digests[path] = digest
+                processed += 1
+                self.analysis_progress = progress_start + (processed / total) * (progress_end - progress_start)
+                now = time.time()
+                if callback and now - last_callback >= 0.1:
+                    last_callback = now
+                    callback(self.analysis_progress)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            
+        for size, path in jobs:
+            digest = digests.get(path)
+            if digest is None:
+                continue
+            refined.setdefault((size, digest), []).append(path)
+            
+        return {key: paths for key, paths in refined.items() if len(paths) > 1}
+        
+    def _hash_partial_job(self, job):
+        """在线程池中计算部分哈希，暂停时等待，取消后直接跳过"""
+        size, path = job
+        if not self.walker.wait_if_paused():
+            return path, None
+        self.walker.throttle_wait()
+        return _hash_file_partial(path, size)
+        
     def format_size(self, size_bytes):
         """将字节大小格式化为人类可读的格式"""
         for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
@@ -265,9 +1477,9 @@ class DiskAnalyzer:
             
         return "\n".join(output)
         
-    def get_formatted_analysis_results(self, limit=10):
+    def get_formatted_analysis_results(self, limit=10, path=None):
         """获取格式化的分析结果"""
-        results = self.get_analysis_results(limit)
+        results = self.get_analysis_results(limit, path)
         if not results:
             return "没有分析结果"
             
@@ -278,11 +1490,105 @@ class DiskAnalyzer:
             output.append(f"  {name}:")
             output.append(f"    路径: {info['path']}")
             output.append(f"    大小: {self.format_size(info['size'])}")
+            output.append(f"    占用空间: {self.format_size(info.get('allocated', info['size']))}")
             output.append(f"    类型: {'目录' if info['is_dir'] else '文件'}")
             output.append("")
             
         return "\n".join(output)
         
+    def get_formatted_volume_results(self, limit=5):
+        """获取格式化的多卷分析结果"""
+        if 'volumes' not in self.analysis_results:
+            return "没有多卷分析结果"
+            
+        status_names = {
+            'pending': '等待中',
+            'running': '分析中',
+            'done': '完成',
+            'cancelled': '已取消',
+            'error': '出错'
+        }
+        output = []
+        output.append("多卷分析结果:")
+        
+        for mountpoint, info in self.analysis_results['volumes'].items():
+            output.append(f"  {mountpoint} ({info['device']}):")
+            output.append(f"    物理设备: {info['physical_device']} ({'机械硬盘' if info['rotational'] else '固态硬盘'})")
+            output.append(f"    状态: {status_names.get(info['status'], info['status'])}")
+            output.append(f"    大小: {self.format_size(info['size'])}")
+            output.append(f"    占用空间: {self.format_size(info['allocated'])}")
+            for i, (name, item) in enumerate(info['items'].items()):
+                if i >= limit:
+                    break
+                output.append(f"    {name}: {self.format_size(item['size'])}")
+            output.append("")
+            
+        return "\n".join(output)
+        
+    def get_formatted_file_summary(self, path=None, group_by='extension', limit=10, **filters):
+        """获取格式化的文件汇总"""
+        rows = self.get_file_summary(path, group_by, limit=limit, **filters)
+        if not rows:
+            return "没有文件汇总结果"
+            
+        dimension_names = {
+            'extension': '扩展名',
+            'mtime': '修改时间',
+            'atime': '访问时间',
+            'owner': '所有者'
+        }
+        dimensions = (group_by,) if isinstance(group_by, str) else tuple(group_by)
+        output = []
+        output.append(f"文件汇总（按{'、'.join(dimension_names[d] for d in dimensions)}）:")
+        
+        for row in rows:
+            label = ' / '.join(str(row[d]) or '(无扩展名)' for d in dimensions)
+            output.append(f"  {label}: {self.format_size(row['size'])}，{row['files']} 个文件")
+            
+        return "\n".join(output)
+        
+    def get_formatted_snapshot_diff(self, diff, limit=10):
+        """获取格式化的快照差异"""
+        def format_delta(size):
+            return ('+' if size >= 0 else '-') + self.format_size(abs(size))
+            
+        def format_relative(item):
+            return '新增' if item['relative'] is None else f"{item['relative'] * 100:+.1f}%"
+            
+        output = []
+        old_time = time.strftime('%Y-%m-%d %H:%M', time.localtime(diff['old']['created']))
+        new_time = time.strftime('%Y-%m-%d %H:%M', time.localtime(diff['new']['created']))
+        output.append(f"快照差异: {diff['root']}（{old_time} -> {new_time}）")
+        output.append(f"  总大小: {self.format_size(diff['old']['total_size'])} -> "
+                      f"{self.format_size(diff['new']['total_size'])} ({format_delta(diff['delta'])})")
+        output.append("")
+        
+        sections = [
+            ('subtrees', 'grown', "增长最多的目录（含子目录）"),
+            ('subtrees', 'shrunk', "缩减最多的目录（含子目录）"),
+            ('directories', 'grown', "直接文件增长最多的目录"),
+            ('directories', 'shrunk', "直接文件缩减最多的目录"),
+            ('directories', 'grown_relative', "直接文件相对增长最多的目录"),
+            ('extensions', 'grown', "增长最多的扩展名"),
+            ('extensions', 'shrunk', "缩减最多的扩展名")
+        ]
+        for group, ranking, title in sections:
+            items = diff[group][ranking][:limit]
+            if not items:
+                continue
+            output.append(f"{title}:")
+            for item in items:
+                name = item['path'] if group != 'extensions' else (item['key'] or '(无扩展名)')
+                line = f"  {name}: {format_delta(item['delta'])} ({format_relative(item)})"
+                if group == 'directories' and item['total_delta'] != item['delta']:
+                    line += f"，含子目录 {format_delta(item['total_delta'])}"
+                elif group == 'subtrees' and item['own_delta'] not in (0, item['delta']):
+                    line += f"，其中直接文件 {format_delta(item['own_delta'])}"
+                output.append(line)
+            output.append("")
+            
+        return "\n".join(output)
+        
     def get_formatted_large_files(self, limit=10):
         """获取格式化的大文件列表"""
         if 'large_files' not in self.analysis_results:
@@ -304,4 +1610,29 @@ class DiskAnalyzer:
             output.append(f"    大小: {self.format_size(file_info['size'])}")
             output.append("")
             
-        return "\n".join(output) 
\ No newline at end of file
+        return "\n".join(output)
+        
+    def get_formatted_duplicates(self, limit=10):
+        """获取格式化的重复文件列表"""
+        if 'duplicate_groups' not in self.analysis_results:
+            return "没有重复文件分析结果"
+            
+        groups = self.analysis_results['duplicate_groups']
+        if not groups:
+            return "未找到重复文件"
+            
+        output = []
+        total_reclaimable = sum(group['reclaimable'] for group in groups)
+        output.append(f"重复文件: {len(groups)} 组，可释放 {self.format_size(total_reclaimable)}")
+        
+        for i, group in enumerate(groups):
+            if i >= limit:
+                break
+                
+            output.append(f"  {i+1}. {len(group['paths'])} 个文件，每个 {self.format_size(group['size'])}")
+            output.append(f"    可释放: {self.format_size(group['reclaimable'])}")
+            for path in group['paths']:
+                output.append(f"    路径: {path}")
+            output.append("")
+            
+        return "\n".join(output)
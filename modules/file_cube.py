@@ -0,0 +1,306 @@
+import os
+import time
+import ctypes
+import bisect
+import logging
+from modules.compact_tree import NO_NODE
+
+try:
+    import pwd
+except ImportError:
+    # Windows上没有pwd模块，所有者以SID表示
+    pwd = None
+
+# 年龄分桶的下界（天），第i个桶覆盖 [AGE_BUCKET_DAYS[i], AGE_BUCKET_DAYS[i+1]) 天
+AGE_BUCKET_DAYS = (0, 30, 90, 365, 3 * 365)
+AGE_BUCKET_NAMES = ('30天内', '30-90天', '90天-1年', '1-3年', '3年以上')
+
+# 可用于分组的维度
+DIMENSIONS = ('extension', 'mtime', 'atime', 'owner')
+
+# Windows安全信息常量
+SE_FILE_OBJECT = 1
+OWNER_SECURITY_INFORMATION = 0x1
+
+# 按扩展名、修改时间年龄、访问时间年龄和所有者汇总的文件统计。
+# 每个目录节点保存其整个子树的汇总 {组合键: [字节数, 文件数]}，组合键为整数编码的
+# (扩展名ID, 所有者ID, mtime桶, atime桶)，因此任意子树的查询只需读取该节点的汇总。
+class FileCube:
+    def __init__(self, now=None, collect_owner=None):
+        # 设置日志
+        logging.basicConfig(level=logging.INFO,
+                           format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        self.logger = logging.getLogger('FileCube')
+
+        if now is None:
+            now = time.time()
+        self.now = now
+        self.bucket_seconds = [days * 86400 for days in AGE_BUCKET_DAYS]
+
+        # POSIX上所有者直接来自stat；Windows上需要逐个文件读取安全描述符，默认不收集
+        if collect_owner is None:
+            collect_owner = os.name != 'nt'
+        self.collect_owner = collect_owner
+
+        # 扩展名和所有者的ID表
+        self.extensions = []
+        self.extension_ids = {}
+        self.owners = []
+        self.owner_ids = {}
+        self.owner_names = {}
+
+        # 目录节点自身直接包含文件的汇总，rollup后释放
+        self.own = {}
+        # 目录节点整个子树的汇总
+        self.totals = {}
+
+    def _age_bucket(self, timestamp):
+        """按距今的时间返回年龄桶，未来时间归入第一个桶"""
+        return max(0, bisect.bisect_right(self.bucket_seconds, self.now - timestamp) - 1)
+
+    def _get_owner_sid(self, path):
+        """读取文件所有者的SID字符串（仅Windows）"""
+        try:
+            advapi32 = ctypes.windll.advapi32
+            owner = ctypes.c_void_p()
+            descriptor = ctypes.c_void_p()
+            if advapi32.GetNamedSecurityInfoW(ctypes.c_wchar_p(path), SE_FILE_OBJECT, OWNER_SECURITY_INFORMATION,
+                                              ctypes.byref(owner), None, None, None, ctypes.byref(descriptor)):
+                return None
+            try:
+                sid = ctypes.c_wchar_p()
+                if not advapi32.ConvertSidToStringSidW(owner, ctypes.byref(sid)):
+                    return None
+                value = sid.value
+                ctypes.windll.kernel32.LocalFree(sid)
+                return value
+            finally:
+                ctypes.windll.kernel32.LocalFree(descriptor)
+        except Exception:
+            return None
+
+    def _get_owner(self, path, st):
+        """获取文件所有者：POSIX为uid，Windows为SID字符串，未收集时为None"""
+        if not self.collect_owner:
+            return None
+        if os.name == 'nt':
+            return self._get_owner_sid(path)
+        return st.st_uid
+
+    def aggregate_entries(self, directory, file_entries, duplicates=()):
+        """汇总目录直接包含的文件，返回 {(扩展名, mtime桶, atime桶, 所有者): [字节数, 文件数]}
+
+        file_entries为遍历器产出的 (名称, stat结果, 占用空间) 列表。duplicates为遍历器去重时
+        未计入的硬链接文件名，与目录大小一致，这些文件不计入汇总。
+        """
+        aggregates = {}
+        for name, st, allocated in file_entries:
+            if name in duplicates:
+                continue
+            key = (
+                os.path.splitext(name)[1].lower(),
+                self._age_bucket(st.st_mtime),
+                self._age_bucket(st.st_atime),
+                self._get_owner(os.path.join(directory, name), st)
+            )
+            item = aggregates.get(key)
+            if item is None:
+                aggregates[key] = [st.st_size, 1]
+            else:
+                item[0] += st.st_size
+                item[1] += 1
+        return aggregates
+
+    def _intern(self, value, values, ids):
+        """将扩展名或所有者映射为ID"""
+        value_id = ids.get(value)
+        if value_id is None:
+            value_id = len(values)
+            values.append(value)
+            ids[value] = value_id
+        return value_id
+
+    def _encode_key(self, extension, mtime_bucket, atime_bucket, owner):
+        """将维度组合编码为整数键"""
+        extension_id = self._intern(extension, self.extensions, self.extension_ids)
+        owner_id = self._intern(owner, self.owners, self.owner_ids)
+        return (((extension_id << 20) | owner_id) << 8) | (mtime_bucket << 4) | atime_bucket
+
+    def _decode_key(self, key):
+        """将整数键解码为 (扩展名ID, 所有者ID, mtime桶, atime桶)"""
+        return key >> 28, (key >> 8) & 0xFFFFF, (key >> 4) & 0xF, key & 0xF
+
+    def add(self, index, aggregates):
+        """记录目录节点自身直接包含文件的汇总，超大目录分批扫描时各批的汇总累加到一起"""
+        if not aggregates:
+            return
+        own = self.own.setdefault(index, {})
+        for (extension, mtime_bucket, atime_bucket, owner), (size, count) in aggregates.items():
+            key = self._encode_key(extension, mtime_bucket, atime_bucket, owner)
+            item = own.get(key)
+            if item is None:
+                own[key] = [size, count]
+            else:
+                item[0] += size
+                item[1] += count
+
+    def rollup(self, tree, start=0):
+        """按目录树自底向上汇总，使每个目录节点保存其整个子树的汇总
+
+        子节点索引总是大于父节点，因此逆序处理目录节点即可保证子目录先于父目录。
+        start大于0时只汇总以start为根、在其之后添加的子树，结果不会累加到start之前的节点。
+        """
+        if start:
+            directories = [index for index in range(start, len(tree)) if tree.is_dir(index)]
+        else:
+            directories = tree.filter(dirs_only=True)
+
+        # 子目录汇总累加到父目录的中间结果
+        accumulated = {}
+        for index in reversed(directories):
+            own = self.own.get(index)
+            total = accumulated.pop(index, None)
+            if total is None:
+                # 没有子目录数据的目录直接共用自身的汇总
+                total = own
+            elif own:
+                self._merge(total, own)
+            if not total:
+                continue
+            self.totals[index] = total
+
+            parent = tree.parent[index]
+            if parent == NO_NODE or parent < start:
+                continue
+            target = accumulated.get(parent)
+            if target is None:
+                accumulated[parent] = {key: list(value) for key, value in total.items()}
+            else:
+                self._merge(target, total)
+        self.own = {}
+
+    def _merge(self, target, source, sign=1):
+        """把source的汇总累加到target，sign为-1时减去，文件数归零的组合被删除"""
+        for key, (size, count) in source.items():
+            item = target.get(key)
+            if item is None:
+                if sign > 0:
+                    target[key] = [size, count]
+                continue
+            item[0] += size * sign
+            item[1] += count * sign
+            if item[1] <= 0:
+                del target[key]
+
+    def get_file_key(self, tree, index, path):
+        """根据分析树中文件节点的元数据计算其组合键"""
+        owner = None
+        if self.collect_owner:
+            owner = self._get_owner_sid(path) if os.name == 'nt' else tree.uid[index]
+        return self._encode_key(
+            os.path.splitext(tree.get_name(index))[1].lower(),
+            self._age_bucket(tree.mtime[index]),
+            self._age_bucket(tree.atime[index]),
+            owner
+        )
+
+    def apply_delta(self, tree, index, delta, sign=1):
+        """把 {组合键: [字节数, 文件数]} 形式的变化累加到节点及其所有祖先的汇总"""
+        if not delta:
+            return
+        for node in tree.ancestors(index):
+            total = self.totals.get(node)
+            if total is None:
+                if sign < 0:
+                    continue
+                total = self.totals[node] = {}
+            self._merge(total, delta, sign)
+
+    def remove_subtree(self, tree, index, removed_dirs):
+        """从祖先中减去已移除目录子树的汇总，并释放子树中各目录的汇总"""
+        total = self.totals.get(index)
+        if total:
+            self.apply_delta(tree, tree.parent[index], total, sign=-1)
+        for node in removed_dirs:
+            self.totals.pop(node, None)
+
+    def _min_bucket(self, days):
+        """返回完全早于days天的第一个年龄桶，days不在桶边界上时向上取整到下一个边界"""
+        if not days:
+            return 0
+        return bisect.bisect_left(AGE_BUCKET_DAYS, days)
+
+    def get_owner_name(self, owner):
+        """获取所有者的显示名称"""
+        if owner is None:
+            return '未知'
+        name = self.owner_names.get(owner)
+        if name is None:
+            name = str(owner)
+            if pwd is not None and isinstance(owner, int):
+                try:
+                    name = pwd.getpwuid(owner).pw_name
+                except KeyError:
+                    pass
+            self.owner_names[owner] = name
+        return name
+
+    def summarize(self, index, group_by='extension', mtime_older_than=None, atime_older_than=None,
+                  extensions=None, owners=None, limit=None):
+        """汇总目录节点整个子树，按group_by指定的维度分组，结果按字节数降序排列
+
+        group_by为DIMENSIONS中的一个或多个维度；mtime_older_than/atime_older_than为天数，
+        按年龄桶边界过滤；extensions和owners限定扩展名（如'.log'）和所有者。
+        返回 [{维度: 值, ..., 'size': 字节数, 'files': 文件数}]。
+        """
+        dimensions = (group_by,) if isinstance(group_by, str) else tuple(group_by)
+        for dimension in dimensions:
+            if dimension not in DIMENSIONS:
+                raise ValueError(f"未知的汇总维度: {dimension}")
+
+        min_mtime = self._min_bucket(mtime_older_than)
+        min_atime = self._min_bucket(atime_older_than)
+        if extensions is not None:
+            extensions = {extension.lower() for extension in extensions}
+
+        groups = {}
+        for key, (size, count) in self.totals.get(index, {}).items():
+            extension_id, owner_id, mtime_bucket, atime_bucket = self._decode_key(key)
+            if mtime_bucket < min_mtime or atime_bucket < min_atime:
+                continue
+            extension = self.extensions[extension_id]
+            owner = self.owners[owner_id]
+            if extensions is not None and extension not in extensions:
+                continue
+            if owners is not None and owner not in owners:
+                continue
+
+            values = {
+                'extension': extension,
+                'mtime': mtime_bucket,
+                'atime': atime_bucket,
+                'owner': owner
+            }
+            group = tuple(values[dimension] for dimension in dimensions)
+            item = groups.get(group)
+            if item is None:
+                groups[group] = [size, count]
+            else:
+                item[0] += size
+                item[1] += count
+
+        rows = []
+        for group, (size, count) in sorted(groups.items(), key=lambda item: item[1][0], reverse=True):
+            row = {}
+            for dimension, value in zip(dimensions, group):
+                if dimension in ('mtime', 'atime'):
+                    value = AGE_BUCKET_NAMES[value]
+                elif dimension == 'owner':
+                    value = self.get_owner_name(value)
+                row[dimension] = value
+            row['size'] = size
+            row['files'] = count
+            rows.append(row)
+            if limit and len(rows) >= limit:
+                break
+        return rows
@@ -0,0 +1,417 @@
+import os
+import queue
+import logging
+import ctypes
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from modules.io_throttle import IoThrottle, DEFAULT_MAX_UTILIZATION
+
+# 后台模式下超大目录每枚举这么多条目检查一次磁盘繁忙程度
+THROTTLE_ENTRIES = 4096
+# 单个目录每累积这么多条目就先产出一批结果，超大目录的内存占用与目录中的条目总数无关
+SCAN_BATCH_SIZE = 4096
+# 工作线程与调用方之间最多缓冲的结果批数，调用方处理较慢时工作线程等待
+RESULT_QUEUE_SIZE = 64
+
+# Windows文件属性 - 稀疏文件和压缩文件的实际占用小于文件大小
+FILE_ATTRIBUTE_SPARSE_FILE = 0x200
+FILE_ATTRIBUTE_COMPRESSED = 0x800
+
+class _WalkClosed(Exception):
+    """调用方已停止迭代，阻塞在结果队列上的扫描随即结束"""
+
+class FileWalker:
+    def __init__(self, max_workers=None):
+        # 设置日志
+        logging.basicConfig(level=logging.INFO,
+                           format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        self.logger = logging.getLogger('FileWalker')
+
+        # 线程池大小 - 目录扫描以I/O为主，线程数可以略多于CPU核数
+        if max_workers is None:
+            max_workers = min(16, (os.cpu_count() or 1) * 2)
+        self.max_workers = max(1, max_workers)
+
+        # 协作式取消标志
+        self.cancel_event = threading.Event()
+        # 运行标志 - 清除时工作线程在处理下一个条目前暂停等待
+        self.resume_event = threading.Event()
+        self.resume_event.set()
+
+        # 簇大小 - Windows上用于估算未压缩文件的占用空间
+        self.cluster_size = 4096
+
+        # 后台模式的磁盘节流器，为None时全速遍历
+        self.throttle = None
+
+    def cancel(self):
+        """请求取消正在进行的遍历"""
+        self.cancel_event.set()
+        # 唤醒处于暂停状态的工作线程，使其立即看到取消标志
+        self.resume_event.set()
+
+    def reset(self):
+        """清除取消和暂停标志，准备新的遍历"""
+        self.cancel_event.clear()
+        self.resume_event.set()
+
+    def is_cancelled(self):
+        """检查是否已请求取消"""
+        return self.cancel_event.is_set()
+
+    def pause(self):
+        """暂停遍历，正在扫描的目录会在当前条目处理完后停下"""
+        if not self.cancel_event.is_set():
+            self.resume_event.clear()
+
+    def resume(self):
+        """继续已暂停的遍历"""
+        self.resume_event.set()
+
+    def is_paused(self):
+        """检查遍历是否处于暂停状态"""
+        return not self.resume_event.is_set()
+
+    def wait_if_paused(self):
+        """暂停时阻塞直到继续或取消，返回是否可以继续执行"""
+        # 带超时等待，避免暂停与取消同时发生时错过唤醒
+        while not self.resume_event.wait(0.1):
+            if self.cancel_event.is_set():
+                break
+        return not self.cancel_event.is_set()
+
+    def set_background(self, enabled, max_utilization=DEFAULT_MAX_UTILIZATION, throttle=None):
+        """开启或关闭后台模式
+
+        后台模式下工作线程以最低的CPU和I/O优先级运行，并根据磁盘利用率和延迟
+        在扫描每个目录前自适应地等待，使磁盘利用率不超过max_utilization（0到1）。
+        throttle可传入与其他遍历器共享的节流器。
+        """
+        if not enabled:
+            self.throttle = None
+        else:
+            self.throttle = throttle or IoThrottle(max_utilization)
+
+    def is_background(self):
+        """检查是否处于后台模式"""
+        return self.throttle is not None
+
+    def throttle_wait(self):
+        """后台模式下磁盘繁忙时等待，取消时立即返回"""
+        throttle = self.throttle
+        if throttle is not None:
+            throttle.wait(self.cancel_event)
+
+    def _update_cluster_size(self, root):
+        """获取root所在卷的簇大小（仅Windows）"""
+        if os.name != 'nt':
+            return
+        try:
+            drive = os.path.splitdrive(os.path.abspath(root))[0] + '\\'
+            sectors_per_cluster = ctypes.c_ulong(0)
+            bytes_per_sector = ctypes.c_ulong(0)
+            free_clusters = ctypes.c_ulong(0)
+            total_clusters = ctypes.c_ulong(0)
+            if ctypes.windll.kernel32.GetDiskFreeSpaceW(
+                    ctypes.c_wchar_p(drive), ctypes.byref(sectors_per_cluster), ctypes.byref(bytes_per_sector),
+                    ctypes.byref(free_clusters), ctypes.byref(total_clusters)):
+                self.cluster_size = sectors_per_cluster.value * bytes_per_sector.value or 4096
+        except Exception as e:
+            self.logger.warning(f"无法获取 {root} 的簇大小: {e}")
+
+    def _get_compressed_size(self, path):
+        """通过GetCompressedFileSizeW获取压缩或稀疏文件的实际占用"""
+        try:
+            high = ctypes.c_ulong(0)
+            low = ctypes.windll.kernel32.GetCompressedFileSizeW(ctypes.c_wchar_p(path), ctypes.byref(high))
+            if low == 0xFFFFFFFF and ctypes.GetLastError() != 0:
+                return None
+            return (high.value << 32) + low
+        except Exception:
+            return None
+
+    def get_link_stat(self, path, st):
+        """补全判断硬链接所需的st_ino和st_nlink
+
+        Windows上DirEntry.stat()使用目录枚举时缓存的数据，文件ID和链接数均为0，
+        此时按路径重新stat一次；重新stat失败时返回原结果，链接数保持未知(0)。
+        """
+        if st.st_ino and st.st_nlink:
+            return st
+        try:
+            return os.stat(path, follow_symlinks=False)
+        except OSError:
+            return st
+
+    def get_allocated_size(self, path, st):
+        """获取文件实际占用的磁盘空间
+
+        POSIX上使用st_blocks；Windows上压缩和稀疏文件查询压缩后大小，
+        其他文件按簇大小向上取整。
+        """
+        blocks = getattr(st, 'st_blocks', None)
+        if blocks is not None:
+            return blocks * 512
+
+        attributes = getattr(st, 'st_file_attributes', 0)
+        if attributes & (FILE_ATTRIBUTE_SPARSE_FILE | FILE_ATTRIBUTE_COMPRESSED):
+            size = self._get_compressed_size(path)
+            if size is not None:
+                return size
+
+        cluster = self.cluster_size
+        return (st.st_size + cluster - 1) // cluster * cluster
+
+    def _new_result(self, directory, batch=0):
+        return {
+            'path': directory,
+            'size': 0,
+            'allocated': 0,
+            'files': 0,
+            'subdirs': [],
+            'file_entries': [],
+            'linked': [],
+            'duplicates': [],
+            'errors': 0,
+            'batch': batch
+        }
+
+    def scan_directory(self, directory, collect_files=False, emit=None):
+        """扫描单个目录（不递归），返回该目录的文件统计和子目录列表
+
+        有多个硬链接的文件不计入size/allocated，而是放入linked，
+        由walk按(st_dev, st_ino)去重后再累加，未被计入的文件名放入duplicates。
+        因取消而提前结束时结果带有incomplete标记，其中的统计不完整。
+
+        条目从os.scandir逐个读取。给出emit时，每累积SCAN_BATCH_SIZE个条目就以emit(部分结果)
+        先交出一批，部分结果带有partial标记，统计只包含该批条目；返回值为最后一批。
+        同一目录的各批结果按batch编号递增，调用方按批累加即可得到整个目录的统计。
+        """
+        result = self._new_result(directory)
+
+        if not self.wait_if_paused():
+            result['incomplete'] = True
+            return result
+        self.throttle_wait()
+
+        batched = 0
+        try:
+            with os.scandir(directory) as it:
+                for count, entry in enumerate(it, 1):
+                    if count % THROTTLE_ENTRIES == 0:
+                        self.throttle_wait()
+                    # 逐条目检查暂停和取消，超大目录也能在毫秒级内响应
+                    if not self.resume_event.is_set() or self.cancel_event.is_set():
+                        if not self.wait_if_paused():
+                            result['incomplete'] = True
+                            break
+
+                    if emit is not None and batched >= SCAN_BATCH_SIZE:
+                        result['partial'] = True
+                        emit(result)
+                        result = self._new_result(directory, result['batch'] + 1)
+                        batched = 0
+
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            result['subdirs'].append(entry.path)
+                            batched += 1
+                        else:
+                            # Windows上DirEntry.stat()缺少文件ID和链接数，需要补充一次stat才能识别硬链接
+                            st = self.get_link_stat(entry.path, entry.stat(follow_symlinks=False))
+                            allocated = self.get_allocated_size(entry.path, st)
+                            if st.st_nlink > 1:
+                                result['linked'].append(((st.st_dev, st.st_ino), entry.name, st.st_size, allocated))
+                                batched += 1
+                            else:
+                                result['size'] += st.st_size
+                                result['allocated'] += allocated
+                            result['files'] += 1
+                            if collect_files:
+                                result['file_entries'].append((entry.name, st, allocated))
+                                batched += 1
+                    except (PermissionError, FileNotFoundError, OSError) as e:
+                        self.logger.warning(f"无法访问文件 {entry.path}: {e}")
+                        result['errors'] += 1
+        except (PermissionError, FileNotFoundError, NotADirectoryError, OSError) as e:
+            self.logger.warning(f"无法访问目录 {directory}: {e}")
+            result['errors'] += 1
+
+        return result
+
+    def walk(self, root, collect_files=False, scanner=None, start=None):
+        """并行遍历目录树，每扫描完一批条目就产出该批的统计结果
+
+        collect_files为True时，结果中的file_entries包含该批中每个文件的(名称, stat结果, 占用空间)。
+        同一遍历中硬链接的文件只计算一次。
+        超大目录分多批产出：除最后一批外都带有partial标记，不带partial标记的结果表示该目录已扫描完成；
+        每一批的subdirs都会被遍历。工作线程与调用方之间只缓冲有限批数，
+        因此内存占用与单个目录的条目数无关。
+        scanner可替换单个目录的扫描函数（签名同scan_directory），用于复用缓存结果。
+        start为起始目录列表，用于从检查点恢复时只遍历尚未扫描的目录；默认为[root]。
+
+        产出顺序不保证为深度优先或广度优先。遍历在调用方线程中调度，
+        工作线程只负责扫描单个目录，因此线程池不会因递归等待而死锁。
+        """
+        if self.cancel_event.is_set():
+            return
+
+        if scanner is None:
+            scanner = self.scan_directory
+
+        self._update_cluster_size(root)
+        throttle = self.throttle
+        if throttle is not None:
+            throttle.watch_path(root)
+        # 本次遍历中已计数的硬链接文件
+        seen_links = set()
+
+        if start is None:
+            start = [root]
+
+        results = queue.Queue(maxsize=RESULT_QUEUE_SIZE)
+        # 调用方停止迭代后置位，等待放入结果的扫描线程随即退出
+        closed = threading.Event()
+
+        def emit(item):
+            while True:
+                try:
+                    results.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    if closed.is_set():
+                        raise _WalkClosed()
+
+        def scan(directory, emit_batch=emit):
+            """扫描单个目录并交出最后一批结果，扫描出错时把异常交给调用方线程重新抛出"""
+            try:
+                result = scanner(directory, collect_files, emit_batch)
+            except _WalkClosed:
+                return None
+            except Exception as e:
+                result = e
+            try:
+                emit(result)
+            except _WalkClosed:
+                return None
+            return result
+
+        if self.max_workers == 1:
+            # 单线程模式：在一个后台线程中用栈深度优先遍历，调用方线程只消费结果
+            def produce():
+                if throttle is not None:
+                    throttle.lower_thread_priority()
+                stack = list(start)
+
+                def emit_batch(partial):
+                    stack.extend(partial['subdirs'])
+                    emit(partial)
+
+                while stack and not self.cancel_event.is_set():
+                    result = scan(stack.pop(), emit_batch)
+                    if not isinstance(result, dict):
+                        return
+                    stack.extend(result['subdirs'])
+                try:
+                    emit(None)
+                except _WalkClosed:
+                    pass
+
+            producer = threading.Thread(target=produce, name='FileWalker', daemon=True)
+            producer.start()
+            try:
+                while True:
+                    result = results.get()
+                    if result is None:
+                        break
+                    if isinstance(result, Exception):
+                        raise result
+                    self._merge_links(result, seen_links)
+                    yield result
+            finally:
+                closed.set()
+                producer.join()
+            return
+
+        # 后台模式下工作线程启动时降低自身优先级，线程随遍历结束退出
+        executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                      thread_name_prefix='FileWalker',
+                                      initializer=throttle.lower_thread_priority if throttle else None)
+        # 尚未扫描完成的目录 -> future
+        pending = {}
+        try:
+            for directory in start:
+                pending[directory] = executor.submit(scan, directory)
+            while pending:
+                result = results.get()
+                if isinstance(result, Exception):
+                    raise result
+                if not result.get('partial'):
+                    pending.pop(result['path'], None)
+                if not self.cancel_event.is_set():
+                    for subdir in result['subdirs']:
+                        pending[subdir] = executor.submit(scan, subdir)
+                self._merge_links(result, seen_links)
+                yield result
+
+                if self.cancel_event.is_set():
+                    # 丢弃尚未开始的目录，正在扫描的目录会很快以incomplete结果结束
+                    for directory, future in list(pending.items()):
+                        if future.cancel():
+                            del pending[directory]
+        finally:
+            # 调用方提前停止迭代时，丢弃尚未开始的任务
+            closed.set()
+            for future in pending.values():
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def _merge_links(self, result, seen_links):
+        """将硬链接文件按inode去重后计入目录统计，在调度线程中调用
+
+        同一inode已在本次遍历中计入过的文件名记录在duplicates中，其大小不计入目录。
+        """
+        for key, name, size, allocated in result.get('linked', ()):
+            if key in seen_links:
+                result['duplicates'].append(name)
+                continue
+            seen_links.add(key)
+            result['size'] += size
+            result['allocated'] += allocated
+
+    def scan(self, path):
+        """统计路径下所有文件的总大小、实际占用、文件数和目录数"""
+        totals = {
+            'size': 0,
+            'allocated': 0,
+            'files': 0,
+            'dirs': 0,
+            'errors': 0
+        }
+
+        try:
+            if not os.path.isdir(path):
+                # 单个文件直接获取大小
+                st = os.stat(path)
+                totals['size'] = st.st_size
+                totals['allocated'] = self.get_allocated_size(path, st)
+                totals['files'] = 1
+                return totals
+        except (PermissionError, FileNotFoundError, OSError) as e:
+            self.logger.warning(f"无法访问 {path}: {e}")
+            totals['errors'] += 1
+            return totals
+
+        for result in self.walk(path):
+            totals['size'] += result['size']
+            totals['allocated'] += result['allocated']
+            totals['files'] += result['files']
+            totals['errors'] += result['errors']
+            if not result.get('partial'):
+                totals['dirs'] += 1
+
+        return totals
+
+    def get_size(self, path):
+        """获取路径（文件或目录）的总大小"""
+        return self.scan(path)['size']
@@ -0,0 +1,355 @@
+import os
+import sys
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+import threading
+
+# 事件类型：条目（文件或目录）需要刷新、目录的内容需要与磁盘核对、事件队列溢出需要全量核对
+EVENT_ENTRY = 'entry'
+EVENT_DIRECTORY = 'directory'
+EVENT_OVERFLOW = 'overflow'
+
+# inotify事件标志
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+INOTIFY_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+                IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW)
+
+# inotify_event结构头：wd, mask, cookie, len
+INOTIFY_EVENT = struct.Struct('iIII')
+
+# ReadDirectoryChangesW参数
+FILE_LIST_DIRECTORY = 0x0001
+FILE_SHARE_ALL = 0x00000007
+OPEN_EXISTING = 3
+FILE_FLAG_BACKUP_SEMANTICS = 0x02000000
+FILE_NOTIFY_CHANGE_FILE_NAME = 0x00000001
+FILE_NOTIFY_CHANGE_DIR_NAME = 0x00000002
+FILE_NOTIFY_CHANGE_SIZE = 0x00000008
+FILE_NOTIFY_CHANGE_LAST_WRITE = 0x00000010
+ERROR_OPERATION_ABORTED = 995
+
+class WatchBackend:
+    """文件系统变化通知后端的公共接口
+
+    run在监视线程中阻塞执行，每发现一个变化调用一次emit(事件类型, 路径)，
+    直到stop_event被设置。add_directory/remove_directory在遍历树增删目录时调用。
+    """
+    name = 'base'
+
+    def add_directory(self, path):
+        """开始监视新加入分析树的目录"""
+
+    def remove_directory(self, path):
+        """停止监视从分析树移除的目录及其子目录"""
+
+    def run(self, emit, stop_event):
+        raise NotImplementedError
+
+    def stop(self):
+        """唤醒阻塞中的run"""
+
+    def close(self):
+        """释放后端资源"""
+
+class InotifyBackend(WatchBackend):
+    """Linux inotify后端 - 每个目录一个监视描述符"""
+    name = 'inotify'
+
+    def __init__(self, directories, logger):
+        self.logger = logger
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1失败")
+        # 监视描述符与目录路径的双向映射
+        self.paths = {}
+        self.descriptors = {}
+        self.lock = threading.Lock()
+        for directory in directories:
+            self._add_watch(directory, strict=True)
+
+    def _add_watch(self, path, strict=False):
+        """为单个目录添加监视，strict为True时监视数达到上限会抛出异常"""
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), INOTIFY_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if strict and error == errno.ENOSPC:
+                raise OSError(error, "inotify监视数达到上限（fs.inotify.max_user_watches）")
+            self.logger.warning(f"无法监视目录 {path}: {os.strerror(error)}")
+            return
+        with self.lock:
+            self.paths[wd] = path
+            self.descriptors[path] = wd
+
+    def add_directory(self, path):
+        self._add_watch(path)
+
+    def remove_directory(self, path):
+        prefix = path + os.sep
+        with self.lock:
+            removed = [p for p in self.descriptors if p == path or p.startswith(prefix)]
+            for p in removed:
+                wd = self.descriptors.pop(p)
+                self.paths.pop(wd, None)
+                self.libc.inotify_rm_watch(self.fd, wd)
+
+    def run(self, emit, stop_event):
+        while not stop_event.is_set():
+            # 带超时的select使停止请求能及时生效
+            readable, _, _ = select.select([self.fd], [], [], 0.5)
+            if not readable:
+                continue
+            try:
+                data = os.read(self.fd, 256 * 1024)
+            except BlockingIOError:
+                continue
+
+            offset = 0
+            while offset + INOTIFY_EVENT.size <= len(data):
+                wd, mask, cookie, length = INOTIFY_EVENT.unpack_from(data, offset)
+                offset += INOTIFY_EVENT.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+
+                if mask & IN_Q_OVERFLOW:
+                    emit(EVENT_OVERFLOW, None)
+                    continue
+                with self.lock:
+                    directory = self.paths.get(wd)
+                    if mask & IN_IGNORED and directory is not None:
+                        # 目录被删除或卸载，内核已自动移除监视
+                        self.paths.pop(wd, None)
+                        self.descriptors.pop(directory, None)
+                if directory is None or mask & IN_IGNORED:
+                    continue
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    emit(EVENT_ENTRY, directory)
+                elif name:
+                    emit(EVENT_ENTRY, os.path.join(directory, os.fsdecode(name)))
+
+    def close(self):
+        os.close(self.fd)
+
+class WindowsBackend(WatchBackend):
+    """Windows ReadDirectoryChangesW后端 - 对根目录递归监视，无需逐个目录注册"""
+    name = 'windows'
+
+    def __init__(self, root, logger):
+        self.root = root
+        self.logger = logger
+        self.kernel32 = ctypes.windll.kernel32
+        self.kernel32.CreateFileW.restype = ctypes.c_void_p
+        handle = self.kernel32.CreateFileW(ctypes.c_wchar_p(root), FILE_LIST_DIRECTORY, FILE_SHARE_ALL, None,
+                                           OPEN_EXISTING, FILE_FLAG_BACKUP_SEMANTICS, None)
+        if handle is None or handle == ctypes.c_void_p(-1).value:
+            raise ctypes.WinError()
+        self.handle = ctypes.c_void_p(handle)
+
+    def run(self, emit, stop_event):
+        buffer = ctypes.create_string_buffer(64 * 1024)
+        returned = ctypes.c_ulong(0)
+        notify_filter = (FILE_NOTIFY_CHANGE_FILE_NAME | FILE_NOTIFY_CHANGE_DIR_NAME |
+                         FILE_NOTIFY_CHANGE_SIZE | FILE_NOTIFY_CHANGE_LAST_WRITE)
+        while not stop_event.is_set():
+            # 同步调用会阻塞到有变化为止，stop()通过CancelIoEx中断
+            if not self.kernel32.ReadDirectoryChangesW(self.handle, buffer, len(buffer), True, notify_filter,
+                                                       ctypes.byref(returned), None, None):
+                if ctypes.GetLastError() != ERROR_OPERATION_ABORTED:
+                    self.logger.warning(f"监视 {self.root} 时出错: {ctypes.WinError()}")
+                return
+            if returned.value == 0:
+                # 缓冲区不足以容纳全部变化
+                emit(EVENT_OVERFLOW, None)
+                continue
+
+            # FILE_NOTIFY_INFORMATION: NextEntryOffset, Action, FileNameLength, FileName
+            data = buffer.raw[:returned.value]
+            offset = 0
+            while True:
+                next_offset, action, length = struct.unpack_from('<III', data, offset)
+                name = data[offset + 12:offset + 12 + length].decode('utf-16-le', 'surrogatepass')
+                emit(EVENT_ENTRY, os.path.join(self.root, name))
+                if next_offset == 0:
+                    break
+                offset += next_offset
+
+    def stop(self):
+        self.kernel32.CancelIoEx(self.handle, None)
+
+    def close(self):
+        self.kernel32.CloseHandle(self.handle)
+
+class PollingBackend(WatchBackend):
+    """轮询后端 - 定期比较目录的修改时间
+
+    只能发现目录内条目的增删和重命名，已有文件的原地增长要等到所在目录有其他变化时才会被发现。
+    """
+    name = 'polling'
+
+    def __init__(self, directories, logger, interval=5.0):
+        self.logger = logger
+        self.interval = interval
+        self.lock = threading.Lock()
+        # 目录 -> 上次看到的mtime_ns
+        self.mtimes = {}
+        for directory in directories:
+            self.add_directory(directory)
+
+    def add_directory(self, path):
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return
+        with self.lock:
+            self.mtimes[path] = mtime
+
+    def remove_directory(self, path):
+        prefix = path + os.sep
+        with self.lock:
+            for p in [p for p in self.mtimes if p == path or p.startswith(prefix)]:
+                del self.mtimes[p]
+
+    def run(self, emit, stop_event):
+        while not stop_event.wait(self.interval):
+            with self.lock:
+                directories = list(self.mtimes.items())
+            for directory, mtime in directories:
+                if stop_event.is_set():
+                    return
+                try:
+                    current = os.stat(directory).st_mtime_ns
+                except OSError:
+                    # 目录已不存在，父目录的变化会触发核对
+                    continue
+                if current != mtime:
+                    with self.lock:
+                        if directory in self.mtimes:
+                            self.mtimes[directory] = current
+                    emit(EVENT_DIRECTORY, directory)
+
+class FsWatcher:
+    def __init__(self, root, directories, on_changes, batch_interval=1.0, backend=None, poll_interval=5.0):
+        """监视root下的文件系统变化，把一段时间内的事件合并后交给on_changes
+
+        directories为需要监视的目录列表（inotify和轮询后端逐个目录监视）。
+        on_changes接收 {'entries': 路径集合, 'directories': 目录集合, 'overflow': 是否溢出}。
+        backend可指定'inotify'、'windows'或'polling'，默认按平台选择，初始化失败时退回轮询。
+        """
+        # 设置日志
+        logging.basicConfig(level=logging.INFO,
+                           format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        self.logger = logging.getLogger('FsWatcher')
+
+        self.root = root
+        self.on_changes = on_changes
+        self.batch_interval = batch_interval
+        self.backend = self._create_backend(backend, root, directories, poll_interval)
+
+        # 待处理事件，由监视线程写入、分发线程批量取出
+        self.events = []
+        self.events_lock = threading.Lock()
+        self.events_ready = threading.Event()
+        self.stop_event = threading.Event()
+        self.threads = []
+
+    def _create_backend(self, backend, root, directories, poll_interval):
+        """按平台创建通知后端"""
+        if backend is None:
+            if sys.platform.startswith('linux'):
+                backend = 'inotify'
+            elif os.name == 'nt':
+                backend = 'windows'
+            else:
+                backend = 'polling'
+
+        try:
+            if backend == 'inotify':
+                return InotifyBackend(directories, self.logger)
+            if backend == 'windows':
+                return WindowsBackend(root, self.logger)
+        except Exception as e:
+            self.logger.warning(f"无法使用{backend}监视 {root}，改为轮询: {e}")
+        return PollingBackend(directories, self.logger, poll_interval)
+
+    def start(self):
+        """启动监视线程和分发线程"""
+        self.threads = [
+            threading.Thread(target=self._watch_loop, name='FsWatcher', daemon=True),
+            threading.Thread(target=self._dispatch_loop, name='FsWatcherDispatch', daemon=True)
+        ]
+        for thread in self.threads:
+            thread.start()
+        self.logger.info(f"开始监视 {self.root}（{self.backend.name}）")
+
+    def stop(self):
+        """停止监视并等待线程退出"""
+        self.stop_event.set()
+        self.events_ready.set()
+        self.backend.stop()
+        for thread in self.threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=5)
+        self.backend.close()
+        self.threads = []
+
+    def add_directory(self, path):
+        self.backend.add_directory(path)
+
+    def remove_directory(self, path):
+        self.backend.remove_directory(path)
+
+    def _emit(self, kind, path):
+        """在监视线程中记录一个事件"""
+        with self.events_lock:
+            self.events.append((kind, path))
+        self.events_ready.set()
+
+    def _watch_loop(self):
+        try:
+            self.backend.run(self._emit, self.stop_event)
+        except Exception as e:
+            self.logger.error(f"监视 {self.root} 时出错: {e}")
+
+    def _dispatch_loop(self):
+        """等待第一个事件后再等待batch_interval，把这段时间内的突发事件合并为一批"""
+        while not self.stop_event.is_set():
+            self.events_ready.wait()
+            if self.stop_event.wait(self.batch_interval):
+                return
+
+            with self.events_lock:
+                events = self.events
+                self.events = []
+                self.events_ready.clear()
+
+            changes = {'entries': set(), 'directories': set(), 'overflow': False}
+            for kind, path in events:
+                if kind == EVENT_OVERFLOW:
+                    changes['overflow'] = True
+                elif kind == EVENT_DIRECTORY:
+                    changes['directories'].add(path)
+                else:
+                    changes['entries'].add(path)
+
+            try:
+                self.on_changes(changes)
+            except Exception as e:
+                self.logger.error(f"处理 {self.root} 的变化时出错: {e}")
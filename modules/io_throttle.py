@@ -0,0 +1,209 @@
+import os
+import sys
+import time
+import ctypes
+import ctypes.util
+import logging
+import threading
+import psutil
+from modules.device_info import DeviceResolver
+
+# 后台模式下磁盘利用率的默认上限（0到1）
+DEFAULT_MAX_UTILIZATION = 0.3
+# 平均每次I/O的延迟超过该值（毫秒）时同样视为磁盘繁忙
+DEFAULT_MAX_LATENCY_MS = 30.0
+# 采样磁盘计数器的最小间隔（秒）
+SAMPLE_INTERVAL = 0.5
+# 每次等待的延迟范围（秒）
+MIN_DELAY = 0.005
+MAX_DELAY = 1.0
+
+# Windows线程后台模式：同时降低线程的CPU、I/O和内存优先级
+THREAD_MODE_BACKGROUND_BEGIN = 0x00010000
+# macOS的线程I/O策略
+IOPOL_TYPE_DISK = 0
+IOPOL_SCOPE_THREAD = 1
+IOPOL_THROTTLE = 3
+
+class PriorityBackend:
+    """降低当前线程优先级的公共接口
+
+    只作用于调用线程，由后台模式的工作线程在启动时调用；工作线程随遍历或清理结束而退出，
+    因此不需要恢复（Linux上普通用户无法把nice值调回去）。
+    """
+    name = 'none'
+
+    def lower_thread(self):
+        """降低当前线程的CPU和I/O优先级"""
+
+class LinuxPriority(PriorityBackend):
+    """Linux - 对线程ID设置nice 19和idle I/O调度类（相当于nice/ionice -c3）"""
+    name = 'linux'
+
+    def lower_thread(self):
+        tid = threading.get_native_id()
+        # Linux上PRIO_PROCESS配合线程ID只作用于该线程
+        os.setpriority(os.PRIO_PROCESS, tid, 19)
+        psutil.Process(tid).ionice(psutil.IOPRIO_CLASS_IDLE)
+
+class WindowsPriority(PriorityBackend):
+    """Windows - 线程后台模式"""
+    name = 'windows'
+
+    def __init__(self):
+        self.kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+        self.kernel32.GetCurrentThread.restype = ctypes.c_void_p
+        self.kernel32.SetThreadPriority.argtypes = [ctypes.c_void_p, ctypes.c_int]
+
+    def lower_thread(self):
+        if not self.kernel32.SetThreadPriority(self.kernel32.GetCurrentThread(), THREAD_MODE_BACKGROUND_BEGIN):
+            raise ctypes.WinError(ctypes.get_last_error())
+
+class DarwinPriority(PriorityBackend):
+    """macOS - 线程I/O节流策略，CPU优先级只能按进程设置，不做调整"""
+    name = 'darwin'
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+
+    def lower_thread(self):
+        if self.libc.setiopolicy_np(IOPOL_TYPE_DISK, IOPOL_SCOPE_THREAD, IOPOL_THROTTLE) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+def get_priority_backend():
+    """选择当前平台的线程优先级实现"""
+    try:
+        if os.name == 'nt':
+            return WindowsPriority()
+        if sys.platform.startswith('linux'):
+            return LinuxPriority()
+        if sys.platform == 'darwin':
+            return DarwinPriority()
+    except (OSError, AttributeError):
+        pass
+    return PriorityBackend()
+
+def lower_current_thread_priority():
+    """降低调用线程的优先级，可作为进程池的初始化函数"""
+    try:
+        get_priority_backend().lower_thread()
+    except Exception as e:
+        logging.getLogger('IoThrottle').warning(f"无法降低线程优先级: {e}")
+
+class IoThrottle:
+    def __init__(self, max_utilization=DEFAULT_MAX_UTILIZATION, max_latency_ms=DEFAULT_MAX_LATENCY_MS,
+                 resolver=None, priority=None):
+        # 设置日志
+        logging.basicConfig(level=logging.INFO,
+                           format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        self.logger = logging.getLogger('IoThrottle')
+
+        self.max_utilization = max(0.01, min(1.0, max_utilization))
+        self.max_latency_ms = max_latency_ms
+        self.resolver = resolver or DeviceResolver()
+        self.priority = priority or get_priority_backend()
+
+        # 受监控的磁盘（psutil.disk_io_counters中的名称），为空时监控所有磁盘的合计
+        self.disks = set()
+        self.lock = threading.Lock()
+        self.delay = 0.0
+        self.last_sample = None
+        self.last_counters = None
+        self.utilization = 0.0
+        self.latency_ms = 0.0
+
+    def watch_path(self, path):
+        """监控path所在的物理磁盘"""
+        device, _ = self.resolver.get_path_device(path)
+        if not device:
+            return
+        # /dev/sda -> sda，\\.\PhysicalDrive0 -> PhysicalDrive0，与psutil的磁盘名一致
+        name = device.replace('\\', '/').rsplit('/', 1)[-1]
+        try:
+            known = psutil.disk_io_counters(perdisk=True) or {}
+        except Exception:
+            known = {}
+        if name in known:
+            with self.lock:
+                if name not in self.disks:
+                    self.disks.add(name)
+                    # 磁盘集合变化后重新开始采样
+                    self.last_counters = None
+
+    def lower_thread_priority(self):
+        """降低当前线程的优先级，用作后台工作线程的初始化函数"""
+        try:
+            self.priority.lower_thread()
+        except Exception as e:
+            self.logger.warning(f"无法降低线程优先级: {e}")
+
+    def _read_counters(self):
+        """读取受监控磁盘的计数器之和：(忙碌毫秒数, 读写耗时毫秒数, 读写次数)"""
+        if self.disks:
+            per_disk = psutil.disk_io_counters(perdisk=True) or {}
+            counters = [per_disk[name] for name in self.disks if name in per_disk]
+        else:
+            total = psutil.disk_io_counters()
+            counters = [total] if total else []
+        busy = io_time = operations = 0
+        for counter in counters:
+            io_time += counter.read_time + counter.write_time
+            operations += counter.read_count + counter.write_count
+            # busy_time只在Linux和FreeBSD上提供，其他平台以读写耗时估算
+            busy += getattr(counter, 'busy_time', counter.read_time + counter.write_time)
+        return busy, io_time, operations
+
+    def _update(self):
+        """按采样间隔更新磁盘利用率和延迟，并据此调整延迟：超过上限时加倍，明显低于上限时减半"""
+        now = time.monotonic()
+        with self.lock:
+            if self.last_sample is not None and now - self.last_sample < SAMPLE_INTERVAL:
+                return self.delay
+            try:
+                counters = self._read_counters()
+            except Exception as e:
+                self.logger.warning(f"无法读取磁盘I/O计数器: {e}")
+                return self.delay
+
+            if self.last_counters is not None:
+                elapsed_ms = (now - self.last_sample) * 1000
+                busy = counters[0] - self.last_counters[0]
+                io_time = counters[1] - self.last_counters[1]
+                operations = counters[2] - self.last_counters[2]
+                self.utilization = min(1.0, busy / elapsed_ms) if elapsed_ms > 0 else 0.0
+                self.latency_ms = io_time / operations if operations > 0 else 0.0
+
+                congested = (self.utilization > self.max_utilization or
+                             (self.max_latency_ms and self.latency_ms > self.max_latency_ms))
+                if congested:
+                    self.delay = min(MAX_DELAY, max(MIN_DELAY, self.delay * 2))
+                elif self.utilization < self.max_utilization * 0.5:
+                    self.delay = self.delay / 2 if self.delay > MIN_DELAY else 0.0
+
+            self.last_sample = now
+            self.last_counters = counters
+            return self.delay
+
+    def wait(self, cancel_event=None):
+        """磁盘繁忙时让出一段时间，由遍历和删除在处理每个目录前调用
+
+        cancel_event被设置时立即返回。
+        """
+        delay = self._update()
+        if delay <= 0:
+            return
+        if cancel_event is not None:
+            cancel_event.wait(delay)
+        else:
+            time.sleep(delay)
+
+    def get_status(self):
+        """获取最近一次采样的磁盘利用率、平均延迟和当前的等待时间"""
+        with self.lock:
+            return {
+                'utilization': self.utilization,
+                'latency_ms': self.latency_ms,
+                'delay': self.delay,
+                'max_utilization': self.max_utilization
+            }
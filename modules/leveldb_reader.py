@@ -0,0 +1,218 @@
+import os
+import struct
+import logging
+
+# SSTable文件尾：两个BlockHandle（最多40字节）加8字节魔数
+TABLE_FOOTER_SIZE = 48
+TABLE_MAGIC = 0xdb4775248b80fb57
+# 每个块之后的压缩类型（1字节）和CRC（4字节）
+BLOCK_TRAILER_SIZE = 5
+COMPRESSION_NONE = 0
+COMPRESSION_SNAPPY = 1
+
+# 日志文件按32KB分块，每条记录有7字节的头：CRC(4)、长度(2)、类型(1)
+LOG_BLOCK_SIZE = 32768
+LOG_HEADER_SIZE = 7
+LOG_FULL = 1
+LOG_FIRST = 2
+LOG_MIDDLE = 3
+LOG_LAST = 4
+
+# 内部键的类型：删除标记和值
+TYPE_DELETION = 0
+TYPE_VALUE = 1
+
+class LevelDBError(Exception):
+    """LevelDB文件格式无法识别或已损坏"""
+
+def read_varint(data, pos):
+    """从pos读取一个varint，返回 (值, 新位置)"""
+    result = 0
+    shift = 0
+    while True:
+        if pos >= len(data) or shift > 63:
+            raise LevelDBError("varint越界")
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+def snappy_decompress(data):
+    """解压snappy原始格式的数据（LevelDB块使用的压缩格式）"""
+    length, pos = read_varint(data, 0)
+    out = bytearray()
+    end = len(data)
+    while pos < end:
+        tag = data[pos]
+        pos += 1
+        kind = tag & 3
+        if kind == 0:
+            # 字面量，长度超过60时后跟1到4字节的长度
+            size = tag >> 2
+            if size >= 60:
+                extra = size - 59
+                size = int.from_bytes(data[pos:pos + extra], 'little')
+                pos += extra
+            size += 1
+            out += data[pos:pos + size]
+            pos += size
+            continue
+        if kind == 1:
+            size = ((tag >> 2) & 7) + 4
+            offset = ((tag >> 5) << 8) | data[pos]
+            pos += 1
+        elif kind == 2:
+            size = (tag >> 2) + 1
+            offset = int.from_bytes(data[pos:pos + 2], 'little')
+            pos += 2
+        else:
+            size = (tag >> 2) + 1
+            offset = int.from_bytes(data[pos:pos + 4], 'little')
+            pos += 4
+        if offset == 0 or offset > len(out):
+            raise LevelDBError("snappy数据损坏")
+        start = len(out) - offset
+        if offset >= size:
+            out += out[start:start + size]
+        else:
+            # 重叠复制：逐段复制已产出的内容
+            for i in range(size):
+                out.append(out[start + i])
+    if len(out) != length:
+        raise LevelDBError("snappy解压长度不符")
+    return bytes(out)
+
+def iter_block(block):
+    """遍历块中的 (键, 值)，键按前缀压缩存储"""
+    if len(block) < 4:
+        raise LevelDBError("块过短")
+    num_restarts = struct.unpack_from('<I', block, len(block) - 4)[0]
+    limit = len(block) - 4 - num_restarts * 4
+    if limit < 0:
+        raise LevelDBError("重启点数量无效")
+    pos = 0
+    key = b''
+    while pos < limit:
+        shared, pos = read_varint(block, pos)
+        non_shared, pos = read_varint(block, pos)
+        value_length, pos = read_varint(block, pos)
+        key = key[:shared] + block[pos:pos + non_shared]
+        pos += non_shared
+        yield key, block[pos:pos + value_length]
+        pos += value_length
+
+def _read_block(f, handle):
+    """读取并按需解压BlockHandle指向的块"""
+    offset, pos = read_varint(handle, 0)
+    size, _ = read_varint(handle, pos)
+    f.seek(offset)
+    data = f.read(size + BLOCK_TRAILER_SIZE)
+    if len(data) != size + BLOCK_TRAILER_SIZE:
+        raise LevelDBError("块被截断")
+    compression = data[size]
+    if compression == COMPRESSION_NONE:
+        return data[:size]
+    if compression == COMPRESSION_SNAPPY:
+        return snappy_decompress(data[:size])
+    raise LevelDBError(f"不支持的压缩类型: {compression}")
+
+def iter_table(path):
+    """顺序遍历SSTable（.ldb/.sst）中的 (用户键, 序列号, 类型, 值)，一次只在内存中保留一个块"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        file_size = f.tell()
+        if file_size < TABLE_FOOTER_SIZE:
+            raise LevelDBError("文件过短")
+        f.seek(file_size - TABLE_FOOTER_SIZE)
+        footer = f.read(TABLE_FOOTER_SIZE)
+        if struct.unpack_from('<Q', footer, TABLE_FOOTER_SIZE - 8)[0] != TABLE_MAGIC:
+            raise LevelDBError("魔数不符")
+
+        # 跳过metaindex，读取index块的BlockHandle
+        _, pos = read_varint(footer, 0)
+        _, pos = read_varint(footer, pos)
+        index = _read_block(f, footer[pos:])
+        for _, handle in iter_block(index):
+            for internal_key, value in iter_block(_read_block(f, handle)):
+                if len(internal_key) < 8:
+                    raise LevelDBError("内部键过短")
+                tag = struct.unpack_from('<Q', internal_key, len(internal_key) - 8)[0]
+                yield internal_key[:-8], tag >> 8, tag & 0xff, value
+
+def _iter_log_records(f):
+    """遍历日志文件中的完整记录（拼接分片）"""
+    fragments = []
+    while True:
+        block = f.read(LOG_BLOCK_SIZE)
+        if not block:
+            return
+        pos = 0
+        while pos + LOG_HEADER_SIZE <= len(block):
+            length, kind = struct.unpack_from('<HB', block, pos + 4)
+            if kind == 0 and length == 0:
+                # 预分配的空白区域
+                break
+            data = block[pos + LOG_HEADER_SIZE:pos + LOG_HEADER_SIZE + length]
+            pos += LOG_HEADER_SIZE + length
+            if kind == LOG_FULL:
+                fragments = []
+                yield data
+            elif kind == LOG_FIRST:
+                fragments = [data]
+            elif kind == LOG_MIDDLE:
+                fragments.append(data)
+            elif kind == LOG_LAST:
+                fragments.append(data)
+                yield b''.join(fragments)
+                fragments = []
+
+def iter_log(path):
+    """遍历日志文件（.log）中写入批次的 (用户键, 序列号, 类型, 值)，删除时值为None"""
+    with open(path, 'rb') as f:
+        for record in _iter_log_records(f):
+            if len(record) < 12:
+                continue
+            sequence, count = struct.unpack_from('<QI', record)
+            pos = 12
+            for i in range(count):
+                if pos >= len(record):
+                    raise LevelDBError("写入批次被截断")
+                kind = record[pos]
+                pos += 1
+                key_length, pos = read_varint(record, pos)
+                key = record[pos:pos + key_length]
+                pos += key_length
+                value = None
+                if kind == TYPE_VALUE:
+                    value_length, pos = read_varint(record, pos)
+                    value = record[pos:pos + value_length]
+                    pos += value_length
+                yield key, sequence + i, kind, value
+
+def iter_database(directory, prefix=b''):
+    """遍历数据库目录中所有表和日志里以prefix开头的记录，返回 (用户键, 序列号, 类型, 值)
+
+    同一个键可能出现多次，调用方按序列号取最新的一条。无法解析的文件记录警告后跳过。
+    """
+    logger = logging.getLogger('LevelDBReader')
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError as e:
+        logger.warning(f"无法列出 {directory}: {e}")
+        return
+    for name in names:
+        if name.endswith(('.ldb', '.sst')):
+            reader = iter_table
+        elif name.endswith('.log'):
+            reader = iter_log
+        else:
+            continue
+        path = os.path.join(directory, name)
+        try:
+            for key, sequence, kind, value in reader(path):
+                if key.startswith(prefix):
+                    yield key, sequence, kind, value
+        except (OSError, LevelDBError, struct.error, IndexError) as e:
+            logger.warning(f"无法解析 {path}: {e}")
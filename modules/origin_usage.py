@@ -0,0 +1,419 @@
+import os
+import re
+import struct
+import logging
+from collections import namedtuple
+from urllib.parse import urlsplit, unquote
+from modules.file_walker import FileWalker
+from modules.cache_index import (SIMPLE_INDEX_DIR, BLOCKFILE_INDEX_FILE, BLOCKFILE_MAGIC, BLOCKFILE_HEADER,
+                                 FIREFOX_INDEX_FILE)
+from modules.leveldb_reader import iter_database, read_varint, LevelDBError, TYPE_VALUE
+
+# 按站点统计的数据类型
+KIND_CACHE = 'cache'
+KIND_INDEXEDDB = 'indexeddb'
+KIND_CACHE_STORAGE = 'cache_storage'
+KIND_LOCAL_STORAGE = 'local_storage'
+ORIGIN_KINDS = (KIND_CACHE, KIND_INDEXEDDB, KIND_CACHE_STORAGE, KIND_LOCAL_STORAGE)
+
+# 站点的一项数据：paths为按站点清理时删除的文件或目录，为空表示无法单独删除
+# （blockfile缓存条目和Chromium的Local Storage都存放在共享的数据库中）
+OriginItem = namedtuple('OriginItem', ['origin', 'kind', 'size', 'paths'])
+
+# 各协议的默认端口，来源中省略
+DEFAULT_PORTS = {
+    'http': 80,
+    'https': 443,
+    'ws': 80,
+    'wss': 443
+}
+URL_PATTERN = re.compile(r'[a-z][a-z0-9+.\-]*://[^\s]+')
+# Firefox缓存键中的分区键：partitionKey=%28https%2Cexample.com%29
+PARTITION_PATTERN = re.compile(r'partitionKey=([^,:]+)')
+
+# Chromium Simple Cache条目文件：<16位哈希>_0为键和流0/1，_1为流2，_s为稀疏数据
+SIMPLE_ENTRY_PATTERN = re.compile(r'^[0-9a-f]{16}_0$')
+SIMPLE_ENTRY_SUFFIXES = ('_1', '_s')
+SIMPLE_FILE_MAGIC = 0xfcfb6d1ba7725c30
+# 魔数(8)、版本(4)、键长度(4)、键哈希(4)，按8字节对齐后为24字节
+SIMPLE_FILE_HEADER = struct.Struct('<QIII')
+SIMPLE_FILE_HEADER_SIZE = 24
+MAX_KEY_LENGTH = 65536
+
+# Chromium blockfile缓存：索引文件头之后是哈希表，每个槽位是指向条目的CacheAddr
+BLOCKFILE_INDEX_HEADER_SIZE = 368
+BLOCKFILE_TABLE_CHUNK = 4096
+BLOCKFILE_BLOCK_HEADER_SIZE = 8192
+# hash, next, rankings_node, reuse_count, refetch_count, state, creation_time, key_len, long_key,
+# data_size[4], data_addr[4]；键从第96字节开始内联存放
+BLOCKFILE_ENTRY = struct.Struct('<IIIiiiQiI4i4I')
+BLOCKFILE_KEY_OFFSET = 96
+# CacheAddr的各个字段
+ADDR_INITIALIZED = 0x80000000
+ADDR_FILE_TYPE_MASK = 0x70000000
+ADDR_FILE_TYPE_OFFSET = 28
+ADDR_NUM_BLOCKS_MASK = 0x03000000
+ADDR_NUM_BLOCKS_OFFSET = 24
+ADDR_FILE_SELECTOR_MASK = 0x00ff0000
+ADDR_FILE_SELECTOR_OFFSET = 16
+ADDR_START_BLOCK_MASK = 0x0000ffff
+ADDR_FILE_NAME_MASK = 0x0fffffff
+# 文件类型 -> 块大小，类型0为独立的f_xxxxxx文件
+BLOCK_SIZES = {
+    1: 36,
+    2: 256,
+    3: 1024,
+    4: 4096,
+    6: 104,
+    7: 48
+}
+# 每个哈希槽位的链表最多跟随的条目数，防止损坏的索引形成环
+MAX_CHAIN_LENGTH = 1024
+
+# Firefox cache2条目文件：数据之后是元数据，文件最后4字节为元数据的偏移（大端序）
+FIREFOX_ENTRIES_DIR = 'entries'
+FIREFOX_CHUNK_SIZE = 256 * 1024
+# version, fetch_count, last_fetched, last_modified, frecency, expiration_time, key_size, flags
+FIREFOX_METADATA_HEADER = struct.Struct('>8I')
+FIREFOX_METADATA_HEADER_V1_SIZE = 28
+
+# Chromium的Local Storage数据库中每个站点的元数据键，值中字段2为该站点数据的字节数
+LOCAL_STORAGE_META_PREFIX = b'META:'
+LOCAL_STORAGE_SIZE_FIELD = 2
+# CacheStorage每个站点目录中的index.txt，字段2为站点，字段4为存储键
+CACHE_STORAGE_INDEX = 'index.txt'
+CACHE_STORAGE_ORIGIN_FIELDS = (2, 4)
+# IndexedDB目录名后缀
+INDEXEDDB_SUFFIXES = ('.indexeddb.leveldb', '.indexeddb.blob')
+# Firefox每个站点的存储目录中各类数据的子目录
+FIREFOX_STORAGE_KINDS = {
+    'idb': KIND_INDEXEDDB,
+    'ls': KIND_LOCAL_STORAGE,
+    'cache': KIND_CACHE_STORAGE
+}
+
+def normalize_origin(url):
+    """把URL规范化为 协议://主机[:端口]，无法识别时返回None"""
+    try:
+        parts = urlsplit(url)
+        host = parts.hostname
+        port = parts.port
+    except ValueError:
+        return None
+    if not parts.scheme or not host:
+        return None
+    scheme = parts.scheme.lower()
+    if port and port != DEFAULT_PORTS.get(scheme):
+        return f"{scheme}://{host}:{port}"
+    return f"{scheme}://{host}"
+
+def origin_from_cache_key(key):
+    """从缓存键中取出归属的站点
+
+    按顶层站点分区的键（Chromium的_dk_前缀、Firefox的partitionKey）归属到顶层站点，
+    其他键归属到资源URL所在的站点。
+    """
+    if isinstance(key, bytes):
+        key = key.decode('utf-8', 'replace')
+    partition = PARTITION_PATTERN.search(key)
+    if partition:
+        parts = unquote(partition.group(1)).strip('()').split(',')
+        if len(parts) >= 2:
+            port = f":{parts[2]}" if len(parts) > 2 else ''
+            return normalize_origin(f"{parts[0]}://{parts[1]}{port}")
+    double_key = key.find('_dk_')
+    if double_key >= 0:
+        match = URL_PATTERN.search(key, double_key)
+        if match:
+            return normalize_origin(match.group(0))
+    urls = URL_PATTERN.findall(key)
+    return normalize_origin(urls[-1]) if urls else None
+
+def iter_proto_fields(data):
+    """遍历protobuf消息的顶层字段，返回 (字段号, 值)，长度限定的字段值为bytes"""
+    pos = 0
+    while pos < len(data):
+        tag, pos = read_varint(data, pos)
+        field, wire_type = tag >> 3, tag & 7
+        if wire_type == 0:
+            value, pos = read_varint(data, pos)
+        elif wire_type == 1:
+            value = data[pos:pos + 8]
+            pos += 8
+        elif wire_type == 2:
+            length, pos = read_varint(data, pos)
+            value = data[pos:pos + length]
+            pos += length
+        elif wire_type == 5:
+            value = data[pos:pos + 4]
+            pos += 4
+        else:
+            raise LevelDBError(f"不支持的protobuf字段类型: {wire_type}")
+        yield field, value
+
+class OriginUsageScanner:
+    def __init__(self, walker=None):
+        # 设置日志
+        logging.basicConfig(level=logging.INFO,
+                           format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        self.logger = logging.getLogger('OriginUsageScanner')
+
+        self.walker = walker or FileWalker()
+
+    def _iter_simple_cache(self, cache_dir):
+        """逐个读取Simple Cache条目文件头中的键，只在内存中保留当前条目"""
+        with os.scandir(cache_dir) as it:
+            for entry in it:
+                if not SIMPLE_ENTRY_PATTERN.match(entry.name):
+                    continue
+                try:
+                    size = entry.stat(follow_symlinks=False).st_size
+                    with open(entry.path, 'rb') as f:
+                        header = f.read(SIMPLE_FILE_HEADER_SIZE)
+                        if len(header) < SIMPLE_FILE_HEADER_SIZE:
+                            continue
+                        magic, _, key_length, _ = SIMPLE_FILE_HEADER.unpack_from(header)
+                        if magic != SIMPLE_FILE_MAGIC or key_length > MAX_KEY_LENGTH:
+                            continue
+                        key = f.read(key_length)
+                except OSError as e:
+                    self.logger.warning(f"无法读取缓存条目 {entry.path}: {e}")
+                    continue
+
+                paths = [entry.path]
+                base = entry.path[:-2]
+                for suffix in SIMPLE_ENTRY_SUFFIXES:
+                    try:
+                        size += os.stat(base + suffix).st_size
+                        paths.append(base + suffix)
+                    except OSError:
+                        pass
+                yield OriginItem(origin_from_cache_key(key), KIND_CACHE, size, paths)
+
+    def _iter_blockfile_cache(self, cache_dir):
+        """顺序读取blockfile索引的哈希表，按链表读取每个条目的键和数据大小
+
+        条目和索引共用数据文件，无法单独删除，产出的paths为空。
+        """
+        with open(os.path.join(cache_dir, BLOCKFILE_INDEX_FILE), 'rb') as index:
+            header = index.read(BLOCKFILE_INDEX_HEADER_SIZE)
+            if len(header) < BLOCKFILE_INDEX_HEADER_SIZE:
+                return
+            fields = BLOCKFILE_HEADER.unpack_from(header)
+            magic, table_length = fields[0], fields[7]
+            if magic != BLOCKFILE_MAGIC or table_length <= 0:
+                return
+
+            block_files = {}
+
+            def read_addr(addr, length):
+                if not addr & ADDR_INITIALIZED:
+                    return b''
+                file_type = (addr & ADDR_FILE_TYPE_MASK) >> ADDR_FILE_TYPE_OFFSET
+                if file_type == 0:
+                    name = f"f_{addr & ADDR_FILE_NAME_MASK:06x}"
+                    with open(os.path.join(cache_dir, name), 'rb') as f:
+                        return f.read(length)
+                block_size = BLOCK_SIZES.get(file_type)
+                if block_size is None:
+                    return b''
+                number = (addr & ADDR_FILE_SELECTOR_MASK) >> ADDR_FILE_SELECTOR_OFFSET
+                blocks = ((addr & ADDR_NUM_BLOCKS_MASK) >> ADDR_NUM_BLOCKS_OFFSET) + 1
+                f = block_files.get(number)
+                if f is None:
+                    f = block_files[number] = open(os.path.join(cache_dir, f"data_{number}"), 'rb')
+                f.seek(BLOCKFILE_BLOCK_HEADER_SIZE + (addr & ADDR_START_BLOCK_MASK) * block_size)
+                return f.read(min(length, blocks * block_size))
+
+            try:
+                remaining = table_length
+                while remaining > 0:
+                    count = min(remaining, BLOCKFILE_TABLE_CHUNK)
+                    table = index.read(count * 4)
+                    remaining -= count
+                    for bucket in struct.unpack(f'<{len(table) // 4}I', table[:len(table) // 4 * 4]):
+                        addr = bucket
+                        chain = 0
+                        while addr and chain < MAX_CHAIN_LENGTH:
+                            chain += 1
+                            data = read_addr(addr, BLOCKFILE_KEY_OFFSET + MAX_KEY_LENGTH)
+                            if len(data) < BLOCKFILE_KEY_OFFSET:
+                                break
+                            fields = BLOCKFILE_ENTRY.unpack_from(data)
+                            addr = fields[1]
+                            key_length, long_key = fields[7], fields[8]
+                            if not 0 <= key_length <= MAX_KEY_LENGTH:
+                                continue
+                            if long_key:
+                                key = read_addr(long_key, key_length)
+                            else:
+                                key = data[BLOCKFILE_KEY_OFFSET:BLOCKFILE_KEY_OFFSET + key_length]
+                            size = sum(max(0, length) for length in fields[9:13])
+                            yield OriginItem(origin_from_cache_key(key), KIND_CACHE, size, [])
+                    if len(table) < count * 4:
+                        break
+            finally:
+                for f in block_files.values():
+                    f.close()
+
+    def _iter_firefox_cache(self, cache_dir):
+        """读取cache2中每个条目文件末尾元数据里的键"""
+        with os.scandir(os.path.join(cache_dir, FIREFOX_ENTRIES_DIR)) as it:
+            for entry in it:
+                try:
+                    size = entry.stat(follow_symlinks=False).st_size
+                    if size < 4:
+                        continue
+                    with open(entry.path, 'rb') as f:
+                        f.seek(size - 4)
+                        offset = struct.unpack('>I', f.read(4))[0]
+                        chunks = (offset + FIREFOX_CHUNK_SIZE - 1) // FIREFOX_CHUNK_SIZE
+                        header_offset = offset + 4 + chunks * 2
+                        if header_offset + FIREFOX_METADATA_HEADER.size > size:
+                            continue
+                        f.seek(header_offset)
+                        fields = FIREFOX_METADATA_HEADER.unpack(f.read(FIREFOX_METADATA_HEADER.size))
+                        version, key_size = fields[0], fields[6]
+                        if key_size > MAX_KEY_LENGTH:
+                            continue
+                        if version < 2:
+                            f.seek(header_offset + FIREFOX_METADATA_HEADER_V1_SIZE)
+                        key = f.read(key_size)
+                except (OSError, struct.error) as e:
+                    self.logger.warning(f"无法读取缓存条目 {entry.path}: {e}")
+                    continue
+                yield OriginItem(origin_from_cache_key(key), KIND_CACHE, size, [entry.path])
+
+    def iter_cache(self, cache_dir, depth=1):
+        """识别缓存格式并逐条产出缓存条目的归属
+
+        目录本身不是缓存时（如Cache/Cache_Data、Code Cache/js和wasm），继续识别其子目录。
+        """
+        try:
+            names = set(os.listdir(cache_dir))
+        except OSError:
+            return
+        if os.path.isdir(os.path.join(cache_dir, FIREFOX_ENTRIES_DIR)) and FIREFOX_INDEX_FILE in names:
+            reader = self._iter_firefox_cache
+        elif SIMPLE_INDEX_DIR in names or any(SIMPLE_ENTRY_PATTERN.match(name) for name in names):
+            reader = self._iter_simple_cache
+        elif BLOCKFILE_INDEX_FILE in names and 'data_1' in names:
+            reader = self._iter_blockfile_cache
+        else:
+            if depth > 0:
+                for name in sorted(names):
+                    path = os.path.join(cache_dir, name)
+                    if os.path.isdir(path):
+                        yield from self.iter_cache(path, depth - 1)
+            return
+
+        try:
+            yield from reader(cache_dir)
+        except (OSError, struct.error) as e:
+            self.logger.warning(f"读取缓存 {cache_dir} 时出错: {e}")
+
+    def iter_chromium_indexeddb(self, directory):
+        """IndexedDB目录名为 协议_主机_端口.indexeddb.leveldb/.blob"""
+        try:
+            with os.scandir(directory) as it:
+                entries = [(entry.name, entry.path) for entry in it if entry.is_dir(follow_symlinks=False)]
+        except OSError:
+            return
+        for name, path in entries:
+            suffix = next((suffix for suffix in INDEXEDDB_SUFFIXES if name.endswith(suffix)), None)
+            if suffix is None:
+                continue
+            scheme, _, rest = name[:-len(suffix)].partition('_')
+            host, _, port = rest.rpartition('_')
+            if not host:
+                continue
+            url = f"{scheme}://{host}" + (f":{port}" if port not in ('', '0') else '')
+            yield OriginItem(normalize_origin(url), KIND_INDEXEDDB, self.walker.get_size(path), [path])
+
+    def iter_chromium_cache_storage(self, directory):
+        """CacheStorage的每个站点目录以哈希命名，站点记录在目录中的index.txt里"""
+        try:
+            with os.scandir(directory) as it:
+                entries = [entry.path for entry in it if entry.is_dir(follow_symlinks=False)]
+        except OSError:
+            return
+        for path in entries:
+            origin = None
+            try:
+                with open(os.path.join(path, CACHE_STORAGE_INDEX), 'rb') as f:
+                    for field, value in iter_proto_fields(f.read()):
+                        if field in CACHE_STORAGE_ORIGIN_FIELDS and isinstance(value, bytes):
+                            # 存储键形如 https://a.com/^0https://b.com，取第一部分
+                            origin = normalize_origin(value.decode('utf-8', 'replace').split('^')[0])
+                            if origin:
+                                break
+            except (OSError, LevelDBError) as e:
+                self.logger.warning(f"无法读取 {path} 的CacheStorage索引: {e}")
+            yield OriginItem(origin, KIND_CACHE_STORAGE, self.walker.get_size(path), [path])
+
+    def iter_chromium_local_storage(self, directory):
+        """从Local Storage数据库中每个站点的META记录读取字节数
+
+        只保留每个站点序列号最新的一条记录；所有站点共用一个数据库，无法单独删除。
+        """
+        latest = {}
+        for key, sequence, kind, value in iter_database(directory, LOCAL_STORAGE_META_PREFIX):
+            current = latest.get(key)
+            if current is None or sequence > current[0]:
+                latest[key] = (sequence, kind, value)
+        for key, (_, kind, value) in latest.items():
+            if kind != TYPE_VALUE:
+                continue
+            size = 0
+            try:
+                for field, field_value in iter_proto_fields(value):
+                    if field == LOCAL_STORAGE_SIZE_FIELD and isinstance(field_value, int):
+                        size = field_value
+            except (LevelDBError, IndexError):
+                continue
+            origin = normalize_origin(key[len(LOCAL_STORAGE_META_PREFIX):].decode('utf-8', 'replace'))
+            yield OriginItem(origin, KIND_LOCAL_STORAGE, size, [])
+
+    def iter_firefox_storage(self, directory):
+        """Firefox每个站点一个目录，名为 协议+++主机[+端口][^属性]，其中idb、ls、cache分别存放各类数据"""
+        try:
+            with os.scandir(directory) as it:
+                entries = [(entry.name, entry.path) for entry in it if entry.is_dir(follow_symlinks=False)]
+        except OSError:
+            return
+        for name, path in entries:
+            base, _, attributes = name.partition('^')
+            scheme, separator, rest = base.partition('+++')
+            if not separator:
+                continue
+            host, _, port = rest.partition('+')
+            origin = normalize_origin(f"{scheme}://{host}" + (f":{port}" if port.isdigit() else ''))
+            partition = PARTITION_PATTERN.search(attributes)
+            if partition:
+                # 按顶层站点分区的第三方存储归属到顶层站点
+                origin = origin_from_cache_key(attributes) or origin
+            for subdir, kind in FIREFOX_STORAGE_KINDS.items():
+                kind_path = os.path.join(path, subdir)
+                if os.path.isdir(kind_path):
+                    yield OriginItem(origin, kind, self.walker.get_size(kind_path), [kind_path])
+
+    def iter_profile(self, browser, profile):
+        """流式产出配置文件中缓存和站点存储的每一项归属"""
+        dirs = profile.get('dirs', {})
+        storage = profile.get('storage', {})
+        if browser == 'firefox':
+            if dirs.get('cache'):
+                yield from self.iter_cache(dirs['cache'])
+            if storage.get('storage'):
+                yield from self.iter_firefox_storage(storage['storage'])
+            return
+
+        for kind in ('cache', 'code_cache'):
+            if dirs.get(kind):
+                yield from self.iter_cache(dirs[kind])
+        if storage.get('indexeddb'):
+            yield from self.iter_chromium_indexeddb(storage['indexeddb'])
+        if storage.get('cache_storage'):
+            yield from self.iter_chromium_cache_storage(storage['cache_storage'])
+        if storage.get('local_storage') and os.path.isdir(storage['local_storage']):
+            yield from self.iter_chromium_local_storage(storage['local_storage'])
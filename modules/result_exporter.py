@@ -0,0 +1,96 @@
+import os
+import io
+import csv
+import json
+import logging
+
+# 支持的导出格式
+EXPORT_FORMATS = ('ndjson', 'csv')
+
+# 累积到该字节数后才写入文件，减少小写入的次数
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+def iter_ndjson(records):
+    """把记录逐条编码为NDJSON行"""
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+def iter_csv(records, fields):
+    """把记录逐条编码为CSV行，第一行为表头，缺失或为None的字段输出为空"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+
+    def encode(row):
+        writer.writerow(row)
+        line = buffer.getvalue()
+        # 复用同一个缓冲区，内存不随行数增长
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    yield encode(fields)
+    for record in records:
+        yield encode(['' if record.get(field) is None else record[field] for field in fields])
+
+class ResultExporter:
+    def __init__(self):
+        # 设置日志
+        logging.basicConfig(level=logging.INFO,
+                           format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        self.logger = logging.getLogger('ResultExporter')
+
+    def iter_lines(self, records, fmt='ndjson', fields=None):
+        """按格式把记录流编码为文本行流，CSV格式必须给出字段列表"""
+        if fmt == 'ndjson':
+            return iter_ndjson(records)
+        if fmt == 'csv':
+            if not fields:
+                raise ValueError("CSV导出需要字段列表")
+            return iter_csv(records, fields)
+        raise ValueError(f"不支持的导出格式: {fmt}")
+
+    def export(self, records, file_path, fmt='ndjson', fields=None, cancel=None):
+        """把记录流写入文件，内存占用与记录数无关
+
+        先写入同目录下的临时文件，完成后再替换目标文件，中途出错或取消不会留下不完整的结果。
+        cancel为可选的无参函数，返回True时停止导出。
+        """
+        temp_path = f"{file_path}.part"
+        count = 0
+        try:
+            lines = self.iter_lines(records, fmt, fields)
+            # 无法用UTF-8编码的路径（如孤立代理项）转义输出，保证文件始终是合法的UTF-8
+            with open(temp_path, 'w', encoding='utf-8', errors='backslashreplace', newline='') as f:
+                chunk = []
+                chunk_size = 0
+                for line in lines:
+                    chunk.append(line)
+                    chunk_size += len(line)
+                    count += 1
+                    if chunk_size >= WRITE_BUFFER_SIZE:
+                        if cancel is not None and cancel():
+                            raise InterruptedError("导出已取消")
+                        f.write(''.join(chunk))
+                        chunk = []
+                        chunk_size = 0
+                f.write(''.join(chunk))
+            os.replace(temp_path, file_path)
+        except (OSError, ValueError) as e:
+            self.logger.error(f"导出到 {file_path} 时出错: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
+        # CSV的表头不计入记录数
+        if fmt == 'csv':
+            count -= 1
+        return {
+            'success': True,
+            'count': count,
+            'message': f"已导出 {count} 条记录到 {file_path}"
+        }
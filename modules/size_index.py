@@ -0,0 +1,271 @@
+import os
+import json
+import sqlite3
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+# 索引表结构版本，结构变化时递增
+INDEX_SCHEMA_VERSION = 5
+
+class SizeIndex:
+    def __init__(self, db_path=None):
+        # 设置日志
+        logging.basicConfig(level=logging.INFO,
+                           format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        self.logger = logging.getLogger('SizeIndex')
+
+        # 索引数据库位置 - 默认放在用户本地应用数据目录下
+        if db_path is None:
+            base_dir = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.cache')
+            db_path = os.path.join(base_dir, 'system_toolbox', 'size_index.db')
+        self.db_path = db_path
+
+        # 写入操作串行化
+        self.lock = threading.Lock()
+        self._ensure_schema()
+
+    @contextmanager
+    def _transaction(self):
+        """打开数据库连接并在一个事务中执行，结束后关闭连接"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _ensure_schema(self):
+        """创建索引表"""
+        try:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            with self.lock, self._transaction() as conn:
+                # 表结构变化时丢弃旧索引，索引可以随时重建
+                version = conn.execute('PRAGMA user_version').fetchone()[0]
+                if version != INDEX_SCHEMA_VERSION:
+                    conn.execute('DROP TABLE IF EXISTS dir_index')
+                    conn.execute('DROP TABLE IF EXISTS checkpoint_dirs')
+                    conn.execute('DROP TABLE IF EXISTS checkpoint_pending')
+                    conn.execute(f'PRAGMA user_version = {INDEX_SCHEMA_VERSION}')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS dir_index (
+                        path TEXT PRIMARY KEY,
+                        mtime_ns INTEGER NOT NULL,
+                        file_id INTEGER NOT NULL,
+                        own_size INTEGER NOT NULL,
+                        total_size INTEGER NOT NULL,
+                        own_allocated INTEGER NOT NULL,
+                        total_allocated INTEGER NOT NULL,
+                        files TEXT NOT NULL,
+                        subdirs TEXT NOT NULL
+                    )
+                ''')
+                # 未完成分析的检查点：已扫描目录按扫描顺序保存，待扫描目录整体保存；
+                # 超大目录按扫描批次分多行保存，partial为1的行表示后面还有该目录的其他批次
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS checkpoint_dirs (
+                        root TEXT NOT NULL,
+                        path TEXT NOT NULL,
+                        batch INTEGER NOT NULL,
+                        partial INTEGER NOT NULL,
+                        mtime_ns INTEGER NOT NULL,
+                        file_id INTEGER NOT NULL,
+                        own_size INTEGER NOT NULL,
+                        own_allocated INTEGER NOT NULL,
+                        files TEXT NOT NULL,
+                        subdirs TEXT NOT NULL,
+                        PRIMARY KEY (root, path, batch)
+                    )
+                ''')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS checkpoint_pending (
+                        root TEXT PRIMARY KEY,
+                        pending TEXT NOT NULL,
+                        updated REAL NOT NULL
+                    )
+                ''')
+        except (sqlite3.Error, OSError) as e:
+            self.logger.error(f"初始化大小索引 {self.db_path} 时出错: {e}")
+
+    def _subtree_bounds(self, root):
+        """返回匹配root所有子路径的字符串区间"""
+        prefix = root if root.endswith(os.sep) else root + os.sep
+        # 分隔符的下一个字符作为上界，用区间查询代替LIKE以利用主键索引
+        upper = prefix[:-1] + chr(ord(os.sep) + 1)
+        return prefix, upper
+
+    def load(self, root):
+        """加载root及其所有子目录的索引记录，返回 {路径: 记录}"""
+        records = {}
+        prefix, upper = self._subtree_bounds(root)
+
+        try:
+            with self._transaction() as conn:
+                cursor = conn.execute(
+                    'SELECT path, mtime_ns, file_id, own_size, total_size, own_allocated, total_allocated, '
+                    'files, subdirs FROM dir_index WHERE path = ? OR (path >= ? AND path < ?)',
+                    (root, prefix, upper))
+                for (path, mtime_ns, file_id, own_size, total_size, own_allocated, total_allocated,
+                     files, subdirs) in cursor:
+                    records[path] = {
+                        'mtime_ns': mtime_ns,
+                        'file_id': file_id,
+                        'own_size': own_size,
+                        'total_size': total_size,
+                        'own_allocated': own_allocated,
+                        'total_allocated': total_allocated,
+                        'files': files,
+                        'subdirs': subdirs
+                    }
+        except sqlite3.Error as e:
+            self.logger.warning(f"读取大小索引时出错: {e}")
+
+        return records
+
+    def save(self, records, totals=(), removed=()):
+        """写回一次分析的变化：替换重新扫描的目录记录，更新总大小，删除已不存在的目录
+
+        records为可迭代的 (路径, mtime_ns, file_id, 直接文件大小, 总大小, 直接文件占用, 总占用,
+        文件列表, 子目录名列表)，文件列表的每一项为 (名称, 大小, 占用, mtime, atime, uid, 是否为重复硬链接)。
+        totals为内容未变、只有子树总大小变化的目录 (路径, 总大小, 总占用)；removed为要删除记录的目录路径。
+        """
+        rows = (
+            (path, mtime_ns, file_id, own_size, total_size, own_allocated, total_allocated,
+             json.dumps(files, ensure_ascii=False), json.dumps(subdirs, ensure_ascii=False))
+            for (path, mtime_ns, file_id, own_size, total_size, own_allocated, total_allocated,
+                 files, subdirs) in records
+        )
+
+        try:
+            with self.lock, self._transaction() as conn:
+                conn.executemany('DELETE FROM dir_index WHERE path = ?', ((path,) for path in removed))
+                conn.executemany('INSERT OR REPLACE INTO dir_index VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+                conn.executemany('UPDATE dir_index SET total_size = ?, total_allocated = ? WHERE path = ?',
+                                 ((total_size, total_allocated, path) for path, total_size, total_allocated in totals))
+            return True
+        except sqlite3.Error as e:
+            self.logger.error(f"保存大小索引时出错: {e}")
+            return False
+
+    def invalidate(self, root=None):
+        """使索引失效，root为空时清空整个索引"""
+        try:
+            with self.lock, self._transaction() as conn:
+                if root is None:
+                    conn.execute('DELETE FROM dir_index')
+                else:
+                    prefix, upper = self._subtree_bounds(root)
+                    conn.execute('DELETE FROM dir_index WHERE path = ? OR (path >= ? AND path < ?)',
+                                 (root, prefix, upper))
+            return True
+        except sqlite3.Error as e:
+            self.logger.error(f"清除大小索引时出错: {e}")
+            return False
+
+    def save_checkpoint(self, root, records, pending):
+        """追加自上次检查点以来扫描完成的目录批次，并替换待扫描目录列表
+
+        records为 (路径, 批次, 是否还有后续批次, mtime_ns, file_id, 直接文件大小, 直接文件占用,
+        文件列表, 子目录名列表)，需按扫描顺序给出，保证恢复时父目录先于子目录。
+        目录的第0批会替换该目录之前保存的所有批次，重新扫描的目录不会残留旧批次。
+        """
+        records = list(records)
+        rows = (
+            (root, path, batch, int(partial), mtime_ns, file_id, own_size, own_allocated,
+             json.dumps(files, ensure_ascii=False), json.dumps(subdirs, ensure_ascii=False))
+            for (path, batch, partial, mtime_ns, file_id, own_size, own_allocated, files, subdirs) in records
+        )
+
+        try:
+            with self.lock, self._transaction() as conn:
+                conn.executemany('DELETE FROM checkpoint_dirs WHERE root = ? AND path = ?',
+                                 ((root, record[0]) for record in records if record[1] == 0))
+                conn.executemany('INSERT OR REPLACE INTO checkpoint_dirs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                 rows)
+                conn.execute('INSERT OR REPLACE INTO checkpoint_pending VALUES (?, ?, ?)',
+                             (root, json.dumps(list(pending), ensure_ascii=False), time.time()))
+            return True
+        except sqlite3.Error as e:
+            self.logger.error(f"保存分析检查点时出错: {e}")
+            return False
+
+    def get_checkpoint_info(self, root):
+        """获取root的检查点概况，没有检查点时返回None"""
+        try:
+            with self._transaction() as conn:
+                row = conn.execute('SELECT pending, updated FROM checkpoint_pending WHERE root = ?',
+                                   (root,)).fetchone()
+                if row is None:
+                    return None
+                scanned = conn.execute('SELECT COUNT(*) FROM checkpoint_dirs WHERE root = ? AND partial = 0',
+                                       (root,)).fetchone()[0]
+        except sqlite3.Error as e:
+            self.logger.warning(f"读取分析检查点时出错: {e}")
+            return None
+
+        return {
+            'scanned_dirs': scanned,
+            'pending_dirs': len(json.loads(row[0])),
+            'updated': row[1]
+        }
+
+    def load_checkpoint(self, root):
+        """加载root的检查点，返回 (按扫描顺序排列的目录记录列表, 待扫描目录列表)，没有检查点时返回None
+
+        扫描到一半被取消的目录没有最后一批，其已保存的批次不会返回，恢复时整个目录重新扫描。
+        """
+        try:
+            with self._transaction() as conn:
+                row = conn.execute('SELECT pending FROM checkpoint_pending WHERE root = ?', (root,)).fetchone()
+                if row is None:
+                    return None
+                cursor = conn.execute(
+                    'SELECT path, batch, partial, mtime_ns, file_id, own_size, own_allocated, files, subdirs '
+                    'FROM checkpoint_dirs AS c WHERE root = ? AND (partial = 0 OR EXISTS ('
+                    'SELECT 1 FROM checkpoint_dirs WHERE root = c.root AND path = c.path AND partial = 0)) '
+                    'ORDER BY rowid', (root,))
+                records = [
+                    {
+                        'path': path,
+                        'batch': batch,
+                        'partial': bool(partial),
+                        'mtime_ns': mtime_ns,
+                        'file_id': file_id,
+                        'own_size': own_size,
+                        'own_allocated': own_allocated,
+                        'files': files,
+                        'subdirs': subdirs
+                    }
+                    for path, batch, partial, mtime_ns, file_id, own_size, own_allocated, files, subdirs in cursor
+                ]
+        except sqlite3.Error as e:
+            self.logger.warning(f"读取分析检查点时出错: {e}")
+            return None
+
+        return records, json.loads(row[0])
+
+    def clear_checkpoint(self, root):
+        """删除root的检查点"""
+        try:
+            with self.lock, self._transaction() as conn:
+                conn.execute('DELETE FROM checkpoint_dirs WHERE root = ?', (root,))
+                conn.execute('DELETE FROM checkpoint_pending WHERE root = ?', (root,))
+            return True
+        except sqlite3.Error as e:
+            self.logger.error(f"删除分析检查点时出错: {e}")
+            return False
+
+    def decode_entries(self, record):
+        """解码索引记录中的文件列表和子目录名列表，返回 (文件列表, 子目录名列表, 重复硬链接文件名列表)
+
+        文件列表为 (名称, stat结果, 占用空间)，stat结果只包含索引中保存的大小、时间和所有者。
+        """
+        files = []
+        duplicates = []
+        for name, size, allocated, mtime, atime, uid, linked in json.loads(record['files']):
+            files.append((name, os.stat_result((0, 0, 0, 0, uid, 0, size, atime, mtime, 0)), allocated))
+            if linked:
+                duplicates.append(name)
+        subdirs = json.loads(record['subdirs'])
+        return files, subdirs, duplicates
@@ -0,0 +1,335 @@
+import os
+import time
+import heapq
+import sqlite3
+import itertools
+import logging
+import threading
+from contextlib import contextmanager
+
+# 快照表结构版本，结构变化时递增
+SNAPSHOT_SCHEMA_VERSION = 1
+
+# 按相对变化排名时，新旧大小都低于该值的目录不参与排名，避免小目录的倍数变化淹没结果
+MIN_RELATIVE_SIZE = 1024 * 1024
+
+# 子树排名中，单个子目录的变化超过子树总变化的这一比例时，变化归于该子目录，父目录不再列出
+DOMINANT_CHILD_SHARE = 0.5
+
+# 排名堆中key相同时按加入顺序比较，避免比较字典
+_sequence = itertools.count()
+
+def _merge_sorted(old_rows, new_rows):
+    """按第一列归并两个已按第一列排序的序列，产出 (键, 旧行, 新行)，缺失的一侧为None"""
+    old_iter = iter(old_rows)
+    new_iter = iter(new_rows)
+    old = next(old_iter, None)
+    new = next(new_iter, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old[0] < new[0]):
+            yield old[0], old, None
+            old = next(old_iter, None)
+        elif old is None or new[0] < old[0]:
+            yield new[0], None, new
+            new = next(new_iter, None)
+        else:
+            yield old[0], old, new
+            old = next(old_iter, None)
+            new = next(new_iter, None)
+
+def _push_top(heap, limit, key, item):
+    """把item按key放入容量为limit的最小堆，堆中始终是key最大的limit项"""
+    entry = (key, next(_sequence), item)
+    if len(heap) < limit:
+        heapq.heappush(heap, entry)
+    elif key > heap[0][0]:
+        heapq.heapreplace(heap, entry)
+
+def _sorted_top(heap):
+    """把最小堆转换为按key降序排列的列表"""
+    return [item for _, _, item in sorted(heap, key=lambda entry: entry[0], reverse=True)]
+
+def _new_rankings():
+    return {'grown': [], 'shrunk': [], 'grown_relative': [], 'shrunk_relative': []}
+
+def _add_change(rankings, limit, min_relative_size, key, old_size, new_size, extra):
+    """计算一项的变化并放入各排名堆"""
+    delta = new_size - old_size
+    if delta == 0:
+        return
+    # 新出现的条目相对变化为无穷大
+    relative = delta / old_size if old_size else float('inf')
+    item = {
+        'key': key,
+        'old_size': old_size,
+        'new_size': new_size,
+        'delta': delta,
+        'relative': relative if old_size else None
+    }
+    item.update(extra)
+
+    if delta > 0:
+        _push_top(rankings['grown'], limit, delta, item)
+    else:
+        _push_top(rankings['shrunk'], limit, -delta, item)
+    if max(old_size, new_size) >= min_relative_size:
+        if delta > 0:
+            _push_top(rankings['grown_relative'], limit, relative, item)
+        else:
+            _push_top(rankings['shrunk_relative'], limit, -relative, item)
+
+def _finish_rankings(rankings):
+    return {name: _sorted_top(heap) for name, heap in rankings.items()}
+
+class SnapshotStore:
+    def __init__(self, db_path=None):
+        # 设置日志
+        logging.basicConfig(level=logging.INFO,
+                           format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        self.logger = logging.getLogger('SnapshotStore')
+
+        # 快照数据库位置 - 默认与大小索引放在同一目录下
+        if db_path is None:
+            base_dir = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.cache')
+            db_path = os.path.join(base_dir, 'system_toolbox', 'snapshots.db')
+        self.db_path = db_path
+
+        # 写入操作串行化
+        self.lock = threading.Lock()
+        self._ensure_schema()
+
+    @contextmanager
+    def _transaction(self):
+        """打开数据库连接并在一个事务中执行，结束后关闭连接"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _ensure_schema(self):
+        """创建快照表"""
+        try:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            with self.lock, self._transaction() as conn:
+                version = conn.execute('PRAGMA user_version').fetchone()[0]
+                if version != SNAPSHOT_SCHEMA_VERSION:
+                    conn.execute('DROP TABLE IF EXISTS snapshot_dirs')
+                    conn.execute('DROP TABLE IF EXISTS snapshot_extensions')
+                    conn.execute('DROP TABLE IF EXISTS snapshots')
+                    conn.execute(f'PRAGMA user_version = {SNAPSHOT_SCHEMA_VERSION}')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS snapshots (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        root TEXT NOT NULL,
+                        label TEXT,
+                        created REAL NOT NULL,
+                        total_size INTEGER NOT NULL,
+                        total_allocated INTEGER NOT NULL,
+                        dirs INTEGER NOT NULL
+                    )
+                ''')
+                # 主键即按路径排序的B树，差异计算时按主键顺序流式读取两份快照
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS snapshot_dirs (
+                        snapshot_id INTEGER NOT NULL,
+                        path TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        allocated INTEGER NOT NULL,
+                        own_size INTEGER NOT NULL,
+                        files INTEGER NOT NULL,
+                        PRIMARY KEY (snapshot_id, path)
+                    ) WITHOUT ROWID
+                ''')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS snapshot_extensions (
+                        snapshot_id INTEGER NOT NULL,
+                        extension TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        files INTEGER NOT NULL,
+                        PRIMARY KEY (snapshot_id, extension)
+                    ) WITHOUT ROWID
+                ''')
+        except (sqlite3.Error, OSError) as e:
+            self.logger.error(f"初始化快照库 {self.db_path} 时出错: {e}")
+
+    def save(self, root, directories, extensions, label=None):
+        """保存一份快照，返回快照ID，失败时返回None
+
+        directories为可迭代的 (相对root的路径, 总大小, 总占用, 直接文件大小, 直接文件数)，
+        根目录的相对路径为空字符串；extensions为可迭代的 (扩展名, 大小, 文件数)。
+        """
+        try:
+            with self.lock, self._transaction() as conn:
+                cursor = conn.execute(
+                    'INSERT INTO snapshots (root, label, created, total_size, total_allocated, dirs) '
+                    'VALUES (?, ?, ?, 0, 0, 0)', (root, label, time.time()))
+                snapshot_id = cursor.lastrowid
+                conn.executemany(
+                    'INSERT OR REPLACE INTO snapshot_dirs VALUES (?, ?, ?, ?, ?, ?)',
+                    ((snapshot_id, path, size, allocated, own_size, files)
+                     for path, size, allocated, own_size, files in directories))
+                conn.executemany(
+                    'INSERT OR REPLACE INTO snapshot_extensions VALUES (?, ?, ?, ?)',
+                    ((snapshot_id, extension, size, files) for extension, size, files in extensions))
+                conn.execute(
+                    'UPDATE snapshots SET total_size = COALESCE((SELECT size FROM snapshot_dirs '
+                    'WHERE snapshot_id = ? AND path = ?), 0), total_allocated = COALESCE((SELECT allocated '
+                    'FROM snapshot_dirs WHERE snapshot_id = ? AND path = ?), 0), dirs = (SELECT COUNT(*) '
+                    'FROM snapshot_dirs WHERE snapshot_id = ?) WHERE id = ?',
+                    (snapshot_id, '', snapshot_id, '', snapshot_id, snapshot_id))
+            return snapshot_id
+        except sqlite3.Error as e:
+            self.logger.error(f"保存快照时出错: {e}")
+            return None
+
+    def list_snapshots(self, root=None):
+        """列出快照，root不为空时只列出该目录的快照，按创建时间降序排列"""
+        query = 'SELECT id, root, label, created, total_size, total_allocated, dirs FROM snapshots'
+        params = ()
+        if root is not None:
+            query += ' WHERE root = ?'
+            params = (root,)
+        query += ' ORDER BY created DESC'
+
+        try:
+            with self._transaction() as conn:
+                return [
+                    {
+                        'id': snapshot_id,
+                        'root': snapshot_root,
+                        'label': label,
+                        'created': created,
+                        'total_size': total_size,
+                        'total_allocated': total_allocated,
+                        'dirs': dirs
+                    }
+                    for snapshot_id, snapshot_root, label, created, total_size, total_allocated, dirs
+                    in conn.execute(query, params)
+                ]
+        except sqlite3.Error as e:
+            self.logger.warning(f"读取快照列表时出错: {e}")
+            return []
+
+    def get(self, snapshot_id):
+        """获取单个快照的概况，不存在时返回None"""
+        for snapshot in self.list_snapshots():
+            if snapshot['id'] == snapshot_id:
+                return snapshot
+        return None
+
+    def delete(self, snapshot_id):
+        """删除快照"""
+        try:
+            with self.lock, self._transaction() as conn:
+                conn.execute('DELETE FROM snapshot_dirs WHERE snapshot_id = ?', (snapshot_id,))
+                conn.execute('DELETE FROM snapshot_extensions WHERE snapshot_id = ?', (snapshot_id,))
+                conn.execute('DELETE FROM snapshots WHERE id = ?', (snapshot_id,))
+            return True
+        except sqlite3.Error as e:
+            self.logger.error(f"删除快照时出错: {e}")
+            return False
+
+    def _rank_changes(self, merged, limit, min_relative_size):
+        """对归并后的 (键, 旧大小, 新大小, 附加信息) 流计算变化并分别保留增长和缩减最多的前limit项"""
+        rankings = _new_rankings()
+        for key, old_size, new_size, extra in merged:
+            _add_change(rankings, limit, min_relative_size, key, old_size, new_size, extra)
+        return _finish_rankings(rankings)
+
+    def _rank_directories(self, root, merged, limit, min_relative_size):
+        """按直接文件大小和整个子树大小分别对归并后的 (路径, 旧行, 新行) 流排名
+
+        子树排名中，变化主要来自某一个子目录（超过DOMINANT_CHILD_SHARE）的目录不列出，
+        这样单个热点只报告热点本身，而分散在许多子目录中的增长（如node_modules）报告其共同的父目录。
+        路径按主键顺序到达，目录总在其后代之前；后代的键都落在 [路径+分隔符, 路径+分隔符的下一个字符)
+        之间，这些区间互相嵌套，因此用一个深度等于目录层数的栈即可确定每个子树何时结束。
+        """
+        directories = _new_rankings()
+        subtrees = _new_rankings()
+        end_char = chr(ord(os.sep) + 1)
+        # 尚未结束的子树: [相对路径, 键区间终点, 旧总大小, 新总大小, 直接文件变化, 父帧, 子目录最大增长, 最大缩减]
+        open_dirs = []
+
+        def close(frame):
+            path, _, old_total, new_total, own_delta, parent, child_grown, child_shrunk = frame
+            total_delta = new_total - old_total
+            if parent is not None:
+                parent[6] = max(parent[6], total_delta)
+                parent[7] = min(parent[7], total_delta)
+            if total_delta > 0 and child_grown > total_delta * DOMINANT_CHILD_SHARE:
+                return
+            if total_delta < 0 and child_shrunk < total_delta * DOMINANT_CHILD_SHARE:
+                return
+            _add_change(subtrees, limit, min_relative_size, path, old_total, new_total, {
+                'path': os.path.join(root, path) if path else root,
+                'own_delta': own_delta
+            })
+
+        for path, old, new in merged:
+            old_own, old_total = (old[1], old[2]) if old else (0, 0)
+            new_own, new_total = (new[1], new[2]) if new else (0, 0)
+            _add_change(directories, limit, min_relative_size, path, old_own, new_own, {
+                'path': os.path.join(root, path) if path else root,
+                'total_delta': new_total - old_total
+            })
+
+            while open_dirs and open_dirs[-1][1] is not None and path >= open_dirs[-1][1]:
+                close(open_dirs.pop())
+            parent = None
+            if open_dirs and path and open_dirs[-1][0] == path.rpartition(os.sep)[0]:
+                parent = open_dirs[-1]
+            open_dirs.append([path, path + end_char if path else None, old_total, new_total,
+                              new_own - old_own, parent, 0, 0])
+        while open_dirs:
+            close(open_dirs.pop())
+
+        return _finish_rankings(directories), _finish_rankings(subtrees)
+
+    def diff(self, old_id, new_id, limit=20, min_relative_size=MIN_RELATIVE_SIZE):
+        """比较同一根目录的两份快照
+
+        两份快照的目录和扩展名都按主键顺序流式读取并归并，耗时与条目数成线性关系，
+        内存只保存各排名的前limit项。返回目录和扩展名的增长、缩减排名（按绝对值和相对值）。
+        directories按直接文件大小的变化排名，否则根目录和路径上的每个祖先都会以相同的累计变化排在
+        真正变化的目录之前；其中各项的old_size/new_size/delta为直接文件大小，另含整个子树的变化total_delta。
+        subtrees按整个子树的变化排名，只列出变化不是主要来自单个子目录的目录，各项的
+        old_size/new_size/delta为子树大小，另含直接文件的变化own_delta。
+        """
+        old_snapshot = self.get(old_id)
+        new_snapshot = self.get(new_id)
+        if old_snapshot is None or new_snapshot is None:
+            raise ValueError(f"快照不存在: {old_id if old_snapshot is None else new_id}")
+        if old_snapshot['root'] != new_snapshot['root']:
+            raise ValueError(f"快照的根目录不同: {old_snapshot['root']} / {new_snapshot['root']}")
+
+        root = old_snapshot['root']
+        dir_query = ('SELECT path, own_size, size FROM snapshot_dirs WHERE snapshot_id = ? ORDER BY path')
+        ext_query = ('SELECT extension, size, files FROM snapshot_extensions WHERE snapshot_id = ? '
+                     'ORDER BY extension')
+
+        with self._transaction() as conn:
+            # 同一连接上的两个游标交替读取，两份快照都只顺序扫描一遍
+            merged_dirs = _merge_sorted(conn.execute(dir_query, (old_id,)), conn.execute(dir_query, (new_id,)))
+            directories, subtrees = self._rank_directories(root, merged_dirs, limit, min_relative_size)
+
+            merged_extensions = (
+                (extension,
+                 old[1] if old else 0,
+                 new[1] if new else 0,
+                 {'files_delta': (new[2] if new else 0) - (old[2] if old else 0)})
+                for extension, old, new in _merge_sorted(conn.execute(ext_query, (old_id,)),
+                                                         conn.execute(ext_query, (new_id,)))
+            )
+            extensions = self._rank_changes(merged_extensions, limit, min_relative_size)
+
+        return {
+            'root': root,
+            'old': old_snapshot,
+            'new': new_snapshot,
+            'delta': new_snapshot['total_size'] - old_snapshot['total_size'],
+            'directories': directories,
+            'subtrees': subtrees,
+            'extensions': extensions
+        }
@@ -0,0 +1,324 @@
+import os
+import time
+import sqlite3
+import logging
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+# 每批删除的行数 - 每批单独提交，浏览器等待写锁的时间不超过一批
+BATCH_ROWS = 5000
+# 同时维护的数据库数
+MAINTENANCE_WORKERS = 4
+# 等待数据库锁的秒数
+LOCK_TIMEOUT = 1.0
+# 浏览器占用数据库时，在副本上维护，副本与原文件位于同一目录以便原子替换
+COPY_SUFFIX = '.maintenance'
+# 与副本一起保存的原文件签名，浏览器关闭后只有原文件未被改写时才用副本替换
+SIGNATURE_SUFFIX = '.maintenance-source'
+
+# 时间列的格式：Chromium为1601-01-01起的微秒数，Firefox为1970-01-01起的微秒数
+TIME_WEBKIT = 'webkit'
+TIME_PRTIME = 'prtime'
+WEBKIT_EPOCH_OFFSET = 11644473600
+
+# 各类数据库按年龄删除的规则：(表, 时间列, 附加条件)，按顺序执行
+# 附加条件保证只删除不再被引用的行，例如Firefox中被书签引用的地址（foreign_count > 0）保留
+PRUNE_RULES = {
+    'chromium_history': {
+        'time_format': TIME_WEBKIT,
+        'rules': [
+            ('visits', 'visit_time', None),
+            ('urls', 'last_visit_time', 'id NOT IN (SELECT url FROM visits)'),
+            ('downloads', 'start_time', None),
+            ('segment_usage', 'time_slot', None)
+        ],
+        # 删除后清理失去引用的关联行：(表, 语句)
+        'cleanup': [
+            ('keyword_search_terms', 'DELETE FROM keyword_search_terms WHERE url_id NOT IN (SELECT id FROM urls)'),
+            ('visit_source', 'DELETE FROM visit_source WHERE id NOT IN (SELECT id FROM visits)'),
+            ('downloads_url_chains', 'DELETE FROM downloads_url_chains WHERE id NOT IN (SELECT id FROM downloads)')
+        ]
+    },
+    'chromium_cookies': {
+        'time_format': TIME_WEBKIT,
+        'rules': [
+            ('cookies', 'last_access_utc', None)
+        ],
+        'cleanup': []
+    },
+    'firefox_history': {
+        'time_format': TIME_PRTIME,
+        'rules': [
+            ('moz_historyvisits', 'visit_date', None),
+            ('moz_places', 'last_visit_date',
+             'foreign_count = 0 AND id NOT IN (SELECT place_id FROM moz_historyvisits)')
+        ],
+        'cleanup': []
+    },
+    'firefox_cookies': {
+        'time_format': TIME_PRTIME,
+        'rules': [
+            ('moz_cookies', 'lastAccessed', None)
+        ],
+        'cleanup': []
+    }
+}
+
+# PRAGMA auto_vacuum的取值：增量模式下用incremental_vacuum归还空闲页，无需重建整个数据库
+AUTO_VACUUM_INCREMENTAL = 2
+
+class DatabaseLockedError(Exception):
+    """数据库被浏览器锁定，且无法在副本上完成维护"""
+
+def get_cutoff(days, time_format, now=None):
+    """计算days天前对应的时间列取值"""
+    if now is None:
+        now = time.time()
+    cutoff = now - days * 86400
+    if time_format == TIME_WEBKIT:
+        cutoff += WEBKIT_EPOCH_OFFSET
+    return int(cutoff * 1000000)
+
+class SQLiteMaintainer:
+    def __init__(self, batch_rows=BATCH_ROWS, max_workers=MAINTENANCE_WORKERS):
+        # 设置日志
+        logging.basicConfig(level=logging.INFO,
+                           format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        self.logger = logging.getLogger('SQLiteMaintainer')
+
+        self.batch_rows = max(1, batch_rows)
+        self.max_workers = max(1, max_workers)
+
+    def _get_size(self, path):
+        """数据库主文件和WAL文件的大小之和"""
+        size = 0
+        for suffix in ('', '-wal'):
+            try:
+                size += os.path.getsize(path + suffix)
+            except OSError:
+                pass
+        return size
+
+    def _get_signature(self, path):
+        """主文件的 (mtime_ns, 大小)，用于确认副本维护期间原文件没有被改写"""
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+
+    def _has_pending_log(self, path):
+        """原文件旁是否有未合并的WAL或回滚日志 - 此时替换主文件会让日志被应用到新文件上"""
+        for suffix in ('-wal', '-journal'):
+            try:
+                if os.path.getsize(path + suffix) > 0:
+                    return True
+            except OSError:
+                pass
+        return False
+
+    def _connect(self, path):
+        """以手动事务模式打开数据库，并试探能否获得写锁；被占用时抛出sqlite3.OperationalError
+
+        写锁不会一直持有，之后的每批删除仍可能因浏览器重新加锁而失败，调用方需要处理。
+        """
+        connection = sqlite3.connect(path, timeout=LOCK_TIMEOUT, isolation_level=None)
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute('COMMIT')
+        except sqlite3.Error:
+            connection.close()
+            raise
+        return connection
+
+    def _is_locked(self, error):
+        message = str(error)
+        return 'locked' in message or 'busy' in message
+
+    def _get_tables(self, connection):
+        """数据库中的表名"""
+        return {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+    def _prune(self, connection, schema, days):
+        """按规则分批删除days天前的行，返回删除的行数"""
+        spec = PRUNE_RULES[schema]
+        cutoff = get_cutoff(days, spec['time_format'])
+        tables = self._get_tables(connection)
+        deleted = 0
+        for table, column, condition in spec['rules']:
+            if table not in tables:
+                continue
+            where = f"{column} < ?" + (f" AND {condition}" if condition else '')
+            statement = (f"DELETE FROM {table} WHERE rowid IN "
+                         f"(SELECT rowid FROM {table} WHERE {where} LIMIT ?)")
+            while True:
+                try:
+                    connection.execute('BEGIN IMMEDIATE')
+                    count = connection.execute(statement, (cutoff, self.batch_rows)).rowcount
+                    connection.execute('COMMIT')
+                except sqlite3.OperationalError as e:
+                    if connection.in_transaction:
+                        connection.execute('ROLLBACK')
+                    if self._is_locked(e):
+                        raise
+                    # 不同版本的表结构可能缺少某一列，跳过该规则
+                    self.logger.warning(f"无法清理表 {table}: {e}")
+                    break
+                deleted += count
+                if count < self.batch_rows:
+                    break
+
+        for table, statement in spec['cleanup']:
+            if table not in tables:
+                continue
+            try:
+                connection.execute('BEGIN IMMEDIATE')
+                deleted += connection.execute(statement).rowcount
+                connection.execute('COMMIT')
+            except sqlite3.OperationalError as e:
+                if connection.in_transaction:
+                    connection.execute('ROLLBACK')
+                self.logger.info(f"跳过清理语句: {e}")
+        return deleted
+
+    def _vacuum(self, connection):
+        """归还空闲页：增量模式用incremental_vacuum，否则VACUUM重建数据库"""
+        mode = connection.execute('PRAGMA auto_vacuum').fetchone()[0]
+        if mode == AUTO_VACUUM_INCREMENTAL:
+            connection.execute('PRAGMA incremental_vacuum').fetchall()
+        else:
+            connection.execute('VACUUM')
+        # WAL模式下把日志合并回主文件并截断，释放的空间才能体现在文件大小上
+        connection.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+
+    def _remove_copy(self, path):
+        """删除副本和签名文件"""
+        for suffix in (COPY_SUFFIX, SIGNATURE_SUFFIX):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                self.logger.warning(f"无法删除数据库副本 {path + suffix}: {e}")
+
+    def _maintain_copy(self, path, schema, days):
+        """浏览器占用数据库时：用备份接口复制一份，在副本上删除和压缩，返回副本中删除的行数
+
+        复制期间只需要读锁。浏览器仍打开着原文件，此时替换会丢失它之后的写入，因此副本
+        连同复制前原文件的签名留在原文件旁，等浏览器关闭后由install_copy替换。
+        """
+        copy_path = path + COPY_SUFFIX
+        try:
+            signature = self._get_signature(path)
+            source = sqlite3.connect(f"{Path(os.path.abspath(path)).as_uri()}?mode=ro", uri=True,
+                                     timeout=LOCK_TIMEOUT)
+            try:
+                if os.path.exists(copy_path):
+                    os.remove(copy_path)
+                target = sqlite3.connect(copy_path, isolation_level=None)
+                try:
+                    source.backup(target)
+                    # 副本不需要WAL，替换后浏览器按原来的设置重新打开
+                    target.execute('PRAGMA journal_mode=DELETE').fetchall()
+                    deleted = self._prune(target, schema, days)
+                    self._vacuum(target)
+                finally:
+                    target.close()
+            finally:
+                source.close()
+            with open(path + SIGNATURE_SUFFIX, 'w', encoding='utf-8') as f:
+                f.write(f"{signature[0]} {signature[1]}")
+            return deleted
+        except (sqlite3.Error, OSError) as e:
+            self._remove_copy(path)
+            raise DatabaseLockedError(str(e)) from e
+
+    def has_copy(self, path):
+        """是否有等待替换原文件的副本"""
+        return os.path.exists(path + COPY_SUFFIX) and os.path.exists(path + SIGNATURE_SUFFIX)
+
+    def install_copy(self, path):
+        """用之前维护好的副本替换原文件，返回回收的字节数；没有可用的副本时返回0
+
+        只能在确认没有进程打开原文件（浏览器已关闭）之后调用。原文件在复制之后被改写过，
+        或旁边还有未合并的日志时，副本已经过时，直接丢弃。
+        """
+        if not self.has_copy(path):
+            return 0
+        try:
+            with open(path + SIGNATURE_SUFFIX, encoding='utf-8') as f:
+                signature = tuple(int(value) for value in f.read().split())
+            if self._get_signature(path) != signature or self._has_pending_log(path):
+                self.logger.info(f"数据库 {path} 在复制后被改写，丢弃副本")
+                return 0
+            before = self._get_size(path)
+            os.replace(path + COPY_SUFFIX, path)
+            return max(0, before - self._get_size(path))
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"无法用副本替换数据库 {path}: {e}")
+            return 0
+        finally:
+            self._remove_copy(path)
+
+    def maintain(self, path, schema, days):
+        """删除数据库中days天前的行并压缩，返回 {'success', 'path', 'deleted_rows', 'reclaimed', 'copied'}
+
+        能获得写锁时直接在原文件上分批删除；被浏览器锁定（包括删除中途被重新锁定）时改为在副本上维护，
+        副本等浏览器关闭后才替换原文件，此时pending_rows为副本中删除、尚未生效的行数。
+        """
+        if schema not in PRUNE_RULES:
+            return {
+                'success': False,
+                'path': path,
+                'error': f"不支持的数据库类型: {schema}"
+            }
+        if not os.path.isfile(path):
+            return {
+                'success': False,
+                'path': path,
+                'error': "数据库不存在"
+            }
+        before = self._get_size(path)
+        deleted = 0
+        pending = None
+        try:
+            try:
+                connection = self._connect(path)
+            except sqlite3.OperationalError as e:
+                self.logger.info(f"数据库 {path} 被占用，改为在副本上维护: {e}")
+                pending = self._maintain_copy(path, schema, days)
+            else:
+                try:
+                    deleted = self._prune(connection, schema, days)
+                    self._vacuum(connection)
+                except sqlite3.OperationalError as e:
+                    if not self._is_locked(e):
+                        raise
+                    # 已提交的批次保留，剩余部分在副本上继续
+                    self.logger.info(f"数据库 {path} 在维护中被锁定，改为在副本上维护: {e}")
+                    pending = self._maintain_copy(path, schema, days)
+                finally:
+                    connection.close()
+                if pending is None:
+                    # 原文件已直接维护，之前留下的副本随之过时
+                    self._remove_copy(path)
+        except (sqlite3.Error, DatabaseLockedError, OSError) as e:
+            self.logger.error(f"维护数据库 {path} 时出错: {e}")
+            return {
+                'success': False,
+                'path': path,
+                'error': str(e)
+            }
+
+        result = {
+            'success': True,
+            'path': path,
+            'deleted_rows': deleted,
+            'reclaimed': max(0, before - self._get_size(path)),
+            'copied': pending is not None
+        }
+        if pending is not None:
+            result['pending_rows'] = pending
+        return result
+
+    def maintain_all(self, databases, days):
+        """在线程池中维护多个数据库，databases为 (路径, 类型) 列表，返回与之对应的结果列表"""
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='SQLiteMaintainer') as executor:
+            return list(executor.map(lambda database: self.maintain(database[0], database[1], days), databases))
@@ -1,10 +1,12 @@
 import os
-import shutil
 import tempfile
 import winreg
 import logging
-import time
-from datetime import datetime, timedelta
+from modules.file_walker import FileWalker
+from modules.clean_manifest import CleanManifest, PROGRESS_INTERVAL, BUDGET_ORDER_ATIME
+from modules.clean_policy import CleanPolicy
+from modules.io_throttle import DEFAULT_MAX_UTILIZATION
+from modules.delete_engine import DeleteEngine
 
 class TempCleaner:
     def __init__(self):
@@ -29,6 +31,15 @@ class TempCleaner:
         # 最大文件年龄（天）- 超过这个时间的临时文件才会被清理
         self.max_file_age_days = 7
         
+        # 保留预算 - 设置后按最近使用时间从旧到新淘汰文件直到达到目标，而不是删除所有过期文件
+        self.retention_budget = None
+        
+        # 共享的并行目录遍历器
+        self.walker = FileWalker()
+        
+        # 相对目录句柄删除的删除引擎
+        self.delete_engine = DeleteEngine(self.walker)
+        
     def set_safe_paths(self, paths):
         """设置安全路径列表"""
         self.safe_paths = paths
@@ -42,40 +53,23 @@ class TempCleaner:
         if days > 0:
             self.max_file_age_days = days
             
-    def is_path_safe(self, path):
-        """检查路径是否安全（不应被清理）"""
-        # 检查路径是否在安全路径列表中
-        for safe_path in self.safe_paths:
-            if path.startswith(safe_path):
-                return True
-                
-        return False
-        
-    def is_file_excluded(self, file_path):
-        """检查文件是否应被排除（不应被清理）"""
-        # 检查文件扩展名
-        _, ext = os.path.splitext(file_path.lower())
-        if ext in self.excluded_extensions:
-            return True
-            
-        return False
-        
-    def is_file_too_new(self, file_path):
-        """检查文件是否太新（不应被清理）"""
-        try:
-            # 获取文件修改时间
-            mtime = os.path.getmtime(file_path)
-            file_datetime = datetime.fromtimestamp(mtime)
-            
-            # 计算文件年龄
-            age_days = (datetime.now() - file_datetime).days
-            
-            # 如果文件年龄小于最大年龄，则不应清理
-            return age_days < self.max_file_age_days
-        except (OSError, ValueError) as e:
-            self.logger.warning(f"无法获取文件 {file_path} 的修改时间: {e}")
-            # 如果无法确定，则认为文件太新（不清理）
-            return True
+    def set_retention_budget(self, free_bytes=None, max_bytes=None, order=BUDGET_ORDER_ATIME):
+        """设置保留预算，free_bytes为要释放的字节数，max_bytes为清理后临时文件占用的上限
+
+        两者都为None时关闭预算模式。order为淘汰顺序（BUDGET_ORDER_ATIME或BUDGET_ORDER_MTIME）。
+        """
+        if free_bytes is None and max_bytes is None:
+            self.retention_budget = None
+        else:
+            self.retention_budget = {
+                'free_bytes': free_bytes,
+                'max_bytes': max_bytes,
+                'order': order
+            }
+            
+    def set_background_mode(self, enabled, max_utilization=DEFAULT_MAX_UTILIZATION):
+        """开启或关闭后台模式，扫描和清理临时文件时降低优先级并限制磁盘利用率"""
+        self.walker.set_background(enabled, max_utilization)
         
     def get_temp_size(self, location_key):
         """获取指定临时文件位置的大小"""
@@ -84,17 +78,7 @@ class TempCleaner:
             if not path or not os.path.exists(path):
                 return 0
                 
-            total_size = 0
-            for dirpath, dirnames, filenames in os.walk(path):
-                for f in filenames:
-                    try:
-                        fp = os.path.join(dirpath, f)
-                        if os.path.exists(fp):
-                            total_size += os.path.getsize(fp)
-                    except (PermissionError, FileNotFoundError) as e:
-                        self.logger.warning(f"无法访问文件 {fp}: {e}")
-                        
-            return total_size
+            return self.walker.get_size(path)
         except Exception as e:
             self.logger.error(f"获取临时文件大小时出错: {e}")
             return 0
@@ -112,133 +96,113 @@ class TempCleaner:
         results['total'] = total_size
         return results
         
-    def clean_temp_files(self, locations=None):
-        """清理指定的临时文件位置"""
+    def get_policy(self):
+        """根据当前的安全设置编译清理策略"""
+        return CleanPolicy(self.safe_paths, self.excluded_extensions, self.max_file_age_days)
+        
+    def build_manifest(self, locations=None, safe_mode=False, manifest=None, policy=None):
+        """扫描指定的临时文件位置，生成删除清单
+
+        安全模式下使用policy判定每个文件，未提供时根据当前设置编译一次。
+        设置了保留预算时，所有位置的文件作为一个整体按预算淘汰。
+        """
         if locations is None:
             locations = list(self.temp_locations.keys())
+        if manifest is None:
+            manifest = CleanManifest(self.walker, safe_mode)
+            
+        if not safe_mode:
+            policy = None
+        elif policy is None:
+            policy = self.get_policy()
             
-        results = {}
-        total_cleaned = 0
-        
         for key in locations:
             if key not in self.temp_locations:
                 continue
                 
             path = self.temp_locations[key]
             if not os.path.exists(path):
-                results[key] = 0
+                manifest.targets.add(key)
                 continue
                 
-            size_before = self.get_temp_size(key)
-            cleaned = self._clean_directory(path)
-            size_after = self.get_temp_size(key)
-            
-            cleaned_size = size_before - size_after
-            results[key] = cleaned_size
-            total_cleaned += cleaned_size
+            manifest.add_tree(path, key, policy)
             
-        results['total'] = total_cleaned
-        return results
+        if self.retention_budget:
+            manifest.apply_budget([key for key in locations if key in self.temp_locations],
+                                  **self.retention_budget)
+        return manifest
         
-    def clean_temp_files_safely(self, locations=None):
-        """安全地清理指定的临时文件位置（跳过重要文件）"""
+    def clean_from_manifest(self, manifest, locations=None, progress_callback=None):
+        """按删除清单清理临时文件，不再重新遍历目录
+
+        progress_callback接收0到1之间的进度。
+        """
         if locations is None:
-            locations = list(self.temp_locations.keys())
+            locations = [key for key in self.temp_locations if key in manifest.targets]
+        else:
+            locations = [key for key in locations if key in manifest.targets]
             
+        report = None
+        if progress_callback:
+            report = lambda processed, total: progress_callback(processed / total if total else 1.0)
+        stats = manifest.execute(locations, progress_callback=report)
+        
         results = {}
         total_cleaned = 0
         total_skipped = 0
         
         for key in locations:
-            if key not in self.temp_locations:
-                continue
-                
-            path = self.temp_locations[key]
-            if not os.path.exists(path):
-                results[key] = 0
-                continue
-                
-            size_before = self.get_temp_size(key)
-            cleaned, skipped = self._clean_directory_safely(path)
-            size_after = self.get_temp_size(key)
-            
-            cleaned_size = size_before - size_after
-            results[key] = cleaned_size
-            total_cleaned += cleaned_size
-            total_skipped += skipped
+            results[key] = stats[key]['freed']
+            total_cleaned += stats[key]['freed']
+            total_skipped += stats[key]['skipped'] + stats[key]['changed'] + stats[key]['failed']
             
         results['total'] = total_cleaned
-        results['skipped'] = total_skipped
+        if manifest.safe_mode:
+            results['skipped'] = total_skipped
         return results
         
-    def _clean_directory(self, directory):
-        """清理指定目录中的文件"""
-        cleaned_count = 0
-        
-        try:
-            for item in os.listdir(directory):
-                item_path = os.path.join(directory, item)
-                try:
-                    if os.path.isfile(item_path):
-                        os.unlink(item_path)
-                        cleaned_count += 1
-                    elif os.path.isdir(item_path):
-                        shutil.rmtree(item_path, ignore_errors=True)
-                        cleaned_count += 1
-                except (PermissionError, FileNotFoundError) as e:
-                    self.logger.warning(f"无法删除 {item_path}: {e}")
-        except Exception as e:
-            self.logger.error(f"清理目录 {directory} 时出错: {e}")
+    def clean_temp_files(self, locations=None, progress_callback=None):
+        """清理指定的临时文件位置
+
+        不经过删除清单，直接边遍历边删除，空目录在同一次遍历中自底向上删除。
+        目录中的条目总数事先未知，progress_callback(已处理条目数)按处理过的条目数定期报告进度。
+        设置了保留预算时需要先比较所有文件的使用时间，改为经过删除清单清理。
+        """
+        if locations is None:
+            locations = list(self.temp_locations.keys())
+            
+        if self.retention_budget:
+            return self.clean_from_manifest(self.build_manifest(locations), locations)
             
-        return cleaned_count
+        processed = 0
         
-    def _clean_directory_safely(self, directory):
-        """安全地清理指定目录中的文件（跳过重要文件）"""
-        cleaned_count = 0
-        skipped_count = 0
+        def on_entry(path, is_dir, freed, error):
+            nonlocal processed
+            processed += 1
+            if processed % PROGRESS_INTERVAL == 0:
+                progress_callback(processed)
+                
+        results = {}
+        total_cleaned = 0
+        for key in locations:
+            if key not in self.temp_locations:
+                continue
+            stats = self.delete_engine.delete_tree(self.temp_locations[key],
+                                                   on_entry=on_entry if progress_callback else None)
+            for path, error in stats['errors']:
+                self.logger.warning(f"无法删除 {path}: {error}")
+            results[key] = stats['freed']
+            total_cleaned += stats['freed']
+            
+        if progress_callback:
+            progress_callback(processed)
+        results['total'] = total_cleaned
+        return results
         
-        try:
-            for item in os.listdir(directory):
-                item_path = os.path.join(directory, item)
-                try:
-                    # 检查是否应跳过此文件/目录
-                    if self.is_path_safe(item_path):
-                        self.logger.info(f"跳过安全路径: {item_path}")
-                        skipped_count += 1
-                        continue
-                        
-                    if os.path.isfile(item_path):
-                        # 检查文件是否应被排除
-                        if self.is_file_excluded(item_path):
-                            self.logger.info(f"跳过排除的文件类型: {item_path}")
-                            skipped_count += 1
-                            continue
-                            
-                        # 检查文件是否太新
-                        if self.is_file_too_new(item_path):
-                            self.logger.info(f"跳过较新的文件: {item_path}")
-                            skipped_count += 1
-                            continue
-                            
-                        # 删除文件
-                        os.unlink(item_path)
-                        cleaned_count += 1
-                    elif os.path.isdir(item_path):
-                        # 递归清理子目录
-                        sub_cleaned, sub_skipped = self._clean_directory_safely(item_path)
-                        cleaned_count += sub_cleaned
-                        skipped_count += sub_skipped
-                        
-                        # 如果目录为空，则删除
-                        if not os.listdir(item_path):
-                            os.rmdir(item_path)
-                except (PermissionError, FileNotFoundError) as e:
-                    self.logger.warning(f"无法访问 {item_path}: {e}")
-                    skipped_count += 1
-        except Exception as e:
-            self.logger.error(f"安全清理目录 {directory} 时出错: {e}")
-            
-        return cleaned_count, skipped_count
+    def clean_temp_files_safely(self, locations=None):
+        """安全地清理指定的临时文件位置（跳过重要文件）"""
+        manifest = self.build_manifest(locations, safe_mode=True)
+        return self.clean_from_manifest(manifest, locations)
         
     def format_size(self, size_bytes):
         """将字节大小格式化为人类可读的格式"""
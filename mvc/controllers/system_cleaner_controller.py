@@ -29,6 +29,18 @@ class SystemCleanerController:
             self.view.update_safe_mode_status(safe_mode)
         return safe_mode
         
+    def set_background_mode(self, enabled, max_utilization=None):
+        """开启或关闭后台模式"""
+        return self.model.set_background_mode(enabled, max_utilization)
+        
+    def set_retention_budget(self, free_bytes=None, max_bytes=None):
+        """设置保留预算，两者都为None时关闭预算模式"""
+        return self.model.set_retention_budget(free_bytes, max_bytes)
+        
+    def set_database_maintenance(self, days=None):
+        """设置数据库维护的保留天数，为None时关闭"""
+        return self.model.set_database_maintenance(days)
+        
     def set_max_file_age(self, days):
         """设置最大文件年龄"""
         if self.model.set_max_file_age(days):
@@ -65,6 +77,10 @@ class SystemCleanerController:
         """获取最大文件年龄"""
         return self.model.max_file_age_days
         
+    def format_size(self, size_bytes):
+        """格式化字节数"""
+        return self.model.browser_cache_cleaner.format_size(size_bytes)
+        
     def is_safe_mode_enabled(self):
         """检查安全模式是否启用"""
         return self.model.safe_mode
@@ -94,8 +110,8 @@ class SystemCleanerController:
             self.view.update_result_text("正在清理...\n")
             self.view.update_progress(0)
             
-            # 执行清理
-            results = self.model.clean_system()
+            # 执行清理，各清理目标的进度汇总后显示
+            results = self.model.clean_system(progress_callback=self.view.update_progress)
             
             # 更新结果
             formatted_results = self.model.get_formatted_clean_results()
@@ -103,4 +119,27 @@ class SystemCleanerController:
             self.view.update_progress(1)
             
         # 在新线程中运行清理任务
-        threading.Thread(target=clean_task, daemon=True).start() 
\ No newline at end of file
+        threading.Thread(target=clean_task, daemon=True).start()
+        
+    def analyze_origins(self):
+        """按站点统计浏览器数据占用"""
+        def analyze_task():
+            self.view.update_progress(0)
+            usage = self.model.analyze_origins()
+            self.view.update_origin_usage(usage)
+            self.view.update_progress(1)
+            
+        threading.Thread(target=analyze_task, daemon=True).start()
+        
+    def clean_origins(self, origins):
+        """清理选中站点的数据，完成后重新统计"""
+        def clean_task():
+            self.view.update_result_text("正在清理站点数据...\n")
+            self.view.update_progress(0)
+            
+            self.model.clean_origins(origins)
+            self.view.update_result_text(self.model.get_formatted_origin_clean_results())
+            self.view.update_origin_usage(self.model.analyze_origins())
+            self.view.update_progress(1)
+            
+        threading.Thread(target=clean_task, daemon=True).start()
\ No newline at end of file
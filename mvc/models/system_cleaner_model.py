@@ -1,8 +1,14 @@
 from modules.temp_cleaner import TempCleaner
 from modules.recycle_bin import RecycleBinCleaner
-from modules.browser_cache import BrowserCacheCleaner
+from modules.browser_cache import BrowserCacheCleaner, ORIGIN_TOP
+from modules.clean_policy import CleanPolicy
+from modules.clean_manifest import BUDGET_ORDER_ATIME, BUDGET_ORDER_MTIME
+from modules.clean_scheduler import CleanScheduler, CleanJob
+from modules.io_throttle import DEFAULT_MAX_UTILIZATION
+from functools import partial
 import os
 import time
+import threading
 
 class SystemCleanerModel:
     def __init__(self):
@@ -21,13 +27,23 @@ class SystemCleanerModel:
             "chrome": True,
             "edge": True,
             "firefox": False,
-            "opera": False
+            "opera": False,
+            "brave": False,
+            "vivaldi": False,
+            "chromium": False
         }
         
         # 扫描和清理结果
         self.scan_results = {}
         self.clean_results = {}
         
+        # 扫描生成的删除清单，清理时直接执行而不重新遍历目录
+        self.scan_manifests = {}
+        
+        # 最近一次按站点统计的结果和按站点清理的结果
+        self.origin_usage = {}
+        self.origin_clean_results = {}
+        
         # 安全路径列表 - 这些路径不会被清理
         self.safe_paths = [
             os.path.join(os.environ.get('SystemRoot', 'C:\\Windows'), 'System32'),
@@ -54,6 +70,19 @@ class SystemCleanerModel:
         # 是否启用安全模式
         self.safe_mode = True
         
+        # 保留预算 - 为None时按安全模式的规则清理，否则按最近使用时间淘汰到目标为止
+        self.retention_budget = None
+        
+        # 数据库维护的保留天数 - 为None时历史记录和Cookies文件整个删除
+        self.database_retention_days = None
+        
+        # 清理任务调度器 - 各清理目标并行执行，同一机械硬盘上的目标依次执行
+        self.clean_scheduler = CleanScheduler()
+        
+        # 后台模式 - 以低优先级扫描和清理，并限制磁盘利用率
+        self.background_mode = False
+        self.max_disk_utilization = DEFAULT_MAX_UTILIZATION
+        
     def toggle_option(self, option_key):
         """切换清理选项状态"""
         if option_key in self.clean_options:
@@ -73,19 +102,70 @@ class SystemCleanerModel:
             
     def toggle_safe_mode(self):
         """切换安全模式"""
+        self.scan_manifests = {}
         self.safe_mode = not self.safe_mode
         return self.safe_mode
         
+    def set_background_mode(self, enabled, max_utilization=None):
+        """开启或关闭后台模式，max_utilization为允许占用的磁盘利用率（0到1）"""
+        if max_utilization is not None:
+            if not 0 < max_utilization <= 1:
+                return False
+            self.max_disk_utilization = max_utilization
+        self.background_mode = enabled
+        self.temp_cleaner.set_background_mode(enabled, self.max_disk_utilization)
+        self.browser_cache_cleaner.set_background_mode(enabled, self.max_disk_utilization)
+        self.clean_scheduler.set_background(enabled)
+        return True
+        
     def set_max_file_age(self, days):
         """设置最大文件年龄"""
         if days > 0:
+            self.scan_manifests = {}
             self.max_file_age_days = days
             return True
         return False
         
+    def set_database_maintenance(self, days=None):
+        """开启数据库维护：只删除历史记录和Cookies中超过days天的记录并压缩数据库，为None时关闭"""
+        if days is not None and days <= 0:
+            return False
+        self.scan_manifests = {}
+        self.database_retention_days = days
+        self.browser_cache_cleaner.set_database_maintenance(days)
+        return True
+        
+    def set_retention_budget(self, free_bytes=None, max_bytes=None, order=BUDGET_ORDER_ATIME):
+        """设置保留预算：释放free_bytes字节，或把每类清理目标的占用降到max_bytes以下
+
+        两者都为None时关闭预算模式。
+        """
+        for value in (free_bytes, max_bytes):
+            if value is not None and value < 0:
+                return False
+        if order not in (BUDGET_ORDER_ATIME, BUDGET_ORDER_MTIME):
+            return False
+        self.scan_manifests = {}
+        if free_bytes is None and max_bytes is None:
+            self.retention_budget = None
+        else:
+            self.retention_budget = {
+                'free_bytes': free_bytes,
+                'max_bytes': max_bytes,
+                'order': order
+            }
+        self.temp_cleaner.set_retention_budget(free_bytes, max_bytes, order)
+        self.browser_cache_cleaner.set_retention_budget(free_bytes, max_bytes, order)
+        return True
+        
+    def get_retention_budget(self):
+        """获取当前的保留预算，未设置时返回None"""
+        return self.retention_budget
+        
     def add_safe_path(self, path):
         """添加安全路径"""
         if os.path.exists(path) and path not in self.safe_paths:
+            self.scan_manifests = {}
             self.safe_paths.append(path)
             return True
         return False
@@ -93,6 +173,7 @@ class SystemCleanerModel:
     def remove_safe_path(self, path):
         """移除安全路径"""
         if path in self.safe_paths:
+            self.scan_manifests = {}
             self.safe_paths.remove(path)
             return True
         return False
@@ -100,6 +181,7 @@ class SystemCleanerModel:
     def add_excluded_extension(self, extension):
         """添加排除的文件类型"""
         if extension.startswith('.') and extension not in self.excluded_extensions:
+            self.scan_manifests = {}
             self.excluded_extensions.append(extension)
             return True
         return False
@@ -107,10 +189,38 @@ class SystemCleanerModel:
     def remove_excluded_extension(self, extension):
         """移除排除的文件类型"""
         if extension in self.excluded_extensions:
+            self.scan_manifests = {}
             self.excluded_extensions.remove(extension)
             return True
         return False
         
+    def _configure_temp_cleaner(self):
+        """向临时文件清理器传递安全路径、排除的文件类型和最大文件年龄"""
+        if hasattr(self.temp_cleaner, 'set_safe_paths'):
+            self.temp_cleaner.set_safe_paths(self.safe_paths)
+        if hasattr(self.temp_cleaner, 'set_excluded_extensions'):
+            self.temp_cleaner.set_excluded_extensions(self.excluded_extensions)
+        if hasattr(self.temp_cleaner, 'set_max_file_age'):
+            self.temp_cleaner.set_max_file_age(self.max_file_age_days)
+            
+    def _build_policy(self):
+        """根据当前安全设置编译一次清理策略，供所有清理模块共享"""
+        return CleanPolicy(self.safe_paths, self.excluded_extensions, self.max_file_age_days)
+        
+    def _get_selected_temp_locations(self):
+        """获取选中的临时文件位置"""
+        temp_locations = []
+        if self.clean_options["windows_temp"]: temp_locations.append("windows_temp")
+        if self.clean_options["user_temp"]: temp_locations.append("user_temp")
+        if self.clean_options["prefetch"]: temp_locations.append("prefetch")
+        if self.clean_options["recent_docs"]: temp_locations.append("recent")
+        return temp_locations
+        
+    def _get_selected_browsers(self):
+        """获取选中的浏览器"""
+        return [browser for browser in ["chrome", "edge", "firefox", "opera", "brave", "vivaldi", "chromium"]
+                if self.clean_options[browser]]
+        
     def scan_system(self):
         """扫描系统"""
         results = {
@@ -118,87 +228,209 @@ class SystemCleanerModel:
             'recycle_bin': {},
             'browser_cache': {}
         }
+        self.scan_manifests = {}
+        policy = self._build_policy()
         
         # 扫描临时文件
-        if any(self.clean_options[key] for key in ["windows_temp", "user_temp", "prefetch", "recent_docs"]):
+        temp_locations = self._get_selected_temp_locations()
+        if temp_locations:
             # 传递安全路径和排除的文件类型
-            if hasattr(self.temp_cleaner, 'set_safe_paths'):
-                self.temp_cleaner.set_safe_paths(self.safe_paths)
-            if hasattr(self.temp_cleaner, 'set_excluded_extensions'):
-                self.temp_cleaner.set_excluded_extensions(self.excluded_extensions)
-            if hasattr(self.temp_cleaner, 'set_max_file_age'):
-                self.temp_cleaner.set_max_file_age(self.max_file_age_days)
-                
-            results['temp_files'] = self.temp_cleaner.scan_temp_files()
+            self._configure_temp_cleaner()
+            
+            manifest = self.temp_cleaner.build_manifest(temp_locations, self.safe_mode, policy=policy)
+            self.scan_manifests['temp_files'] = manifest
+            
+            # 报告按规则判定后删除能实际释放的空间
+            sizes = manifest.get_target_sizes()
+            results['temp_files'] = {key: sizes.get(key, 0) for key in temp_locations}
+            results['temp_files']['total'] = sum(results['temp_files'].values())
+            results['temp_files']['apparent_total'] = sum(manifest.get_target_sizes(allocated=False).values())
             
         # 扫描回收站
         if self.clean_options["recycle_bin"]:
             results['recycle_bin'] = self.recycle_bin_cleaner.get_recycle_bin_size()
             
         # 扫描浏览器缓存
-        browsers = []
-        if self.clean_options["chrome"]: browsers.append("chrome")
-        if self.clean_options["edge"]: browsers.append("edge")
-        if self.clean_options["firefox"]: browsers.append("firefox")
-        if self.clean_options["opera"]: browsers.append("opera")
-        
-        if browsers:
-            results['browser_cache'] = self.browser_cache_cleaner.scan_browser_caches(browsers)
+        browsers = self._get_selected_browsers()
+        if browsers and not self.safe_mode and not self.retention_budget:
+            # 非安全模式下整个缓存目录都会被删除，直接从缓存索引读取大小，
+            # 删除清单推迟到清理时生成
+            sizes = self.browser_cache_cleaner.scan_browser_caches(browsers)
+            results['browser_cache'] = {browser: sizes.get(browser, 0) for browser in browsers}
+            results['browser_cache']['total'] = sum(results['browser_cache'].values())
+            results['browser_cache']['apparent_total'] = results['browser_cache']['total']
+        elif browsers:
+            manifest = self.browser_cache_cleaner.build_manifest(browsers, self.safe_mode, policy=policy)
+            self.scan_manifests['browser_cache'] = manifest
+            
+            sizes = manifest.get_target_sizes()
+            results['browser_cache'] = {browser: sizes.get(browser, 0) for browser in browsers}
+            results['browser_cache']['total'] = sum(results['browser_cache'].values())
+            results['browser_cache']['apparent_total'] = sum(manifest.get_target_sizes(allocated=False).values())
             
         self.scan_results = results
         return results
         
-    def clean_system(self):
-        """清理系统"""
+    def _get_manifest(self, key, targets):
+        """获取覆盖所有目标的扫描清单，清单不存在或不完整时返回None"""
+        manifest = self.scan_manifests.get(key)
+        if manifest is None or manifest.safe_mode != self.safe_mode:
+            return None
+        if not all(target in manifest.targets for target in targets):
+            return None
+        return manifest
+        
+    def _clean_temp_location(self, key, manifest, policy, report):
+        """清理单个临时文件位置，没有扫描清单时现场生成"""
+        if manifest is None:
+            manifest = self.temp_cleaner.build_manifest([key], self.safe_mode, policy=policy)
+        return self.temp_cleaner.clean_from_manifest(manifest, [key], progress_callback=report)
+        
+    def _clean_recycle_bin(self, report):
+        """清空回收站"""
+        return self.recycle_bin_cleaner.empty_recycle_bin(
+            no_confirmation=True,
+            no_progress_ui=False,
+            no_sound=True
+        )
+        
+    def _clean_browser(self, browser, manifest, report):
+        """清理单个浏览器的缓存"""
+        # 任务开始时浏览器已经关闭
+        if manifest is None:
+            # 没有扫描清单时现场扫描删除
+            if self.safe_mode:
+                return self.browser_cache_cleaner.clean_browser_cache_safely(browser, kill_process=False)
+            return self.browser_cache_cleaner.clean_browser_cache(browser, kill_process=False)
+        return self.browser_cache_cleaner.clean_from_manifest(manifest, browser, kill_process=False,
+                                                              progress_callback=report)
+        
+    def clean_system(self, progress_callback=None):
+        """清理系统
+
+        每个临时文件位置、回收站和每个浏览器作为独立的任务在调度器中并行执行。
+        progress_callback接收按预计释放空间加权的总进度（0到1）。
+        """
         results = {
             'temp_files': {},
             'recycle_bin': {},
             'browser_cache': {}
         }
+        jobs = []
         
         # 清理临时文件
-        temp_locations = []
-        if self.clean_options["windows_temp"]: temp_locations.append("windows_temp")
-        if self.clean_options["user_temp"]: temp_locations.append("user_temp")
-        if self.clean_options["prefetch"]: temp_locations.append("prefetch")
-        if self.clean_options["recent_docs"]: temp_locations.append("recent")
-        
+        temp_locations = self._get_selected_temp_locations()
         if temp_locations:
             # 传递安全路径和排除的文件类型
-            if hasattr(self.temp_cleaner, 'set_safe_paths'):
-                self.temp_cleaner.set_safe_paths(self.safe_paths)
-            if hasattr(self.temp_cleaner, 'set_excluded_extensions'):
-                self.temp_cleaner.set_excluded_extensions(self.excluded_extensions)
-            if hasattr(self.temp_cleaner, 'set_max_file_age'):
-                self.temp_cleaner.set_max_file_age(self.max_file_age_days)
-                
-            # 如果启用安全模式，则使用安全清理方法
-            if self.safe_mode and hasattr(self.temp_cleaner, 'clean_temp_files_safely'):
-                results['temp_files'] = self.temp_cleaner.clean_temp_files_safely(temp_locations)
-            else:
-                results['temp_files'] = self.temp_cleaner.clean_temp_files(temp_locations)
+            self._configure_temp_cleaner()
             
-        # 清理回收站
+            # 优先执行扫描时生成的清单，没有扫描过则在任务中现场生成
+            manifest = self._get_manifest('temp_files', temp_locations)
+            policy = self._build_policy()
+            if manifest is None and self.retention_budget:
+                # 预算针对所有选中的位置，需要先整体扫描才能确定淘汰哪些文件
+                manifest = self.temp_cleaner.build_manifest(temp_locations, self.safe_mode, policy=policy)
+            sizes = manifest.get_target_sizes() if manifest is not None else {}
+            for key in temp_locations:
+                jobs.append(CleanJob(('temp_files', key), [self.temp_cleaner.temp_locations.get(key)],
+                                     partial(self._clean_temp_location, key, manifest, policy),
+                                     sizes.get(key, 0)))
+                
+        # 清理回收站 - 回收站分布在所有驱动器上，不绑定单个设备
         if self.clean_options["recycle_bin"]:
-            results['recycle_bin'] = self.recycle_bin_cleaner.empty_recycle_bin(
-                no_confirmation=True,
-                no_progress_ui=False,
-                no_sound=True
-            )
+            size = self.scan_results.get('recycle_bin', {}).get('size', 0)
+            jobs.append(CleanJob(('recycle_bin', None), [], self._clean_recycle_bin, size))
             
         # 清理浏览器缓存
-        for browser in ["chrome", "edge", "firefox", "opera"]:
-            if self.clean_options[browser]:
-                # 如果启用安全模式，则使用安全清理方法
-                if self.safe_mode and hasattr(self.browser_cache_cleaner, 'clean_browser_cache_safely'):
-                    result = self.browser_cache_cleaner.clean_browser_cache_safely(browser)
-                else:
-                    result = self.browser_cache_cleaner.clean_browser_cache(browser)
-                results['browser_cache'][browser] = result
+        browsers = self._get_selected_browsers()
+        manifest = self._get_manifest('browser_cache', browsers)
+        if manifest is None and browsers and self.retention_budget:
+            manifest = self.browser_cache_cleaner.build_manifest(browsers, self.safe_mode,
+                                                                 policy=self._build_policy())
+        if manifest is not None:
+            sizes = manifest.get_target_sizes()
+        else:
+            # 扫描时从缓存索引得到的大小作为任务权重
+            sizes = self.scan_results.get('browser_cache', {})
+        # 一次性请求所有选中的浏览器退出，每个浏览器的进程全部退出后它的清理任务立即开始
+        browser_ready = {browser: threading.Event() for browser in browsers}
+        if browsers:
+            threading.Thread(target=self.browser_cache_cleaner.close_browsers,
+                             args=(browsers, lambda browser: browser_ready[browser].set()),
+                             daemon=True).start()
+        for browser in browsers:
+            paths = list(self.browser_cache_cleaner.browser_paths.get(browser, {}).values())
+            jobs.append(CleanJob(('browser_cache', browser), paths,
+                                 partial(self._clean_browser, browser, manifest), sizes.get(browser, 0),
+                                 browser_ready[browser]))
+            
+        report = None
+        if progress_callback:
+            report = lambda overall, key, fraction: progress_callback(overall)
+        job_results = self.clean_scheduler.run(jobs, report)
+        
+        # 合并各任务的结果
+        for (group, key), result in job_results.items():
+            if group == 'temp_files':
+                temp_results = results['temp_files']
+                temp_results[key] = result.get(key, 0)
+                temp_results['total'] = temp_results.get('total', 0) + result.get('total', 0)
+                if 'skipped' in result:
+                    temp_results['skipped'] = temp_results.get('skipped', 0) + result['skipped']
+            elif group == 'recycle_bin':
+                results['recycle_bin'] = result
+            else:
+                results['browser_cache'][key] = result
                 
+        # 清单执行后已失效
+        self.scan_manifests = {}
         self.clean_results = results
         return results
         
+    def analyze_origins(self, top=ORIGIN_TOP):
+        """按站点统计选中浏览器的缓存和站点存储占用"""
+        self.origin_usage = self.browser_cache_cleaner.get_origin_usage(self._get_selected_browsers(), top)
+        return self.origin_usage
+        
+    def clean_origins(self, origins):
+        """清理指定站点的数据，只关闭实际存有这些站点数据的浏览器"""
+        origins = set(origins)
+        found = set()
+        for entry in self.origin_usage.get('origins', []):
+            if entry['origin'] in origins:
+                found.update(entry['browsers'])
+        browsers = [browser for browser in self._get_selected_browsers() if browser in found]
+        self.origin_clean_results = self.browser_cache_cleaner.clean_origins(origins, browsers,
+                                                                             safe_mode=self.safe_mode,
+                                                                             policy=self._build_policy())
+        return self.origin_clean_results
+        
+    def get_formatted_origin_clean_results(self):
+        """获取格式化的按站点清理结果"""
+        output = []
+        output.append("╔═══════════════════════════════════════════════╗")
+        output.append("║             站点数据清理结果                  ║")
+        output.append("╠═══════════════════════════════════════════════╣")
+        
+        total_cleaned = 0
+        for browser, result in self.origin_clean_results.items():
+            if result.get('success'):
+                size = result.get('cleaned_size', 0)
+                total_cleaned += size
+                output.append(f"║ ✓ 已清理 {browser.title()} 的站点数据: {self.browser_cache_cleaner.format_size(size)}")
+                if result.get('skipped_size'):
+                    skipped = self.browser_cache_cleaner.format_size(result['skipped_size'])
+                    output.append(f"║ ● 共享数据库中无法单独删除: {skipped}")
+            else:
+                error = result.get('error', '未知错误')
+                output.append(f"║ ✗ 清理 {browser.title()} 的站点数据失败: {error}")
+                
+        output.append("╠═══════════════════════════════════════════════╣")
+        output.append(f"║ 总计已释放空间: {self.browser_cache_cleaner.format_size(total_cleaned)}               ║")
+        output.append("╚═══════════════════════════════════════════════╝")
+        
+        return "\n".join(output)
+        
     def get_formatted_scan_results(self):
         """获取格式化的扫描结果"""
         if not self.scan_results:
@@ -206,6 +438,7 @@ class SystemCleanerModel:
             
         output = []
         total_size = 0
+        apparent_size = 0
         
         # 添加标题框架
         scan_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
@@ -218,6 +451,7 @@ class SystemCleanerModel:
         # 临时文件结果
         if 'temp_files' in self.scan_results and self.scan_results['temp_files']:
             temp_results = self.scan_results['temp_files']
+            apparent_size += temp_results.get('apparent_total', 0)
             output.append("║ 【临时文件】                                ║")
             
             if 'windows_temp' in temp_results:
@@ -247,6 +481,7 @@ class SystemCleanerModel:
             rb_results = self.scan_results['recycle_bin']
             size = rb_results.get('size', 0)
             total_size += size
+            apparent_size += size
             output.append("║ 【回收站】                                  ║")
             output.append(f"║ ✓ 回收站大小: {self.recycle_bin_cleaner.format_size(size)}")
             output.append(f"║ ● 包含文件数: {rb_results.get('items', 0)} 个项目")
@@ -255,10 +490,11 @@ class SystemCleanerModel:
         # 浏览器缓存结果
         if 'browser_cache' in self.scan_results and self.scan_results['browser_cache']:
             bc_results = self.scan_results['browser_cache']
+            apparent_size += bc_results.get('apparent_total', 0)
             output.append("║ 【浏览器缓存】                              ║")
             
             for browser, size in bc_results.items():
-                if browser != 'total':
+                if browser not in ('total', 'apparent_total'):
                     total_size += size
                     browser_name = browser.title()
                     if browser == "chrome":
@@ -276,6 +512,9 @@ class SystemCleanerModel:
                     
         # 总计
         output.append(f"║ 总计可清理空间: {self.temp_cleaner.format_size(total_size)}               ║")
+        if apparent_size and apparent_size != total_size:
+            # 压缩、稀疏文件和硬链接使文件大小与实际释放的空间不同
+            output.append(f"║ ● 文件大小合计: {self.temp_cleaner.format_size(apparent_size)}")
         
         # 安全模式提示
         if self.safe_mode:
@@ -365,6 +604,8 @@ class SystemCleanerModel:
                             browser_name = "Opera"
                         
                         output.append(f"║ ✓ 已清理 {browser_name} 缓存: {self.browser_cache_cleaner.format_size(size)}")
+                        if 'database_rows' in result:
+                            output.append(f"║ ● 已删除 {result['database_rows']} 条过期的历史记录和Cookies")
                     else:
                         error = result.get('error', '未知错误')
                         output.append(f"║ ✗ 清理 {browser.title()} 缓存失败: {error}")
@@ -34,12 +34,14 @@ class SystemCleanerPage(ctk.CTkFrame):
         self.tabview.add("清理选项")
         self.tabview.add("清理结果")
         self.tabview.add("安全设置")
+        self.tabview.add("站点占用")
         self.tabview.set("清理选项")
         
         # 配置选项卡
         self._setup_cleaner_options(self.tabview.tab("清理选项"))
         self._setup_cleaner_results(self.tabview.tab("清理结果"))
         self._setup_safety_settings(self.tabview.tab("安全设置"))
+        self._setup_origin_usage(self.tabview.tab("站点占用"))
         
         # 添加进度条和操作按钮
         self._setup_progress_and_actions()
@@ -135,6 +137,21 @@ class SystemCleanerPage(ctk.CTkFrame):
             browser_buttons_frame, "Opera", "opera", 1, 1
         )
         
+        # Brave按钮
+        self.clean_option_buttons["brave"] = self._create_clean_option_button(
+            browser_buttons_frame, "Brave", "brave", 2, 0
+        )
+        
+        # Vivaldi按钮
+        self.clean_option_buttons["vivaldi"] = self._create_clean_option_button(
+            browser_buttons_frame, "Vivaldi", "vivaldi", 2, 1
+        )
+        
+        # Chromium按钮
+        self.clean_option_buttons["chromium"] = self._create_clean_option_button(
+            browser_buttons_frame, "Chromium", "chromium", 3, 0
+        )
+        
         # 添加全选按钮
         buttons_frame = ctk.CTkFrame(options_canvas, fg_color="transparent")
         buttons_frame.pack(padx=10, pady=10, fill="x")
@@ -328,6 +345,66 @@ class SystemCleanerPage(ctk.CTkFrame):
                                       width=80)
         remove_ext_btn.pack(side="left", anchor="n")
         
+    def _setup_origin_usage(self, parent):
+        """设置站点占用界面"""
+        origin_frame = ctk.CTkFrame(parent, border_width=1, border_color=self.border_color)
+        origin_frame.pack(padx=10, pady=10, fill="both", expand=True)
+        
+        origin_label = ctk.CTkLabel(origin_frame, text="按站点统计的浏览器数据", 
+                                   font=ctk.CTkFont(size=16, weight="bold"),
+                                   text_color=self.header_color)
+        origin_label.pack(padx=10, pady=(10, 5), anchor="w")
+        
+        # 工具栏
+        toolbar = ctk.CTkFrame(origin_frame, fg_color="transparent")
+        toolbar.pack(padx=10, pady=5, fill="x")
+        
+        analyze_btn = ctk.CTkButton(toolbar, text="分析站点", 
+                                   command=self._on_analyze_origins,
+                                   fg_color=self.button_color, 
+                                   hover_color=self.button_hover_color,
+                                   width=100)
+        analyze_btn.pack(side="left", padx=5)
+        
+        clean_origin_btn = ctk.CTkButton(toolbar, text="清理所选站点", 
+                                        command=self._on_clean_origins,
+                                        fg_color=self.button_color, 
+                                        hover_color=self.button_hover_color,
+                                        width=120)
+        clean_origin_btn.pack(side="left", padx=5)
+        
+        self.origin_summary = ctk.CTkLabel(toolbar, text="")
+        self.origin_summary.pack(side="right", padx=5)
+        
+        # 站点列表，按占用从大到小排列
+        list_frame = ctk.CTkFrame(origin_frame, fg_color="transparent")
+        list_frame.pack(padx=10, pady=(5, 10), fill="both", expand=True)
+        
+        columns = ("origin", "total", "cache", "indexeddb", "cache_storage", "local_storage", "browsers")
+        self.origin_tree = ttk.Treeview(list_frame, columns=columns, show="headings")
+        
+        # 设置列标题
+        self.origin_tree.heading("origin", text="站点")
+        self.origin_tree.heading("total", text="总计")
+        self.origin_tree.heading("cache", text="缓存")
+        self.origin_tree.heading("indexeddb", text="IndexedDB")
+        self.origin_tree.heading("cache_storage", text="CacheStorage")
+        self.origin_tree.heading("local_storage", text="Local Storage")
+        self.origin_tree.heading("browsers", text="浏览器")
+        
+        # 设置列宽
+        self.origin_tree.column("origin", width=220)
+        for column in ("total", "cache", "indexeddb", "cache_storage", "local_storage"):
+            self.origin_tree.column(column, width=90, anchor="e")
+        self.origin_tree.column("browsers", width=120)
+        
+        # 添加滚动条
+        scrollbar = ttk.Scrollbar(list_frame, orient="vertical", command=self.origin_tree.yview)
+        self.origin_tree.configure(yscrollcommand=scrollbar.set)
+        
+        self.origin_tree.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+        
     def _setup_progress_and_actions(self):
         """设置进度条和操作按钮"""
         # 添加进度条框架
@@ -524,6 +601,40 @@ class SystemCleanerPage(ctk.CTkFrame):
             self.controller.clean_system()
             self.tabview.set("清理结果")
             
+    def _on_analyze_origins(self):
+        """按站点统计浏览器数据"""
+        if self.controller:
+            self.origin_summary.configure(text="正在分析...")
+            self.controller.analyze_origins()
+            
+    def _on_clean_origins(self):
+        """清理选中的站点"""
+        selected = self.origin_tree.selection()
+        if selected and self.controller:
+            self.controller.clean_origins(list(selected))
+            self.tabview.set("清理结果")
+            
+    def update_origin_usage(self, usage):
+        """更新站点占用列表，每行的iid为站点"""
+        for item in self.origin_tree.get_children():
+            self.origin_tree.delete(item)
+            
+        format_size = self.controller.format_size
+        for entry in usage.get('origins', []):
+            kinds = entry['kinds']
+            self.origin_tree.insert("", "end", iid=entry['origin'], values=(
+                entry['origin'],
+                format_size(entry['size']),
+                format_size(kinds.get('cache', 0)),
+                format_size(kinds.get('indexeddb', 0)),
+                format_size(kinds.get('cache_storage', 0)),
+                format_size(kinds.get('local_storage', 0)),
+                ", ".join(browser.title() for browser in entry['browsers'])
+            ))
+            
+        self.origin_summary.configure(
+            text=f"共 {usage.get('origin_count', 0)} 个站点，{format_size(usage.get('total', 0))}")
+        
     def update_progress(self, value):
         """更新进度条"""
         self.progress_bar.set(value)
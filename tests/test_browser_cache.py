@@ -0,0 +1,84 @@
+import os
+import pytest
+from modules.browser_cache import BrowserCacheCleaner
+from modules.clean_policy import CleanPolicy
+from modules.origin_usage import KIND_INDEXEDDB
+from modules.browser_profiles import CHROMIUM_FILES, CHROMIUM_DATABASES
+
+def make_file(path, size=100):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+
+@pytest.fixture
+def firefox(tmp_path, monkeypatch):
+    """只有一个Firefox配置文件的清理器，站点存储中有两个站点"""
+    monkeypatch.setenv('HOME', str(tmp_path / 'home'))
+    monkeypatch.setenv('LOCALAPPDATA', str(tmp_path / 'appdata'))
+    storage = tmp_path / 'profile' / 'storage' / 'default'
+    site = storage / 'https+++example.com'
+    make_file(str(site / '.metadata-v2'), 10)
+    make_file(str(site / 'idb' / '1234.sqlite'), 4096)
+    make_file(str(site / 'ls' / 'data.sqlite'), 2048)
+    make_file(str(site / 'ls' / 'usage'), 12)
+    make_file(str(storage / 'https+++other.org' / 'idb' / '5678.sqlite'), 4096)
+
+    cleaner = BrowserCacheCleaner()
+    cleaner.browser_paths = {'firefox': {}}
+    profile = {'name': 'default', 'directory': 'default', 'dirs': {}, 'files': {},
+               'storage': {'storage': str(storage)}, 'databases': {}}
+    monkeypatch.setattr(cleaner.profile_discoverer, 'get_profiles', lambda browser, refresh=False: [profile])
+    return cleaner, str(site), str(storage)
+
+def test_all_kinds_remove_whole_firefox_origin(firefox):
+    cleaner, site, storage = firefox
+    results = cleaner.clean_origins(['https://example.com'], ['firefox'], kill_process=False)
+
+    assert results['firefox']['success']
+    # 站点目录连同.metadata-v2整体删除，其他站点不受影响
+    assert not os.path.exists(site)
+    assert os.path.exists(os.path.join(storage, 'https+++other.org', 'idb', '5678.sqlite'))
+
+def test_selected_kind_keeps_origin_directory(firefox):
+    cleaner, site, _ = firefox
+    cleaner.clean_origins(['https://example.com'], ['firefox'], kill_process=False, kinds=[KIND_INDEXEDDB])
+
+    assert not os.path.exists(os.path.join(site, 'idb'))
+    assert os.path.exists(os.path.join(site, 'ls', 'data.sqlite'))
+    assert os.path.exists(os.path.join(site, '.metadata-v2'))
+
+def test_safe_mode_respects_shared_policy(firefox):
+    cleaner, site, _ = firefox
+    policy = CleanPolicy(safe_paths=[os.path.join(site, 'ls')], max_file_age_days=30)
+    cleaner.clean_origins(['https://example.com'], ['firefox'], kill_process=False, safe_mode=True,
+                          policy=policy)
+
+    # 安全路径保留，刚写入的文件不受年龄规则影响而被删除
+    assert os.path.exists(os.path.join(site, 'ls', 'data.sqlite'))
+    assert not os.path.exists(os.path.join(site, 'idb'))
+    assert not os.path.exists(os.path.join(site, '.metadata-v2'))
+
+def test_cookie_files_include_network_location_and_journals(tmp_path, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmp_path / 'home'))
+    monkeypatch.setenv('LOCALAPPDATA', str(tmp_path / 'appdata'))
+    cleaner = BrowserCacheCleaner()
+    profile = str(tmp_path / 'Default')
+    files = {kind: os.path.join(profile, relative) for kind, relative in CHROMIUM_FILES.items()}
+    for path in files.values():
+        make_file(path)
+    databases = {schema: [os.path.join(profile, relative) for relative in candidates]
+                 for schema, candidates in CHROMIUM_DATABASES.items()}
+    cleaner.browser_paths = {'chrome': files}
+    monkeypatch.setattr(cleaner.profile_discoverer, 'get_profiles', lambda browser, refresh=False: [
+        {'name': 'Default', 'directory': 'Default', 'dirs': {}, 'files': files, 'storage': {},
+         'databases': databases}])
+
+    # Chromium 96起的Network/Cookies和各数据库的回滚日志都会被清理
+    paths = {entry.path for entry in cleaner.build_manifest(['chrome']).entries}
+    assert os.path.join(profile, 'Network', 'Cookies') in paths
+    assert os.path.join(profile, 'Network', 'Cookies-journal') in paths
+    assert paths == set(files.values())
+
+    # 开启数据库维护后，数据库连同日志保留，只按记录维护
+    cleaner.database_retention_days = 30
+    assert cleaner.build_manifest(['chrome']).entries == []
@@ -0,0 +1,205 @@
+import os
+import time
+import pytest
+from modules.file_walker import FileWalker
+from modules.clean_policy import CleanPolicy
+from modules.clean_manifest import (CleanManifest, VERDICT_DELETE, VERDICT_SAFE_PATH, VERDICT_EXCLUDED,
+                                    VERDICT_TOO_NEW, VERDICT_WITHIN_BUDGET, BUDGET_ORDER_ATIME,
+                                    BUDGET_ORDER_MTIME)
+
+NOW = time.time()
+DAY = 86400
+
+def make_file(path, size, mtime=NOW - 30 * DAY, atime=None):
+    """写入size字节的文件并设置访问和修改时间"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    os.utime(path, (mtime if atime is None else atime, mtime))
+    return path
+
+def new_manifest():
+    # 单线程遍历，结果与遍历顺序无关
+    return CleanManifest(walker=FileWalker(max_workers=1))
+
+def verdicts_by_path(manifest, root):
+    return {os.path.relpath(entry.path, root): entry.verdict for entry in manifest.entries}
+
+@pytest.fixture
+def temp_tree(tmp_path):
+    """安全目录、排除类型、太新和可删除的文件各一"""
+    root = tmp_path / 'temp'
+    make_file(str(root / 'keep' / 'safe.txt'), 100)
+    make_file(str(root / 'app.log'), 200)
+    make_file(str(root / 'new.tmp'), 300, mtime=NOW)
+    make_file(str(root / 'old.tmp'), 400)
+    make_file(str(root / 'sub' / 'old2.tmp'), 500)
+    policy = CleanPolicy(safe_paths=[str(root / 'keep')], excluded_extensions=['.log'], max_file_age_days=7,
+                         now=NOW)
+    return str(root), policy
+
+def test_add_tree_verdicts(temp_tree):
+    root, policy = temp_tree
+    manifest = new_manifest()
+    manifest.add_tree(root, 'temp', policy)
+
+    assert verdicts_by_path(manifest, root) == {
+        'keep': VERDICT_SAFE_PATH,
+        'app.log': VERDICT_EXCLUDED,
+        'new.tmp': VERDICT_TOO_NEW,
+        'old.tmp': VERDICT_DELETE,
+        'sub': VERDICT_DELETE,
+        os.path.join('sub', 'old2.tmp'): VERDICT_DELETE
+    }
+    assert manifest.get_target_sizes(allocated=False) == {'temp': 900}
+    assert manifest.get_skipped_count() == 3
+
+def test_add_tree_include_root(temp_tree):
+    root, _ = temp_tree
+    manifest = new_manifest()
+    manifest.add_tree(root, 'temp', include_root=True)
+
+    verdicts = verdicts_by_path(manifest, root)
+    assert verdicts['.'] == VERDICT_DELETE
+    assert all(verdict == VERDICT_DELETE for verdict in verdicts.values())
+
+def test_execute_deletes_only_delete_verdicts(temp_tree):
+    root, policy = temp_tree
+    manifest = new_manifest()
+    manifest.add_tree(root, 'temp', policy)
+    planned = manifest.get_target_sizes()['temp']
+
+    stats = manifest.execute()['temp']
+
+    assert stats['deleted'] == 2
+    assert stats['freed_apparent'] == 900
+    assert stats['freed'] == planned
+    assert stats['skipped'] == 3
+    assert stats['failed'] == 0
+    assert sorted(os.listdir(root)) == ['app.log', 'keep', 'new.tmp']
+    assert os.path.exists(os.path.join(root, 'keep', 'safe.txt'))
+
+def test_execute_removes_nested_directories_bottom_up(tmp_path):
+    root = str(tmp_path / 'cache')
+    for depth in range(1, 4):
+        make_file(os.path.join(root, *['d'] * depth, 'f.bin'), 10)
+    manifest = new_manifest()
+    manifest.add_tree(root, 'cache')
+
+    stats = manifest.execute()['cache']
+
+    assert stats['deleted'] == 3
+    assert stats['errors'] == []
+    assert os.listdir(root) == []
+
+def test_execute_skips_files_changed_after_scan(temp_tree):
+    root, policy = temp_tree
+    manifest = new_manifest()
+    manifest.add_tree(root, 'temp', policy)
+    changed = make_file(os.path.join(root, 'old.tmp'), 4000)
+
+    stats = manifest.execute()['temp']
+
+    assert stats['changed'] == 1
+    assert stats['deleted'] == 1
+    assert os.path.exists(changed)
+
+def test_add_file_counts_hard_links_once(tmp_path):
+    path = make_file(str(tmp_path / 'a.bin'), 8192)
+    link = str(tmp_path / 'b.bin')
+    try:
+        os.link(path, link)
+    except OSError:
+        pytest.skip("文件系统不支持硬链接")
+    manifest = new_manifest()
+    manifest.add_file(path, 'temp')
+    manifest.add_file(link, 'temp')
+
+    # 只有最后一个链接被删除时才释放空间
+    first, last = manifest.entries
+    assert first.allocated == 0
+    assert last.allocated > 0
+    assert manifest.get_target_sizes(allocated=False) == {'temp': 16384}
+
+def test_kept_hard_link_frees_nothing(tmp_path):
+    root = tmp_path / 'links'
+    path = make_file(str(root / 'a.tmp'), 8192)
+    try:
+        os.link(path, str(root / 'b.log'))
+    except OSError:
+        pytest.skip("文件系统不支持硬链接")
+    manifest = new_manifest()
+    manifest.add_tree(str(root), 'temp', CleanPolicy(excluded_extensions=['.log'], now=NOW))
+
+    # 另一个链接被排除规则保留，删除a.tmp不释放空间，遍历顺序不影响结果
+    entries = {os.path.basename(entry.path): entry for entry in manifest.entries}
+    assert entries['a.tmp'].verdict == VERDICT_DELETE
+    assert entries['b.log'].verdict == VERDICT_EXCLUDED
+    assert entries['a.tmp'].allocated == 0
+    assert entries['b.log'].allocated == 0
+
+def budget_manifest(tmp_path, times):
+    """按times中的 (名称, atime, mtime) 创建同样大小的文件并加入清单，返回 (清单, {名称: 条目})"""
+    root = str(tmp_path / 'budget')
+    for name, atime, mtime in times:
+        make_file(os.path.join(root, name), 4096, mtime=mtime, atime=atime)
+    manifest = new_manifest()
+    manifest.add_tree(root, 'temp', CleanPolicy(excluded_extensions=['.keep'], now=NOW))
+    return manifest, {os.path.basename(entry.path): entry for entry in manifest.entries}
+
+def budget_verdicts(manifest):
+    return {os.path.basename(entry.path): entry.verdict for entry in manifest.entries}
+
+def test_budget_evicts_least_recently_used_first(tmp_path):
+    old = NOW - 100 * DAY
+    # 修改时间都很早，最近使用时间由访问时间决定：a最旧，d最新
+    manifest, entries = budget_manifest(tmp_path, [
+        ('a.tmp', NOW - 40 * DAY, old),
+        ('b.tmp', NOW - 30 * DAY, old),
+        ('c.tmp', NOW - 20 * DAY, old),
+        ('d.tmp', NOW - 10 * DAY, old)
+    ])
+
+    planned = manifest.apply_budget(free_bytes=entries['a.tmp'].allocated + 1, order=BUDGET_ORDER_ATIME)
+
+    assert planned == entries['a.tmp'].allocated + entries['b.tmp'].allocated
+    assert budget_verdicts(manifest) == {
+        'a.tmp': VERDICT_DELETE,
+        'b.tmp': VERDICT_DELETE,
+        'c.tmp': VERDICT_WITHIN_BUDGET,
+        'd.tmp': VERDICT_WITHIN_BUDGET
+    }
+
+def test_budget_mtime_order_ignores_atime(tmp_path):
+    # 访问时间与修改时间的先后相反
+    manifest, entries = budget_manifest(tmp_path, [
+        ('a.tmp', NOW - 1 * DAY, NOW - 40 * DAY),
+        ('b.tmp', NOW - 2 * DAY, NOW - 30 * DAY),
+        ('c.tmp', NOW - 3 * DAY, NOW - 20 * DAY)
+    ])
+
+    manifest.apply_budget(free_bytes=1, order=BUDGET_ORDER_MTIME)
+
+    assert budget_verdicts(manifest) == {
+        'a.tmp': VERDICT_DELETE,
+        'b.tmp': VERDICT_WITHIN_BUDGET,
+        'c.tmp': VERDICT_WITHIN_BUDGET
+    }
+
+def test_budget_max_bytes_counts_protected_files(tmp_path):
+    old = NOW - 100 * DAY
+    manifest, entries = budget_manifest(tmp_path, [
+        ('a.tmp', NOW - 30 * DAY, old),
+        ('b.tmp', NOW - 20 * DAY, old),
+        ('c.keep', NOW - 40 * DAY, old)
+    ])
+    usage = sum(entry.allocated for entry in entries.values())
+
+    # 受保护的文件计入占用但不被淘汰，需要淘汰最旧的可删除文件
+    manifest.apply_budget(max_bytes=usage - entries['a.tmp'].allocated)
+
+    assert budget_verdicts(manifest) == {
+        'a.tmp': VERDICT_DELETE,
+        'b.tmp': VERDICT_WITHIN_BUDGET,
+        'c.keep': VERDICT_EXCLUDED
+    }
@@ -0,0 +1,20 @@
+import os
+from modules.compact_tree import CompactTree, NO_NODE
+
+ROOT = os.path.abspath(os.sep + 'data')
+
+def test_find_accepts_names_starting_with_dots():
+    tree = CompactTree(ROOT)
+    cache = tree.add_node(0, '..cache', is_dir=True)
+    entry = tree.add_node(cache, '...', size=10)
+
+    assert tree.find(os.path.join(ROOT, '..cache')) == cache
+    assert tree.find(os.path.join(ROOT, '..cache', '...')) == entry
+    assert tree.find(ROOT) == 0
+
+def test_find_rejects_paths_outside_root():
+    tree = CompactTree(ROOT)
+    tree.add_node(0, 'a', is_dir=True)
+
+    assert tree.find(os.path.join(os.path.dirname(ROOT), 'other')) == NO_NODE
+    assert tree.find(os.path.join(ROOT, 'missing')) == NO_NODE
@@ -0,0 +1,151 @@
+import os
+import pytest
+from modules.file_walker import FileWalker
+from modules.delete_engine import (DeleteEngine, PathOps, PosixOps, WindowsOps, get_default_ops, DELETE_OK,
+                                   DELETE_CHANGED, DELETE_MISSING, DELETE_NOT_EMPTY, DELETE_FAILED)
+
+def make_file(path, size=10):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    return path
+
+def make_symlink(target, path, is_dir):
+    try:
+        os.symlink(target, path, target_is_directory=is_dir)
+    except (OSError, NotImplementedError):
+        pytest.skip("无法创建符号链接")
+
+def available_ops():
+    ops = [PathOps()]
+    default = get_default_ops()
+    if default.name in (PosixOps.name, WindowsOps.name):
+        ops.append(default)
+    return ops
+
+@pytest.fixture(params=available_ops(), ids=lambda ops: ops.name)
+def engine(request):
+    return DeleteEngine(FileWalker(max_workers=1), ops=request.param)
+
+@pytest.fixture
+def outside(tmp_path):
+    """删除范围之外、不应被触及的目录"""
+    path = tmp_path / 'outside'
+    make_file(str(path / 'precious.txt'), 123)
+    return path
+
+def test_delete_tree_removes_nested_entries(engine, tmp_path):
+    root = tmp_path / 'root'
+    make_file(str(root / 'top.txt'), 100)
+    make_file(str(root / 'a' / 'mid.txt'), 200)
+    make_file(str(root / 'a' / 'b' / 'deep.txt'), 300)
+    reported = []
+
+    stats = engine.delete_tree(str(root), on_entry=lambda path, is_dir, freed, error: reported.append(path))
+
+    assert os.listdir(root) == []
+    assert stats['deleted'] == 3
+    assert stats['dirs_removed'] == 2
+    assert stats['freed_apparent'] == 600
+    assert stats['errors'] == []
+    assert len(reported) == 5
+
+def test_delete_tree_without_keep_root(engine, tmp_path):
+    root = tmp_path / 'root'
+    make_file(str(root / 'a' / 'f.txt'))
+
+    stats = engine.delete_tree(str(root), keep_root=False)
+
+    assert not root.exists()
+    assert stats['dirs_removed'] == 2
+
+def test_delete_tree_does_not_follow_symlinks_outside(engine, tmp_path, outside):
+    root = tmp_path / 'root'
+    make_file(str(root / 'f.txt'))
+    make_symlink(str(outside), str(root / 'dir_link'), True)
+    make_symlink(str(outside / 'precious.txt'), str(root / 'file_link'), False)
+
+    stats = engine.delete_tree(str(root))
+
+    # 只删除链接本身，链接指向的内容保留
+    assert os.listdir(root) == []
+    assert stats['errors'] == []
+    assert (outside / 'precious.txt').read_bytes() == b'x' * 123
+
+def test_delete_batch_statuses(engine, tmp_path):
+    root = tmp_path / 'root'
+    path = make_file(str(root / 'same.txt'), 50)
+    st = os.stat(path)
+    make_file(str(root / 'changed.txt'), 50)
+    make_file(str(root / 'full' / 'f.txt'))
+    os.mkdir(root / 'empty')
+    items = [
+        ('same.txt', False, (st.st_size, st.st_mtime)),
+        ('changed.txt', False, (49, st.st_mtime)),
+        ('missing.txt', False, None),
+        ('full', True, None),
+        ('empty', True, None)
+    ]
+
+    statuses = {item[0]: status for item, status, _ in engine.delete_batch(str(root), items)}
+
+    assert statuses == {
+        'same.txt': DELETE_OK,
+        'changed.txt': DELETE_CHANGED,
+        'missing.txt': DELETE_MISSING,
+        'full': DELETE_NOT_EMPTY,
+        'empty': DELETE_OK
+    }
+    assert sorted(os.listdir(root)) == ['changed.txt', 'full']
+
+def test_delete_batch_missing_directory(engine, tmp_path):
+    results = list(engine.delete_batch(str(tmp_path / 'gone'), [('f.txt', False, None)]))
+
+    assert [status for _, status, _ in results] == [DELETE_MISSING]
+
+def test_delete_batch_refuses_directory_replaced_by_symlink(engine, tmp_path, outside):
+    root = tmp_path / 'root'
+    os.makedirs(root)
+    # 扫描时是目录，删除前被替换为指向范围之外的符号链接
+    make_symlink(str(outside), str(root / 'sub'), True)
+
+    results = list(engine.delete_batch(str(root), [('sub', True, None)]))
+
+    assert [status for _, status, _ in results] == [DELETE_FAILED]
+    assert os.path.islink(root / 'sub')
+    assert (outside / 'precious.txt').exists()
+
+def test_delete_batch_removes_directory_symlink_as_file(engine, tmp_path, outside):
+    root = tmp_path / 'root'
+    os.makedirs(root)
+    # 目录符号链接在清单中记为文件条目，只删除链接本身
+    make_symlink(str(outside), str(root / 'dir_link'), True)
+
+    results = list(engine.delete_batch(str(root), [('dir_link', False, None)]))
+
+    assert [status for _, status, _ in results] == [DELETE_OK]
+    assert not os.path.lexists(root / 'dir_link')
+    assert (outside / 'precious.txt').exists()
+
+def test_delete_batch_refuses_directory_as_file(engine, tmp_path):
+    root = tmp_path / 'root'
+    os.makedirs(root / 'sub')
+
+    results = list(engine.delete_batch(str(root), [('sub', False, None)]))
+
+    assert [status for _, status, _ in results] == [DELETE_FAILED]
+    assert (root / 'sub').is_dir()
+
+def test_posix_open_child_does_not_follow_symlink(tmp_path, outside):
+    if get_default_ops().name != PosixOps.name:
+        pytest.skip("当前平台不支持相对目录描述符删除")
+    root = tmp_path / 'root'
+    os.makedirs(root)
+    make_symlink(str(outside), str(root / 'sub'), True)
+    ops = PosixOps()
+    handle = ops.open_root(str(root))
+    try:
+        with pytest.raises(OSError):
+            ops.open_child(handle, str(root), 'sub')
+    finally:
+        ops.close(handle)
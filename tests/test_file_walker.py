@@ -0,0 +1,45 @@
+import os
+import pytest
+from modules.file_walker import FileWalker
+
+def make_file(path, size):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    return path
+
+@pytest.fixture
+def linked_tree(tmp_path):
+    """两个目录中各有同一文件的一个硬链接，另有一个普通文件"""
+    root = tmp_path / 'root'
+    first = make_file(str(root / 'a' / 'data.bin'), 5000)
+    os.makedirs(str(root / 'b'))
+    try:
+        os.link(first, str(root / 'b' / 'data.bin'))
+    except (OSError, NotImplementedError):
+        pytest.skip('文件系统不支持硬链接')
+    make_file(str(root / 'b' / 'other.bin'), 700)
+    return str(root)
+
+@pytest.mark.parametrize('max_workers', [1, 4])
+def test_hard_links_counted_once(linked_tree, max_workers):
+    totals = FileWalker(max_workers=max_workers).scan(linked_tree)
+    assert totals['files'] == 3
+    assert totals['size'] == 5700
+
+def test_link_stat_fills_missing_link_count(linked_tree):
+    # 模拟Windows上DirEntry.stat()返回的st_ino和st_nlink均为0的结果
+    path = os.path.join(linked_tree, 'a', 'data.bin')
+    real = os.stat(path, follow_symlinks=False)
+    fields = list(real)
+    fields[1] = 0
+    fields[3] = 0
+    cached = os.stat_result(fields)
+    st = FileWalker(max_workers=1).get_link_stat(path, cached)
+    assert st.st_nlink == 2
+    assert (st.st_dev, st.st_ino) == (real.st_dev, real.st_ino)
+
+def test_link_stat_keeps_unknown_when_restat_fails(tmp_path):
+    cached = os.stat_result([0o100644, 0, 0, 0, 0, 0, 10, 0, 0, 0])
+    st = FileWalker(max_workers=1).get_link_stat(str(tmp_path / 'missing'), cached)
+    assert st is cached
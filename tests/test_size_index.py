@@ -0,0 +1,119 @@
+import os
+import pytest
+from modules.file_walker import FileWalker
+from modules.size_index import SizeIndex
+from modules.disk_analyzer import DiskAnalyzer
+
+class RecordingWalker(FileWalker):
+    """记录实际枚举的目录，cancel_after不为空时在枚举该数量的目录后取消遍历"""
+
+    def __init__(self, cancel_after=None):
+        super().__init__(max_workers=1)
+        self.scanned = []
+        self.cancel_after = cancel_after
+
+    def scan_directory(self, directory, collect_files=False, emit=None):
+        result = super().scan_directory(directory, collect_files, emit)
+        self.scanned.append(directory)
+        if self.cancel_after is not None and len(self.scanned) >= self.cancel_after:
+            self.cancel()
+        return result
+
+def make_file(path, size):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+
+@pytest.fixture
+def analyzer(tmp_path, monkeypatch):
+    # 快照库等默认位置也放到临时目录下
+    monkeypatch.setenv('LOCALAPPDATA', str(tmp_path / 'appdata'))
+    analyzer = DiskAnalyzer()
+    analyzer.size_index = SizeIndex(str(tmp_path / 'index.db'))
+    return analyzer
+
+@pytest.fixture
+def tree_root(tmp_path):
+    root = tmp_path / 'root'
+    for directory in ('a', os.path.join('a', 'deep'), 'b', 'c'):
+        for i in range(3):
+            make_file(str(root / directory / f'f{i}.bin'), 100 * (i + 1))
+    return str(root)
+
+def build(analyzer, root, walker, resume=False):
+    tree, _ = analyzer._build_directory_tree(root, use_index=True, resume=resume, walker=walker)
+    return tree
+
+def bump_mtime(path):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+def test_unchanged_tree_is_not_rescanned(analyzer, tree_root):
+    first = RecordingWalker()
+    tree = build(analyzer, tree_root, first)
+    assert len(first.scanned) == 5
+    total = tree.size[0]
+
+    second = RecordingWalker()
+    tree = build(analyzer, tree_root, second)
+    assert second.scanned == []
+    assert tree.size[0] == total == 4 * 600
+
+def test_touched_directory_is_rescanned_alone(analyzer, tree_root):
+    build(analyzer, tree_root, RecordingWalker())
+
+    changed = os.path.join(tree_root, 'a', 'deep')
+    make_file(os.path.join(changed, 'new.bin'), 1000)
+    bump_mtime(changed)
+    walker = RecordingWalker()
+    tree = build(analyzer, tree_root, walker)
+
+    assert walker.scanned == [changed]
+    # 祖先目录复用索引，但总大小随子目录更新
+    assert tree.size[0] == 4 * 600 + 1000
+    assert tree.size[tree.find(os.path.join(tree_root, 'a'))] == 2 * 600 + 1000
+
+    # 写回索引后再次分析不需要任何枚举
+    again = RecordingWalker()
+    assert build(analyzer, tree_root, again).size[0] == 4 * 600 + 1000
+    assert again.scanned == []
+
+def test_replaced_directory_with_same_mtime_is_rescanned(analyzer, tree_root, tmp_path):
+    build(analyzer, tree_root, RecordingWalker())
+
+    old = os.path.join(tree_root, 'c')
+    st = os.stat(old)
+    # 旧目录移到树外保留，新目录不会复用它的inode
+    os.rename(old, str(tmp_path / 'old_c'))
+    make_file(os.path.join(old, 'other.bin'), 50)
+    os.utime(old, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert os.stat(old).st_ino != st.st_ino
+
+    walker = RecordingWalker()
+    tree = build(analyzer, tree_root, walker)
+
+    # 根目录的mtime因重命名而变化，也会重新枚举
+    assert set(walker.scanned) == {tree_root, old}
+    assert tree.size[tree.find(old)] == 50
+    assert tree.size[0] == 3 * 600 + 50
+
+@pytest.mark.parametrize('cancel_after', [1, 2, 4])
+def test_resumed_checkpoint_matches_full_scan(analyzer, tree_root, cancel_after):
+    expected = analyzer._build_directory_tree(tree_root, walker=RecordingWalker())[0]
+
+    interrupted = RecordingWalker(cancel_after=cancel_after)
+    analyzer._build_directory_tree(tree_root, walker=interrupted)
+    info = analyzer.size_index.get_checkpoint_info(tree_root)
+    assert info is not None and info['pending_dirs'] > 0
+
+    resumed_walker = RecordingWalker()
+    resumed = analyzer._build_directory_tree(tree_root, resume=True, walker=resumed_walker)[0]
+
+    # 检查点中的目录不再枚举
+    assert not set(resumed_walker.scanned) & set(interrupted.scanned)
+    assert analyzer.size_index.get_checkpoint_info(tree_root) is None
+    assert (resumed.size[0], resumed.allocated[0]) == (expected.size[0], expected.allocated[0])
+    for directory in ('a', os.path.join('a', 'deep'), 'b', 'c'):
+        path = os.path.join(tree_root, directory)
+        assert resumed.size[resumed.find(path)] == expected.size[expected.find(path)]
+    assert len(resumed) == len(expected)
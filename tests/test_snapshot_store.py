@@ -0,0 +1,87 @@
+import os
+import pytest
+from modules.snapshot_store import SnapshotStore
+
+MB = 1024 * 1024
+
+def tree_rows(sizes):
+    """由 {相对路径: 直接文件大小} 生成快照目录行，祖先目录自动补全并累计子树大小"""
+    own = {}
+    for path, size in sizes.items():
+        own[path] = own.get(path, 0) + size
+        while path:
+            path = path.rpartition(os.sep)[0]
+            own.setdefault(path, 0)
+    totals = {path: 0 for path in own}
+    for path, size in own.items():
+        totals[path] += size
+        while path:
+            path = path.rpartition(os.sep)[0]
+            totals[path] += size
+    return [(path, totals[path], totals[path], own[path], 1) for path in sorted(own)]
+
+def join(*parts):
+    return os.path.join(*parts)
+
+@pytest.fixture
+def store(tmp_path):
+    return SnapshotStore(str(tmp_path / 'snapshots.db'))
+
+def diff_trees(store, old, new):
+    old_id = store.save('/data', tree_rows(old), [])
+    new_id = store.save('/data', tree_rows(new), [])
+    return store.diff(old_id, new_id, min_relative_size=MB)
+
+def keys(items):
+    return [item['key'] for item in items]
+
+def test_single_hotspot_reported_only_at_hotspot(store):
+    base = {join('a', 'b', 'c'): 10 * MB, join('a', 'x'): 5 * MB, 'other': 5 * MB,
+            'a b': 1 * MB}
+    grown = dict(base)
+    grown[join('a', 'b', 'c')] += 100 * MB
+
+    diff = diff_trees(store, base, grown)
+
+    # 根目录、a和a/b的增长都来自a/b/c，只报告a/b/c本身
+    assert keys(diff['subtrees']['grown']) == [join('a', 'b', 'c')]
+    assert keys(diff['subtrees']['grown_relative']) == [join('a', 'b', 'c')]
+    assert keys(diff['directories']['grown']) == [join('a', 'b', 'c')]
+
+def test_spread_growth_reported_at_common_parent(store):
+    packages = ['pkg%d' % i for i in range(10)]
+    base = {join('app', 'node_modules', name): 1 * MB for name in packages}
+    base['app'] = 2 * MB
+    base['app-old'] = 2 * MB
+    grown = {path: size + (3 * MB if 'node_modules' in path else 0) for path, size in base.items()}
+
+    diff = diff_trees(store, base, grown)
+
+    # 每个包只增长3MB，node_modules整体增长30MB，没有单个子目录占大部分
+    top = diff['subtrees']['grown'][0]
+    assert top['key'] == join('app', 'node_modules')
+    assert top['delta'] == 30 * MB
+    assert top['own_delta'] == 0
+    assert 'app' not in keys(diff['subtrees']['grown'])
+    assert '' not in keys(diff['subtrees']['grown'])
+    relative = keys(diff['subtrees']['grown_relative'])
+    assert join('app', 'node_modules') in relative
+    assert 'app' not in relative and '' not in relative
+    # 直接文件排名中只有各个包，node_modules本身没有直接文件变化
+    assert join('app', 'node_modules') not in keys(diff['directories']['grown'])
+
+def test_shrunk_subtree_reported_at_hotspot(store):
+    base = {join('cache', 'big'): 50 * MB, join('cache', 'small'): 1 * MB, 'docs': 3 * MB}
+    shrunk = dict(base)
+    shrunk[join('cache', 'big')] = 0
+
+    diff = diff_trees(store, base, shrunk)
+
+    assert keys(diff['subtrees']['shrunk']) == [join('cache', 'big')]
+    assert diff['subtrees']['shrunk'][0]['delta'] == -50 * MB
+
+def test_diff_rejects_different_roots(store):
+    old_id = store.save('/data', tree_rows({'a': 1}), [])
+    new_id = store.save('/other', tree_rows({'a': 2}), [])
+    with pytest.raises(ValueError):
+        store.diff(old_id, new_id)
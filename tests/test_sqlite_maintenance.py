@@ -0,0 +1,110 @@
+import os
+import sqlite3
+import pytest
+from modules import sqlite_maintenance
+from modules.sqlite_maintenance import SQLiteMaintainer, COPY_SUFFIX, get_cutoff, TIME_WEBKIT
+
+@pytest.fixture(autouse=True)
+def short_lock_timeout(monkeypatch):
+    monkeypatch.setattr(sqlite_maintenance, 'LOCK_TIMEOUT', 0.05)
+
+@pytest.fixture
+def cookies(tmp_path):
+    """Chromium格式的Cookies数据库：100条60天前访问的记录和10条新记录"""
+    path = str(tmp_path / 'Cookies')
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE cookies (host_key TEXT, value TEXT, last_access_utc INTEGER)')
+    old = get_cutoff(60, TIME_WEBKIT)
+    new = get_cutoff(0, TIME_WEBKIT)
+    connection.executemany('INSERT INTO cookies VALUES (?, ?, ?)',
+                           [('old.example', 'x' * 500, old)] * 100 + [('new.example', 'y', new)] * 10)
+    connection.commit()
+    connection.close()
+    return path
+
+def count_rows(path):
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute('SELECT COUNT(*) FROM cookies').fetchone()[0]
+    finally:
+        connection.close()
+
+def hold_write_lock(path):
+    """模拟运行中的浏览器：持有写锁但允许读取"""
+    connection = sqlite3.connect(path, isolation_level=None)
+    connection.execute('BEGIN IMMEDIATE')
+    return connection
+
+def test_maintain_prunes_unlocked_database(cookies):
+    result = SQLiteMaintainer(batch_rows=30).maintain(cookies, 'chromium_cookies', 30)
+
+    assert result['success'] and not result['copied']
+    assert result['deleted_rows'] == 100
+    assert count_rows(cookies) == 10
+
+def test_locked_database_keeps_copy_until_installed(cookies):
+    maintainer = SQLiteMaintainer()
+    browser = hold_write_lock(cookies)
+    try:
+        result = maintainer.maintain(cookies, 'chromium_cookies', 30)
+        # 浏览器仍打开着原文件，原文件保持不变
+        assert result['success'] and result['copied']
+        assert result['pending_rows'] == 100
+        assert result['deleted_rows'] == 0
+        assert maintainer.has_copy(cookies)
+    finally:
+        browser.rollback()
+        browser.close()
+    assert count_rows(cookies) == 110
+
+    # 浏览器关闭后替换原文件
+    assert maintainer.install_copy(cookies) > 0
+    assert count_rows(cookies) == 10
+    assert not os.path.exists(cookies + COPY_SUFFIX)
+
+def test_copy_discarded_when_original_changed(cookies):
+    maintainer = SQLiteMaintainer()
+    browser = hold_write_lock(cookies)
+    try:
+        assert maintainer.maintain(cookies, 'chromium_cookies', 30)['copied']
+        browser.execute("INSERT INTO cookies VALUES ('late.example', 'z', 0)")
+        browser.execute('COMMIT')
+    finally:
+        browser.close()
+    # 保证修改时间的变化可以被检测到
+    st = os.stat(cookies)
+    os.utime(cookies, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000))
+
+    assert maintainer.install_copy(cookies) == 0
+    assert count_rows(cookies) == 111
+    assert not maintainer.has_copy(cookies)
+
+def test_lock_taken_during_prune_falls_back_to_copy(cookies):
+    class LockedMidway(SQLiteMaintainer):
+        def _vacuum(self, connection):
+            if not connection.execute('PRAGMA database_list').fetchone()[2].endswith(COPY_SUFFIX):
+                raise sqlite3.OperationalError('database is locked')
+            super()._vacuum(connection)
+
+    maintainer = LockedMidway()
+    result = maintainer.maintain(cookies, 'chromium_cookies', 30)
+
+    assert result['success'] and result['copied']
+    # 锁定前已提交的批次保留在原文件中
+    assert result['deleted_rows'] == 100
+    assert count_rows(cookies) == 10
+    assert maintainer.has_copy(cookies)
+
+def test_direct_maintenance_discards_stale_copy(cookies):
+    maintainer = SQLiteMaintainer()
+    browser = hold_write_lock(cookies)
+    try:
+        maintainer.maintain(cookies, 'chromium_cookies', 30)
+    finally:
+        browser.rollback()
+        browser.close()
+
+    result = maintainer.maintain(cookies, 'chromium_cookies', 30)
+
+    assert not result['copied']
+    assert not maintainer.has_copy(cookies)